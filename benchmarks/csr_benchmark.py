@@ -0,0 +1,49 @@
+"""Benchmark for the cnets graph construction and MDE speed on graphs with hubs.
+
+Each graph is a ring of N nodes plus a few hubs connected to a fraction
+of all the other nodes, so that the degree distribution is very uneven.
+
+usage:
+    python benchmarks/csr_benchmark.py [N] [MDE steps]
+"""
+import sys
+import time
+import numpy as np
+
+import cnets
+
+
+def hub_graph(N, hubs, hub_fraction, seed=42):
+    """Returns the (E, 3) links array of a ring with `hubs` high-degree nodes."""
+    rng = np.random.default_rng(seed)
+    ring = np.column_stack((np.arange(N), (np.arange(N) + 1) % N, np.ones(N)))
+    links = [ring]
+    for hub in range(hubs):
+        childs = rng.choice(np.arange(hubs, N), size=int(hub_fraction * N), replace=False)
+        links.append(np.column_stack((np.full(len(childs), hub), childs, np.ones(len(childs)))))
+    return np.vstack(links)
+
+
+def main(N=20000, steps=20):
+    rows = []
+    for hubs, hub_fraction in [(0, 0.0), (5, 0.2), (20, 0.5), (50, 0.9)]:
+        links = hub_graph(N, hubs, hub_fraction)
+        values = np.zeros(N, dtype=np.float32)
+
+        start = time.perf_counter()
+        cnets.init_network(links, values, 2)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cnets.MDE(0.1, 0.0, steps)
+        mde_rate = steps / (time.perf_counter() - start)
+        rows.append((hubs, int(hub_fraction * N), len(links), build_time, mde_rate))
+
+    print()
+    print(f"{'hubs':>5} {'hub degree':>11} {'links':>8} {'build [s]':>10} {'MDE steps/s':>12}")
+    for row in rows:
+        print(f"{row[0]:>5} {row[1]:>11} {row[2]:>8} {row[3]:>10.4f} {row[4]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,46 @@
+"""Benchmark for the scaling of the multithreaded MDE.
+
+Runs a few MDE steps on a random sparse graph with N nodes
+for an increasing number of threads.
+
+usage:
+    python benchmarks/threads_benchmark.py [N] [MDE steps]
+"""
+import sys
+import time
+import numpy as np
+
+import cnets
+
+
+def random_graph(N, degree=10, seed=42):
+    """Returns the (E, 3) links array of a random graph with average degree `degree`."""
+    rng = np.random.default_rng(seed)
+    i = np.repeat(np.arange(N), degree // 2)
+    j = rng.integers(0, N, size=len(i))
+    keep = i != j
+    return np.column_stack((i[keep], j[keep], rng.uniform(0.5, 1.5, size=keep.sum())))
+
+
+def main(N=100000, steps=10):
+    links = random_graph(N)
+    graph = cnets.Graph(links, np.zeros(N, dtype=np.float32), 2)
+    graph.negative_sampling_fraction = 10.0 / N
+
+    rows = []
+    num_threads = 1
+    while num_threads <= cnets.get_max_threads():
+        graph.num_threads = num_threads
+        start = time.perf_counter()
+        graph.mde(0.1, 0.001, steps)
+        rows.append((num_threads, steps / (time.perf_counter() - start)))
+        num_threads *= 2
+
+    print()
+    print(f"{'threads':>8} {'steps/s':>10} {'speedup':>8}")
+    for num_threads, rate in rows:
+        print(f"{num_threads:>8} {rate:>10.2f} {rate / rows[0][1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,213 @@
+/*
+Barnes-Hut approximation of the all-pairs repulsion.
+
+The tree is rebuilt from the positions at each MDE step.
+Far cells (size/distance < theta) act as a single point placed
+in their barycenter, so the repulsion on a node costs O(log N).
+*/
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "cutils.h"
+#include "cbarneshut.h"
+
+static int new_cell(BHTree * tree, const float * center, float half_size)
+{
+    /* Appends an empty leaf, returns its index or -1 if memory is over */
+    if (tree -> N_cells == tree -> capacity)
+    {
+        size_t capacity = (tree -> capacity == 0) ? 1024 : 2*(tree -> capacity);
+        BHCell * cells = (BHCell *) realloc(tree -> cells, sizeof(BHCell)*capacity);
+        if (cells == NULL) return -1;
+        tree -> cells = cells;
+        tree -> capacity = capacity;
+    }
+    BHCell * cell = &(tree -> cells[tree -> N_cells]);
+    memcpy(cell -> center, center, sizeof(float)*(tree -> dim));
+    memset(cell -> mass_center, 0, sizeof(cell -> mass_center));
+    cell -> half_size = half_size;
+    cell -> mass = 0;
+    cell -> point = -1;
+    for (int q = 0; q < 8; q++) cell -> children[q] = -1;
+    return (int) (tree -> N_cells++);
+}
+
+static int new_child(BHTree * tree, int parent, int quadrant)
+{
+    float center[3];
+    float half_size = tree -> cells[parent].half_size/2;
+    for (unsigned int d = 0; d < tree -> dim; d++)
+    {
+        center[d] = tree -> cells[parent].center[d] + ((quadrant >> d) & 1 ? half_size : -half_size);
+    }
+    int child = new_cell(tree, center, half_size);
+    if (child >= 0) tree -> cells[parent].children[quadrant] = child;
+    return child;
+}
+
+static int quadrant_of(const BHCell * cell, const float * position, unsigned int dim)
+{
+    int quadrant = 0;
+    for (unsigned int d = 0; d < dim; d++)
+    {
+        if (position[d] >= cell -> center[d]) quadrant |= (1 << d);
+    }
+    return quadrant;
+}
+
+static void add_mass(BHCell * cell, const float * position, unsigned int dim)
+{
+    for (unsigned int d = 0; d < dim; d++)
+    {
+        cell -> mass_center[d] = (cell -> mass_center[d]*(cell -> mass) + position[d])/(cell -> mass + 1);
+    }
+    cell -> mass++;
+}
+
+static bool is_leaf(const BHCell * cell)
+{
+    for (int q = 0; q < 8; q++)
+    {
+        if (cell -> children[q] != -1) return false;
+    }
+    return true;
+}
+
+static int insert(BHTree * tree, const float * positions, unsigned int point)
+{
+    unsigned int dim = tree -> dim;
+    const float * position = positions + (size_t) point*dim;
+    int c = 0, q, child;
+    for (int depth = 0; ; depth++)
+    {
+        BHCell * cell = &(tree -> cells[c]);
+        if (cell -> mass == 0)
+        {
+            cell -> point = (int) point;
+            add_mass(cell, position, dim);
+            return 0;
+        }
+        if (is_leaf(cell))
+        {
+            // Coincident points (or almost) pile up in the same leaf
+            if (depth >= BH_MAX_DEPTH)
+            {
+                add_mass(cell, position, dim);
+                return 0;
+            }
+            // Pushes the old point one level down
+            int old = cell -> point;
+            cell -> point = -1;
+            child = new_child(tree, c, quadrant_of(cell, positions + (size_t) old*dim, dim));
+            if (child < 0) return -1;
+            tree -> cells[child].point = old;
+            add_mass(&(tree -> cells[child]), positions + (size_t) old*dim, dim);
+            cell = &(tree -> cells[c]);
+        }
+        add_mass(cell, position, dim);
+        q = quadrant_of(cell, position, dim);
+        if (cell -> children[q] == -1)
+        {
+            child = new_child(tree, c, q);
+            if (child < 0) return -1;
+            tree -> cells[child].point = (int) point;
+            add_mass(&(tree -> cells[child]), position, dim);
+            return 0;
+        }
+        c = cell -> children[q];
+    }
+}
+
+int bhtree_build(BHTree * tree, const float * positions, unsigned int N, unsigned int dim)
+{
+    /* Builds the tree of N points in R^dim (dim must be 2 or 3).
+    The memory of the previous build is reused. Returns -1 if memory is over.
+    */
+    float low[3], high[3], center[3], half_size = 0;
+    tree -> dim = dim;
+    tree -> N_cells = 0;
+
+    for (unsigned int d = 0; d < dim; d++)
+    {
+        low[d] = high[d] = positions[d];
+    }
+    for (unsigned int n = 1; n < N; n++)
+    {
+        for (unsigned int d = 0; d < dim; d++)
+        {
+            if (positions[(size_t) n*dim + d] < low[d]) low[d] = positions[(size_t) n*dim + d];
+            if (positions[(size_t) n*dim + d] > high[d]) high[d] = positions[(size_t) n*dim + d];
+        }
+    }
+    for (unsigned int d = 0; d < dim; d++)
+    {
+        center[d] = (low[d] + high[d])/2;
+        if ((high[d] - low[d])/2 > half_size) half_size = (high[d] - low[d])/2;
+    }
+    // Small margin so that points on the border fall inside
+    half_size = half_size*1.0001f + 1e-6f;
+
+    if (new_cell(tree, center, half_size) < 0) return -1;
+    for (unsigned int n = 0; n < N; n++)
+    {
+        if (insert(tree, positions, n) < 0) return -1;
+    }
+    return 0;
+}
+
+void bhtree_force(const BHTree * tree, const float * positions, unsigned int node, float theta, float * force)
+{
+    /* Computes sum_j (x_node - x_j)/|x_node - x_j|^2 over all the points j != node */
+    unsigned int dim = tree -> dim;
+    const float * position = positions + (size_t) node*dim;
+    int stack[8*BH_MAX_DEPTH + 8];
+    int top = 0;
+    float delta[3], dist2, size;
+
+    for (unsigned int d = 0; d < dim; d++) force[d] = 0;
+    stack[top++] = 0;
+    while (top > 0)
+    {
+        const BHCell * cell = &(tree -> cells[stack[--top]]);
+        if (cell -> mass == 0) continue;
+
+        dist2 = 0;
+        for (unsigned int d = 0; d < dim; d++)
+        {
+            delta[d] = position[d] - cell -> mass_center[d];
+            dist2 += delta[d]*delta[d];
+        }
+        size = 2*(cell -> half_size);
+
+        if (is_leaf(cell) || size*size < theta*theta*dist2)
+        {
+            // The node itself (and points on top of it) give no force
+            if (dist2 == 0) continue;
+            unsigned int mass = cell -> mass;
+            if (cell -> point == (int) node) mass--;
+            for (unsigned int d = 0; d < dim; d++)
+            {
+                force[d] += mass*delta[d]/dist2;
+            }
+        }
+        else
+        {
+            for (int q = 0; q < (1 << dim); q++)
+            {
+                if (cell -> children[q] != -1) stack[top++] = cell -> children[q];
+            }
+        }
+    }
+}
+
+void bhtree_free(BHTree * tree)
+{
+    free(tree -> cells);
+    tree -> cells = NULL;
+    tree -> N_cells = 0;
+    tree -> capacity = 0;
+}
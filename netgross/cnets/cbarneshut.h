@@ -0,0 +1,25 @@
+// Barnes-Hut trees (quadtrees in 2D, octrees in 3D) for the repulsion in MDE
+
+#define BH_MAX_DEPTH 32
+
+typedef struct bhcell
+{
+    float center[3];        // Geometric center of the cell
+    float half_size;
+    float mass_center[3];   // Barycenter of the points inside the cell
+    unsigned int mass;      // Number of points inside the cell
+    int point;              // The point of a leaf cell, -1 for internal cells
+    int children[8];        // -1 where there is no child
+} BHCell;
+
+typedef struct bhtree
+{
+    BHCell * cells;
+    size_t N_cells;
+    size_t capacity;
+    unsigned int dim;
+} BHTree;
+
+int bhtree_build(BHTree * tree, const float * positions, unsigned int N, unsigned int dim);
+void bhtree_force(const BHTree * tree, const float * positions, unsigned int node, float theta, float * force);
+void bhtree_free(BHTree * tree);
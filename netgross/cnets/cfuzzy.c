@@ -0,0 +1,119 @@
+/*
+Variable metric neighbourhood graphs (see McInnes, Healy - UMAP, 2018).
+
+Each point gets its own unit of distance from its kNN: the distance rho
+to its closest neighbour is subtracted, and sigma is chosen by bisection
+so that the k memberships
+
+    w = exp(-(d - rho)/sigma)
+
+sum up to log2(k + 1). Dense and sparse regions then have the same number
+of strong links, and every point is linked to its closest neighbour with
+w = 1, so no point is isolated. The directed memberships are merged with
+the fuzzy union w_ij + w_ji - w_ij*w_ji.
+*/
+#include <stdlib.h>
+#include <math.h>
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "cutils.h"
+#include "cfuzzy.h"
+
+#define SIGMA_ITERATIONS 64
+#define SIGMA_TOLERANCE 1e-5
+#define MIN_SIGMA_SCALE 1e-3    // Sigma is at least this fraction of the mean neighbour distance
+
+static void local_scale(const float * distances, unsigned int k, unsigned int local_connectivity,
+                        float * rho, float * sigma)
+{
+    /* Finds rho and sigma of a point given its neighbours distances (sorted) */
+    double target = log2(k + 1.), mean = 0.;
+    unsigned int nonzero = 0;
+    *rho = 0.;
+    for (unsigned int s = 0; s < k; s++)
+    {
+        mean += distances[s];
+        // Coincident points do not count as neighbours for the local connectivity
+        if (distances[s] > 0. && ++nonzero == local_connectivity) *rho = distances[s];
+    }
+    mean /= k;
+    if (nonzero > 0 && nonzero < local_connectivity) *rho = distances[k - 1];
+
+    double lo = 0., hi = INFINITY, mid = 1.;
+    for (int iteration = 0; iteration < SIGMA_ITERATIONS; iteration++)
+    {
+        double sum = 0.;
+        for (unsigned int s = 0; s < k; s++)
+        {
+            double excess = distances[s] - *rho;
+            sum += (excess > 0.) ? exp(-excess/mid) : 1.;
+        }
+        if (fabs(sum - target) < SIGMA_TOLERANCE) break;
+        if (sum > target)
+        {
+            hi = mid;
+            mid = (lo + hi)/2;
+        }
+        else
+        {
+            lo = mid;
+            mid = isinf(hi) ? 2*mid : (lo + hi)/2;
+        }
+    }
+    *sigma = (float) mid;
+    if (*sigma < MIN_SIGMA_SCALE*mean) *sigma = (float) (MIN_SIGMA_SCALE*mean);
+}
+
+static int compare_edges(const void * a, const void * b)
+{
+    const FuzzyEdge * ea = (const FuzzyEdge *) a, * eb = (const FuzzyEdge *) b;
+    if (ea -> i != eb -> i) return (ea -> i > eb -> i) - (ea -> i < eb -> i);
+    return (ea -> j > eb -> j) - (ea -> j < eb -> j);
+}
+
+size_t fuzzy_graph(const unsigned int * neighbours, const float * distances, unsigned int N, unsigned int k,
+                   unsigned int local_connectivity, int num_threads, FuzzyEdge * edges)
+{
+    /* Builds the fuzzy union of the kNN graph (neighbours/distances are N*k, rows sorted by distance).
+
+    edges must have room for N*k elements. On return the first elements are the
+    undirected edges with i < j, sorted, and their number is returned.
+    */
+    #pragma omp parallel for schedule(static) num_threads(num_threads)
+    for (long p = 0; p < (long) N; p++)
+    {
+        float rho, sigma;
+        const float * row = distances + (size_t) p*k;
+        local_scale(row, k, local_connectivity, &rho, &sigma);
+        for (unsigned int s = 0; s < k; s++)
+        {
+            unsigned int q = neighbours[(size_t) p*k + s];
+            float excess = row[s] - rho;
+            FuzzyEdge * edge = &(edges[(size_t) p*k + s]);
+            edge -> i = ((unsigned int) p < q) ? (unsigned int) p : q;
+            edge -> j = ((unsigned int) p < q) ? q : (unsigned int) p;
+            edge -> d = row[s];
+            edge -> w = (excess > 0.) ? expf(-excess/sigma) : 1.;
+        }
+    }
+
+    // The two directions of a link are next to each other once sorted
+    size_t N_edges = (size_t) N*k, unique = 0;
+    qsort(edges, N_edges, sizeof(FuzzyEdge), compare_edges);
+    for (size_t e = 0; e < N_edges; e++)
+    {
+        if (unique > 0 && edges[unique - 1].i == edges[e].i && edges[unique - 1].j == edges[e].j)
+        {
+            // Same as a + b - a*b, but a full membership stays exactly 1
+            float a = edges[unique - 1].w, b = edges[e].w;
+            edges[unique - 1].w = 1 - (1 - a)*(1 - b);
+        }
+        else
+        {
+            edges[unique++] = edges[e];
+        }
+    }
+    return unique;
+}
@@ -0,0 +1,12 @@
+// Fuzzy neighbourhood graphs with a local metric for each point (as in UMAP)
+
+typedef struct fuzzyedge
+{
+    unsigned int i;         // i < j
+    unsigned int j;
+    float d;
+    float w;                // Membership strength in (0, 1]
+} FuzzyEdge;
+
+size_t fuzzy_graph(const unsigned int * neighbours, const float * distances, unsigned int N, unsigned int k,
+                   unsigned int local_connectivity, int num_threads, FuzzyEdge * edges);
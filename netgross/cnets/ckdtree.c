@@ -0,0 +1,287 @@
+/*
+KD-tree for exact k-nearest-neighbours queries in low dimension.
+
+Each node splits its points in two halves at the median of the
+coordinate with the largest spread, so the tree is balanced and
+building it costs O(N log N). A query keeps the k best candidates
+in a bounded max-heap and skips the subtrees that are farther
+than the current k-th distance.
+*/
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "cutils.h"
+#include "ckdtree.h"
+
+#define COORD(tree, p, d) ((tree) -> points[(size_t)(p)*(tree) -> D + (d)])
+
+static int new_node(KDTree * tree, unsigned int start, unsigned int end)
+{
+    /* Appends a leaf, returns its index or -1 if memory is over */
+    if (tree -> N_nodes == tree -> capacity)
+    {
+        size_t capacity = (tree -> capacity == 0) ? 256 : 2*(tree -> capacity);
+        KDNode * nodes = (KDNode *) realloc(tree -> nodes, sizeof(KDNode)*capacity);
+        if (nodes == NULL) return -1;
+        tree -> nodes = nodes;
+        tree -> capacity = capacity;
+    }
+    KDNode * node = &(tree -> nodes[tree -> N_nodes]);
+    node -> start = start;
+    node -> end = end;
+    node -> split_dim = -1;
+    node -> split = 0.;
+    node -> left = -1;
+    node -> right = -1;
+    return (int) (tree -> N_nodes++);
+}
+
+static void swap_index(unsigned int * index, unsigned int a, unsigned int b)
+{
+    unsigned int tmp = index[a];
+    index[a] = index[b];
+    index[b] = tmp;
+}
+
+static void select_nth(KDTree * tree, unsigned int start, unsigned int end, unsigned int nth, int dim)
+{
+    /* Partially sorts index[start:end] along dim so that index[nth] is in place,
+    smaller coordinates on its left and larger ones on its right.
+
+    Quickselect with Hoare partitioning, which stays fast with repeated coordinates.
+    */
+    unsigned int * index = tree -> index;
+    long lo = start, hi = (long) end - 1, i, j;
+    while (hi > lo)
+    {
+        // Median of three as pivot
+        long mid = lo + (hi - lo)/2;
+        float a = COORD(tree, index[lo], dim), b = COORD(tree, index[mid], dim), c = COORD(tree, index[hi], dim);
+        float pivot = (a < b) ? ((b < c) ? b : ((a < c) ? c : a)) : ((a < c) ? a : ((b < c) ? c : b));
+
+        i = lo;
+        j = hi;
+        while (i <= j)
+        {
+            while (COORD(tree, index[i], dim) < pivot) i++;
+            while (COORD(tree, index[j], dim) > pivot) j--;
+            if (i <= j) swap_index(index, i++, j--);
+        }
+        // Now index[lo:j+1] <= pivot <= index[i:hi+1]
+        if ((long) nth <= j) hi = j;
+        else if ((long) nth >= i) lo = i;
+        else return;
+    }
+}
+
+static int build_node(KDTree * tree, unsigned int start, unsigned int end, int depth)
+{
+    int node = new_node(tree, start, end);
+    if (node < 0) return -1;
+    if (end - start <= KD_LEAF_SIZE || depth > 64) return node;
+
+    // Splits along the coordinate with the largest spread
+    int split_dim = 0;
+    float largest_spread = -1.;
+    for (unsigned int d = 0; d < tree -> D; d++)
+    {
+        float min = COORD(tree, tree -> index[start], d), max = min;
+        for (unsigned int p = start + 1; p < end; p++)
+        {
+            float x = COORD(tree, tree -> index[p], d);
+            if (x < min) min = x;
+            if (x > max) max = x;
+        }
+        if (max - min > largest_spread)
+        {
+            largest_spread = max - min;
+            split_dim = (int) d;
+        }
+    }
+    if (largest_spread == 0.) return node;  // All points coincide
+
+    unsigned int median = start + (end - start)/2;
+    select_nth(tree, start, end, median, split_dim);
+
+    // Pointers to nodes are invalidated by realloc, so they are re-taken each time
+    tree -> nodes[node].split_dim = split_dim;
+    tree -> nodes[node].split = COORD(tree, tree -> index[median], split_dim);
+    int left = build_node(tree, start, median, depth + 1);
+    if (left < 0) return -1;
+    int right = build_node(tree, median, end, depth + 1);
+    if (right < 0) return -1;
+    tree -> nodes[node].left = left;
+    tree -> nodes[node].right = right;
+    return node;
+}
+
+int kdtree_build(KDTree * tree, const float * points, unsigned int N, unsigned int D)
+{
+    /* Builds the tree of the N points in R^D (row-major), returns -1 if memory is over */
+    tree -> points = points;
+    tree -> N = N;
+    tree -> D = D;
+    tree -> nodes = NULL;
+    tree -> N_nodes = 0;
+    tree -> capacity = 0;
+    tree -> index = (unsigned int *) malloc(sizeof(unsigned int)*(N > 0 ? N : 1));
+    if (tree -> index == NULL) return -1;
+    for (unsigned int p = 0; p < N; p++) tree -> index[p] = p;
+    if (N == 0) return 0;
+    if (build_node(tree, 0, N, 0) < 0)
+    {
+        kdtree_free(tree);
+        return -1;
+    }
+    return 0;
+}
+
+// Bounded max-heap of the current best candidates ------------------------------------------
+
+typedef struct candidates
+{
+    unsigned int * index;
+    float * dist2;
+    unsigned int size;
+    unsigned int k;
+} Candidates;
+
+static void sift_down(Candidates * c, unsigned int root, unsigned int size)
+{
+    while (1)
+    {
+        unsigned int largest = root, left = 2*root + 1, right = 2*root + 2;
+        if (left < size && c -> dist2[left] > c -> dist2[largest]) largest = left;
+        if (right < size && c -> dist2[right] > c -> dist2[largest]) largest = right;
+        if (largest == root) return;
+        float d = c -> dist2[root]; c -> dist2[root] = c -> dist2[largest]; c -> dist2[largest] = d;
+        unsigned int i = c -> index[root]; c -> index[root] = c -> index[largest]; c -> index[largest] = i;
+        root = largest;
+    }
+}
+
+static void offer(Candidates * c, unsigned int point, float dist2)
+{
+    if (c -> size < c -> k)
+    {
+        // Sifts up the new element
+        unsigned int child = c -> size++;
+        while (child > 0)
+        {
+            unsigned int parent = (child - 1)/2;
+            if (c -> dist2[parent] >= dist2) break;
+            c -> dist2[child] = c -> dist2[parent];
+            c -> index[child] = c -> index[parent];
+            child = parent;
+        }
+        c -> dist2[child] = dist2;
+        c -> index[child] = point;
+    }
+    else if (dist2 < c -> dist2[0])
+    {
+        c -> dist2[0] = dist2;
+        c -> index[0] = point;
+        sift_down(c, 0, c -> size);
+    }
+}
+
+static void search(const KDTree * tree, int node_index, const float * query, long exclude, Candidates * c)
+{
+    const KDNode * node = &(tree -> nodes[node_index]);
+    if (node -> split_dim < 0)
+    {
+        for (unsigned int p = node -> start; p < node -> end; p++)
+        {
+            unsigned int point = tree -> index[p];
+            if ((long) point == exclude) continue;
+            float dist2 = 0., diff;
+            for (unsigned int d = 0; d < tree -> D; d++)
+            {
+                diff = query[d] - COORD(tree, point, d);
+                dist2 += diff*diff;
+            }
+            offer(c, point, dist2);
+        }
+        return;
+    }
+    float diff = query[node -> split_dim] - node -> split;
+    int near = (diff < 0) ? node -> left : node -> right;
+    int far = (diff < 0) ? node -> right : node -> left;
+    search(tree, near, query, exclude, c);
+    if (c -> size < c -> k || diff*diff < c -> dist2[0]) search(tree, far, query, exclude, c);
+}
+
+void kdtree_knn(const KDTree * tree, const float * query, unsigned int k, long exclude,
+                unsigned int * neighbours, float * distances)
+{
+    /* Writes the k nearest points to query in neighbours/distances sorted by distance.
+
+    The point of index exclude (if >= 0) is skipped, so that a point of the tree
+    is not the neighbour of itself. The buffers are also used as workspace.
+    */
+    Candidates c = {neighbours, distances, 0, k};
+    if (tree -> N_nodes > 0) search(tree, 0, query, exclude, &c);
+
+    // Heapsort: the largest is moved at the end each time
+    for (unsigned int size = c.size; size > 1; size--)
+    {
+        float d = distances[0]; distances[0] = distances[size - 1]; distances[size - 1] = d;
+        unsigned int i = neighbours[0]; neighbours[0] = neighbours[size - 1]; neighbours[size - 1] = i;
+        sift_down(&c, 0, size - 1);
+    }
+    for (unsigned int n = 0; n < c.size; n++) distances[n] = sqrtf(distances[n]);
+}
+
+static int search_radius(const KDTree * tree, int node_index, const float * query, float radius2,
+                         unsigned int source, LinkBuffer * links)
+{
+    const KDNode * node = &(tree -> nodes[node_index]);
+    if (node -> split_dim < 0)
+    {
+        for (unsigned int p = node -> start; p < node -> end; p++)
+        {
+            unsigned int point = tree -> index[p];
+            if (point == source) continue;
+            float dist2 = 0., diff;
+            for (unsigned int d = 0; d < tree -> D; d++)
+            {
+                diff = query[d] - COORD(tree, point, d);
+                dist2 += diff*diff;
+            }
+            if (dist2 <= radius2 && LinkBuffer_push(links, source, point, sqrtf(dist2)) < 0) return -1;
+        }
+        return 0;
+    }
+    float diff = query[node -> split_dim] - node -> split;
+    if (diff <= 0 || diff*diff <= radius2)
+    {
+        if (search_radius(tree, node -> left, query, radius2, source, links) < 0) return -1;
+    }
+    if (diff >= 0 || diff*diff <= radius2)
+    {
+        if (search_radius(tree, node -> right, query, radius2, source, links) < 0) return -1;
+    }
+    return 0;
+}
+
+int kdtree_radius(const KDTree * tree, const float * query, float radius, unsigned int source, LinkBuffer * links)
+{
+    /* Appends to links (source, j, d) for every point j != source within radius from query.
+    Returns -1 if memory is over. */
+    if (tree -> N_nodes == 0) return 0;
+    return search_radius(tree, 0, query, radius*radius, source, links);
+}
+
+void kdtree_free(KDTree * tree)
+{
+    free(tree -> index);
+    free(tree -> nodes);
+    tree -> index = NULL;
+    tree -> nodes = NULL;
+    tree -> N_nodes = 0;
+    tree -> capacity = 0;
+}
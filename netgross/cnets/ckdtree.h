@@ -0,0 +1,30 @@
+// KD-trees for the neighbours graph builders
+
+#define KD_LEAF_SIZE 16
+
+typedef struct kdnode
+{
+    unsigned int start;     // Points of the node are index[start:end]
+    unsigned int end;
+    int split_dim;          // -1 for leaves
+    float split;
+    int left;
+    int right;
+} KDNode;
+
+typedef struct kdtree
+{
+    const float * points;   // Not owned, must outlive the tree
+    unsigned int N;
+    unsigned int D;
+    unsigned int * index;   // Permutation of the points
+    KDNode * nodes;
+    size_t N_nodes;
+    size_t capacity;
+} KDTree;
+
+int kdtree_build(KDTree * tree, const float * points, unsigned int N, unsigned int D);
+void kdtree_knn(const KDTree * tree, const float * query, unsigned int k, long exclude,
+                unsigned int * neighbours, float * distances);
+int kdtree_radius(const KDTree * tree, const float * query, float radius, unsigned int source, LinkBuffer * links);
+void kdtree_free(KDTree * tree);
@@ -9,14 +9,28 @@ Network must be given in normalized mode:
 #include <stdlib.h>
 #include <math.h>
 #include <time.h>
+#include <string.h>
+#include <stdbool.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <structmember.h>
+
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+#define PY_ARRAY_UNIQUE_SYMBOL cnets_ARRAY_API
+#include <numpy/arrayobject.h>
 
 #include "cutils.h"
 #include "cnets.h"
-
-#define PROGRESSS_BAR_LENGTH 60
+#include "ckdtree.h"
+#include "cnndescent.h"
+#include "cradius.h"
+#include "cfuzzy.h"
 
 typedef struct sparserow
 {
@@ -25,661 +39,3420 @@ typedef struct sparserow
     float d;
 } SparseRow;
 
-typedef struct node
+int RAND_INIT = 0;
+float NEGATIVE_SAMPLING_FRACTION = 0.1;
+int NUM_THREADS = 1;
+
+// Default sampling of the distortion estimates of MDE (see Graph.get_stats)
+#define STATS_ESTIMATE_EVERY 10
+#define STATS_ESTIMATE_SAMPLE 1000
+
+// Above this dimension the KD-tree is slower than NN-descent
+#define KNN_EXACT_MAX_DIM 16
+
+// The graph used by the module-level functions (init_network, MDE, ...)
+static Graph * default_graph = NULL;
+
+bool is_valid_link(unsigned int i, unsigned int j, float distance){
+    if (distance <= 0)
+    {
+        warnprint("link(%d,%d) skipped - Distance must be a positive number (%lf)\n", i, j, distance);
+        return false;
+    }
+    if (i == j)
+    {
+        warnprint("autolink not allowed: skipped\n");
+        return false;
+    }
+    return true;
+}
+
+int to_Net(Graph * g, EdgeBuffer * links, float * values, unsigned int N_elements){
+    /* Builds the CSR adjacency with two passes over the links:
+    the first counts the childs of each node, the second fills the rows.
+    Returns -1 with a MemoryError set if memory is over (the arrays allocated
+    so far are left in g, to be freed with it).
+    */
+    unsigned int i, j;
+    float d;
+
+    g -> values = (float *) malloc(sizeof(float)*N_elements);
+    g -> offsets = (size_t *) calloc(N_elements + 1, sizeof(size_t));
+    bool * valid = (bool *) malloc(sizeof(bool)*(links -> N_links + 1));
+    if (g -> values == NULL || g -> offsets == NULL || valid == NULL)
+    {
+        free(valid);
+        PyErr_Format(PyExc_MemoryError, "cannot allocate memory for %u nodes", N_elements);
+        return -1;
+    }
+    memcpy(g -> values, values, sizeof(float)*N_elements);
+
+    // Counting pass
+    for (unsigned long k = 0; k < links -> N_links; k++)
+    {
+        i = edge_i(links, k);
+        j = edge_j(links, k);
+        valid[k] = is_valid_link(i, j, edge_d(links, k));
+        if (valid[k])
+        {
+            g -> offsets[i + 1]++;
+            g -> offsets[j + 1]++;
+        }
+    }
+    for (unsigned int n = 0; n < N_elements; n++)
+    {
+        g -> offsets[n + 1] += g -> offsets[n];
+    }
+
+    // Filling pass
+    g -> childs = (unsigned int *) malloc(sizeof(unsigned int)*(g -> offsets[N_elements] + 1));
+    g -> distances = (float *) malloc(sizeof(float)*(g -> offsets[N_elements] + 1));
+    size_t * fill = (size_t *) malloc(sizeof(size_t)*(N_elements + 1));
+    if (g -> childs == NULL || g -> distances == NULL || fill == NULL)
+    {
+        free(fill);
+        free(valid);
+        PyErr_Format(PyExc_MemoryError, "cannot allocate memory for %lu links", links -> N_links);
+        return -1;
+    }
+    memcpy(fill, g -> offsets, sizeof(size_t)*N_elements);
+    for (unsigned long k = 0; k < links -> N_links; k++)
+    {
+        if (!valid[k]) continue;
+        i = edge_i(links, k);
+        j = edge_j(links, k);
+        d = edge_d(links, k);
+        g -> childs[fill[i]] = j;
+        g -> distances[fill[i]++] = d;
+        g -> childs[fill[j]] = i;
+        g -> distances[fill[j]++] = d;
+    }
+    free(fill);
+    free(valid);
+
+    // Rows are sorted by child so that childs can be found by bisection
+    sort_rows(g -> offsets, g -> childs, g -> distances, N_elements);
+
+    g -> N_nodes = N_elements;
+    g -> N_links = links -> N_links;
+    return 0;
+}
+
+size_t child_slot_by_child_name(Graph * g, unsigned int node_number, unsigned int child_name)
 {
-    unsigned int n;   // Node label
-    float value;       // Value of a general scalar quantity
-    unsigned int childs_number;
-    unsigned int * childs;
-    float * distances;
-    float * position; // Position in the embedding
-} Node;
+    /* Returns the position of the child in the adjacency arrays, (size_t)-1 if not found.
+
+    Rows are sorted, so this is a bisection over the childs of the node.
+    */
+    size_t low = g -> offsets[node_number], high = g -> offsets[node_number + 1], mid;
+    while (low < high)
+    {
+        mid = low + (high - low)/2;
+        if (g -> childs[mid] < child_name) low = mid + 1;
+        else high = mid;
+    }
+    if (low < g -> offsets[node_number + 1] && g -> childs[low] == child_name)
+    {
+        return low;
+    }
+    return (size_t) -1;
+}
+
+int random_init(Graph * g, int seed){
+    /* Returns -1 with a MemoryError set if the positions can't be allocated */
+    g -> rng_state = rng_seed((seed == 0) ? (uint64_t) time(0) : (uint64_t) seed, 0);
+
+    // Positions are stored in a single block owned by a numpy array
+    // so that they can be handed to python without copying
+    npy_intp dims[2] = {g -> N_nodes, g -> embedding_dimension};
+    g -> positions_array = PyArray_SimpleNew(2, dims, NPY_FLOAT32);
+    if (g -> positions_array == NULL) return -1;
+    g -> positions = (float *) PyArray_DATA((PyArrayObject *) g -> positions_array);
+    for (size_t k = 0; k < (size_t) g -> N_nodes*g -> embedding_dimension; k++)
+    {
+        g -> positions[k] = rng_uniform(&(g -> rng_state));
+    }
+    return 0;
+}
 
-// Link structure is useless at the moment,
-// may bind it to Linkin python later
-typedef struct link
+static long random_not_child(Graph * g, unsigned int node, rng_t * rng_state)
 {
-    Node * node1;
-    Node * node2;
-    float distance;
-} Link;
+    // Picks a guy at random until it is not a child, -1 if none is found
+    unsigned int not_child;
+    unsigned int draws = 0;
+    do{
+        not_child = rng_below(rng_state, g -> N_nodes);
+        draws++;
+        if (draws > g -> N_nodes){
+            return -1;
+        }
+    }while(node == not_child || child_slot_by_child_name(g, node, not_child) != (size_t)-1);
+    return not_child;
+}
+
+void move_away_from_random_not_child(Graph * g, unsigned int node, float eps, rng_t * rng_state){
+    long not_child = random_not_child(g, node, rng_state);
+    if (not_child < 0) return;
+    float dist = euclidean_distance(POSITION(g, node), POSITION(g, not_child), g -> embedding_dimension);
+    if (dist == 0.) return;     // Overlapping nodes have no direction to move along
+    for (unsigned int d = 0; d < g -> embedding_dimension; d++)
+    {
+        POSITION(g, node)[d] += eps/(dist*dist)*(POSITION(g, node)[d] - POSITION(g, not_child)[d]);
+    }
+    return;
+}
 
-typedef struct graph
+unsigned int negatives_number(Graph * g)
 {
-    unsigned int N_nodes;
-    unsigned long N_links;
-    Node * nodes;
-    unsigned int embedding_dimension;
-} Graph;
+    /* Number of negative samples drawn for each node in each step */
+    if (g -> negatives_per_node != 0) return g -> negatives_per_node;
+    return (unsigned int)(g -> negative_sampling_fraction*g -> N_nodes);
+}
 
-int RAND_INIT = 0;
-float NEGATIVE_SAMPLING_FRACTION = 0.1;
-Graph G;
+void attract_node(Graph * g, unsigned int current_node, float eps){
+    /* Pulls/pushes a node towards its childs, so that links get their target length.
 
-// Link nodes in the Graph
-void link_nodes(Node * node, unsigned int child_index, float distance){
-    if (distance <= 0)
+    Only the position of current_node is written, so nodes can be updated
+    in parallel without locks (Hogwild style).
+    */
+    float actual_distance = 0., factor;
+    unsigned int child_index, childs_number;
+    childs_number = CHILDS_NUMBER(g, current_node);
+    for (size_t slot = g -> offsets[current_node]; slot < g -> offsets[current_node + 1]; slot++)
     {
-        warnprint("link(%d,%d) skipped - Distance must be a positive number (%lf)\n",node->n, child_index, distance);
-        return;
+        child_index = g -> childs[slot];
+        actual_distance = euclidean_distance(POSITION(g, current_node), POSITION(g, child_index), g -> embedding_dimension);
+        if (actual_distance == 0.0){
+            warnprint("MDE - skipped update (zero distance in embedding): link(%d, %d) = %lf\n",current_node, child_index, g -> distances[slot]);
+        }
+        else
+        {              
+            factor = eps*(1.- g -> distances[slot]/actual_distance)/childs_number;
+            for (unsigned int d = 0; d < g -> embedding_dimension; d++)
+            {
+                POSITION(g, current_node)[d] += factor*(POSITION(g, child_index)[d] - POSITION(g, current_node)[d]) ;
+            }
+        }
     }
-    if (node->n == child_index)
+}
+
+void repel_node(Graph * g, unsigned int current_node, float neg_eps, unsigned int negatives, rng_t * rng_state){
+    /* Pushes a node away from some random not-childs */
+    for (unsigned int mv_aw = 0; mv_aw < negatives; mv_aw++)
     {
-        warnprint("autolink not allowed: skipped");
-        return;
+        move_away_from_random_not_child(g, current_node, neg_eps, rng_state);
     }
-    // Adds label of child to child array
-    node -> childs = (unsigned int *) realloc(node -> childs, sizeof(unsigned int)*( (node -> childs_number) + 1));
-    if (node -> childs == NULL)
+}
+
+void MDE_node(Graph * g, unsigned int current_node, float eps, float neg_eps, unsigned int negatives, rng_t * rng_state){
+    /* Moves a single node: pulls/pushes its childs and pushes away some random not-childs */
+    attract_node(g, current_node, eps);
+    if (neg_eps != 0.) repel_node(g, current_node, neg_eps, negatives, rng_state);
+}
+
+void MDE_edge(Graph * g, unsigned int node, size_t slot, float eps, float neg_eps, unsigned int negatives, rng_t * rng_state){
+    /* Pulls/pushes both nodes of the link at slot (node -> child) towards its target length
+    and pushes node away from some random not-childs. Nodes are written without locks.
+    */
+    unsigned int child = g -> childs[slot];
+    float * position = POSITION(g, node), * child_position = POSITION(g, child);
+    float actual_distance = euclidean_distance(position, child_position, g -> embedding_dimension);
+    if (actual_distance != 0.)
     {
-        errprint("!!! cannot allocate memory !!!\n");
-        exit(-1);
+        float factor = eps*(1. - g -> distances[slot]/actual_distance), delta;
+        for (unsigned int d = 0; d < g -> embedding_dimension; d++)
+        {
+            delta = factor*(child_position[d] - position[d]);
+            position[d] += delta;
+            child_position[d] -= delta;
+        }
     }
-    (node -> childs)[node -> childs_number] = child_index;
+    if (neg_eps != 0.) repel_node(g, node, neg_eps, negatives, rng_state);
+}
+
+void barnes_hut_repulsion(Graph * g, unsigned int node, float scale, float theta)
+{
+    /* Pushes the node away from all the others using the Barnes-Hut tree.
 
-    // Adds distances to distances array
-    node -> distances = (float *) realloc(node -> distances, sizeof(float)*((*node).childs_number + 1));
-    if (node -> distances == NULL)
+    The kernel is the same of move_away_from_random_not_child, scaled so that
+    the displacement equals the expected one of the sampled repulsion.
+    */
+    float force[3];
+    bhtree_force(&(g -> bhtree), g -> positions, node, theta, force);
+    for (unsigned int d = 0; d < g -> embedding_dimension; d++)
     {
-        errprint("!!! cannot allocate memory !!!\n");
-        exit(-1);
+        POSITION(g, node)[d] += scale*force[d];
     }
+}
 
-    (node -> distances)[node -> childs_number] = distance;
+// State of the momentum and Adam updates, one entry for each node
+typedef struct optimizerstate
+{
+    float * velocity;           // First moment (N x dim)
+    float * second_moment;      // Adam only (N)
+} OptimizerState;
 
-    node -> childs_number = (node -> childs_number) + 1;
-    return ;
-}
+void MDE_node_optimized(Graph * g, unsigned int node, float eps, float neg_eps, unsigned int negatives, float bh_scale,
+                        MDEParams * params, OptimizerState * state, unsigned int step, rng_t * rng_state)
+{
+    /* Moves a node with momentum or Adam. The displacement is the one of MDE_node and
+    barnes_hut_repulsion, but it is computed from the current position before moving.
+    */
+    unsigned int dim = g -> embedding_dimension, child_index, childs_number = CHILDS_NUMBER(g, node);
+    float delta[dim], force[3], actual_distance, factor;
+    float * position = POSITION(g, node);
+    float * velocity = state -> velocity + (size_t) node*dim;
+    long not_child;
+
+    for (unsigned int d = 0; d < dim; d++) delta[d] = 0.;
+    for (size_t slot = g -> offsets[node]; slot < g -> offsets[node + 1]; slot++)
+    {
+        child_index = g -> childs[slot];
+        actual_distance = euclidean_distance(position, POSITION(g, child_index), dim);
+        if (actual_distance == 0.0) continue;
+        factor = eps*(1.- g -> distances[slot]/actual_distance)/childs_number;
+        for (unsigned int d = 0; d < dim; d++)
+        {
+            delta[d] += factor*(POSITION(g, child_index)[d] - position[d]);
+        }
+    }
+    for (unsigned int mv_aw = 0; neg_eps != 0. && mv_aw < negatives; mv_aw++)
+    {
+        not_child = random_not_child(g, node, rng_state);
+        if (not_child < 0) break;
+        actual_distance = euclidean_distance(position, POSITION(g, not_child), dim);
+        if (actual_distance == 0.) continue;     // Overlapping nodes have no direction to move along
+        for (unsigned int d = 0; d < dim; d++)
+        {
+            delta[d] += neg_eps/(actual_distance*actual_distance)*(position[d] - POSITION(g, not_child)[d]);
+        }
+    }
+    if (bh_scale != 0.)
+    {
+        bhtree_force(&(g -> bhtree), g -> positions, node, params -> theta, force);
+        for (unsigned int d = 0; d < dim; d++) delta[d] += bh_scale*force[d];
+    }
+
+    if (params -> optimizer == OPTIMIZER_MOMENTUM)
+    {
+        for (unsigned int d = 0; d < dim; d++)
+        {
+            velocity[d] = params -> momentum*velocity[d] + delta[d];
+            position[d] += velocity[d];
+        }
+        return;
+    }
 
-Graph to_Net(SparseRow * SM, float * values, unsigned int N_elements, unsigned long N_links){
-    Graph g;
-    g.nodes = (Node *) malloc(sizeof(Node)*N_elements);
-    if (g.nodes == NULL)
+    // Adam: the first moment is bias corrected and normalized by the second one of the node
+    float beta1 = params -> momentum, beta2 = 0.999, squared_norm = 0.;
+    for (unsigned int d = 0; d < dim; d++) squared_norm += delta[d]*delta[d];
+    state -> second_moment[node] = beta2*state -> second_moment[node] + (1. - beta2)*squared_norm;
+    float first_correction = 1. - pow(beta1, step + 1), second_correction = 1. - pow(beta2, step + 1);
+    float scale = eps/(sqrt(state -> second_moment[node]/second_correction) + 1e-12)/first_correction;
+    for (unsigned int d = 0; d < dim; d++)
     {
-        errprint("!!! cannot allocate memory for %d nodes !!!\n", N_elements);
-        exit(-1);
+        velocity[d] = beta1*velocity[d] + (1. - beta1)*delta[d];
+        position[d] += scale*velocity[d];
     }
-    // Values assignment
-    for (unsigned int k = 0; k < N_elements; k++)
+}
+
+float schedule_factor(MDEParams * params, unsigned int step)
+{
+    /* The step size at the given step over the initial one */
+    float t = ((float) step)/params -> number_of_steps;
+    switch (params -> schedule)
     {
-        g.nodes[k].n = k;
-        g.nodes[k].value = values[k];
-        g.nodes[k].childs_number = 0;
-        g.nodes[k].childs = (unsigned int *) malloc(sizeof(unsigned int)); // Since each node has at least one child
-        g.nodes[k].distances = (float *) malloc(sizeof(float));
+        case SCHEDULE_EXPONENTIAL:
+            return pow(params -> final_ratio, t);
+        case SCHEDULE_COSINE:
+            return params -> final_ratio + (1. - params -> final_ratio)*0.5*(1. + cos(M_PI*t));
+        default:
+            return 1.;
     }
+}
+
+static PyObject * positions_view(Graph * self);
+static PyObject * Graph_get_stats(Graph * self, PyObject * Py_UNUSED(args));
 
-    // Linking
-    for (unsigned long k = 0; k < N_links; k++)
+static int MDE_callback(Graph * g, PyObject * callback, unsigned int step)
+{
+    /* Calls callback(step, positions, stats) taking the GIL.
+    Returns 1 if the callback asks to stop, 0 to go on and -1 if it raised
+    (the exception is left set for the caller).
+    */
+    PyGILState_STATE gil = PyGILState_Ensure();
+    int stop = -1;
+    PyObject * positions = positions_view(g);
+    PyObject * stats = Graph_get_stats(g, NULL);
+    if (positions != NULL && stats != NULL)
     {
-        link_nodes(&(g.nodes[SM[k].i]), SM[k].j, SM[k].d);
-        link_nodes(&(g.nodes[SM[k].j]), SM[k].i, SM[k].d);
+        g -> in_callback = true;
+        PyObject * result = PyObject_CallFunction(callback, "IOO", step, positions, stats);
+        g -> in_callback = false;
+        if (result != NULL)
+        {
+            stop = PyObject_IsTrue(result);
+            Py_DECREF(result);
+        }
     }
-    g.N_nodes = N_elements;
-    g.N_links = N_links;
-    return g;
+    Py_XDECREF(positions);
+    Py_XDECREF(stats);
+    PyGILState_Release(gil);
+    return stop;
 }
 
-unsigned int child_local_index_by_child_name(unsigned int node_number, unsigned int child_name)
+static void MDE_memory_error(const char * what)
 {
-    for (unsigned int child_local_index = 0; child_local_index < G.nodes[node_number].childs_number; child_local_index++)
+    /* Sets a MemoryError taking the GIL (MDE runs without it) */
+    PyGILState_STATE gil = PyGILState_Ensure();
+    PyErr_Format(PyExc_MemoryError, "cannot allocate memory for %s", what);
+    PyGILState_Release(gil);
+}
+
+unsigned int MDE(Graph * g, MDEParams * params){
+    /* Runs the MDE steps on g -> num_threads threads. Python objects are touched only
+    by the callback (that takes the GIL), so it can (and should) be called with the GIL released.
+
+    Each thread gets its own random stream derived from the graph state
+    and nodes are split statically, so the random draws of a seeded run
+    are the same for a fixed number of threads. With more than one thread
+    the order of the (lock-free) position updates is not deterministic.
+
+    If params -> tol is not zero, every params -> window steps the distortion is computed
+    and the run stops when it improved less than tol (relative) since the last check.
+
+    The run goes from step params -> start to params -> number_of_steps, so that schedules
+    and checks continue where a previous run (restored from a checkpoint) stopped.
+
+    With OPTIMIZER_EDGES each step draws params -> samples links (with chance params -> weights)
+    instead of sweeping the nodes, so hubs cost as much as their links and not more.
+
+    If params -> callback is set, every params -> callback_every steps the master thread
+    (the one that called MDE) calls it while the others wait. The run stops if it returns
+    a true value or raises: in the latter case the exception is left set.
+    If memory is over the run stops with a MemoryError set.
+    Returns the number of steps done in this call.
+    */
+    uint64_t base_seed = rng_next(&(g -> rng_state));
+    int num_threads = (g -> num_threads > 0) ? g -> num_threads : 1;
+    unsigned int negatives = negatives_number(g);
+    unsigned int number_of_steps = params -> number_of_steps;
+    unsigned int window = (params -> window > 0) ? params -> window : 1;
+
+    bool barnes_hut = (params -> repulsion == REPULSION_BARNES_HUT && params -> neg_eps != 0.);
+    float sampled_neg_eps = barnes_hut ? 0. : params -> neg_eps;
+    float bh_scale = barnes_hut ? params -> neg_eps*negatives/g -> N_nodes : 0.;
+
+    // Edge sampling: the node of each slot and the table to draw slots
+    size_t N_slots = g -> offsets[g -> N_nodes];
+    size_t samples = (params -> samples > 0) ? params -> samples : N_slots/2;
+    unsigned int * sources = NULL;
+    AliasTable alias = {NULL, NULL, 0};
+    if (params -> optimizer == OPTIMIZER_EDGES)
+    {
+        if (g -> negatives_per_node == 0) negatives = EDGE_NEGATIVES;
+        sources = (unsigned int *) malloc(sizeof(unsigned int)*(N_slots + 1));
+        if (sources == NULL || (params -> weights != NULL && alias_build(&alias, params -> weights, N_slots) < 0))
+        {
+            free(sources);
+            MDE_memory_error("edge sampling");
+            return 0;
+        }
+        for (unsigned int n = 0; n < g -> N_nodes; n++)
+        {
+            for (size_t slot = g -> offsets[n]; slot < g -> offsets[n + 1]; slot++) sources[slot] = n;
+        }
+    }
+
+    OptimizerState state = {NULL, NULL};
+    if (params -> optimizer == OPTIMIZER_MOMENTUM || params -> optimizer == OPTIMIZER_ADAM)
+    {
+        state.velocity = (float *) calloc((size_t) g -> N_nodes*g -> embedding_dimension + 1, sizeof(float));
+        state.second_moment = (float *) calloc(g -> N_nodes + 1, sizeof(float));
+        if (state.velocity == NULL || state.second_moment == NULL)
+        {
+            free(state.velocity);
+            free(state.second_moment);
+            free(sources);
+            alias_free(&alias);
+            MDE_memory_error("the optimizer");
+            return 0;
+        }
+    }
+
+    bool stop = false;
+    unsigned int steps_done = number_of_steps - params -> start;
+    float last_distortion = (params -> tol > 0.) ? get_distortion(g) : 0.;
+    MDEStats * stats = &(g -> stats);
+    double run_start = wall_time(), time_before = stats -> time_total;
+
+    #pragma omp parallel num_threads(num_threads)
+    {
+        rng_t rng_state = rng_seed(base_seed, omp_get_thread_num());
+        rng_t estimate_rng_state = rng_seed(base_seed, num_threads);  // Estimates don't change the draws of MDE
+        double phase_start = 0., now;                                 // Phases are timed by the master thread
+
+        for (unsigned int i = params -> start; i < number_of_steps; i++)
         {
-            if (G.nodes[node_number].childs[child_local_index] == child_name)
+            #pragma omp master
+            {
+                progress_bar(((float)i)/( (float) number_of_steps) , PROGRESSS_BAR_LENGTH, stats -> distortion_estimate);
+                phase_start = wall_time();
+            }
+
+            float factor = schedule_factor(params, i);
+            float eps = factor*params -> eps;
+
+            if (params -> optimizer == OPTIMIZER_EDGES)
+            {
+                #pragma omp for schedule(static)
+                for (size_t k = 0; k < samples; k++)
+                {
+                    size_t slot = (alias.N > 0) ? alias_draw(&alias, &rng_state) : rng_below_size(&rng_state, N_slots);
+                    MDE_edge(g, sources[slot], slot, eps, factor*params -> neg_eps, negatives, &rng_state);
+                }
+                #pragma omp master
+                stats -> time_attraction += wall_time() - phase_start;
+            }
+            else
+            {
+                if (barnes_hut)
+                {
+                    #pragma omp single
+                    if (bhtree_build(&(g -> bhtree), g -> positions, g -> N_nodes, g -> embedding_dimension) < 0)
+                    {
+                        MDE_memory_error("Barnes-Hut tree");
+                        stop = true;
+                        steps_done = i - params -> start;
+                    }
+                    // The single construct ends with a barrier, so every thread sees the same stop
+                    if (stop) break;
+                    #pragma omp master
+                    {
+                        now = wall_time();
+                        stats -> time_repulsion += now - phase_start;
+                        phase_start = now;
+                    }
+                }
+                // Each node is attracted and then repelled before the next one moves
+                #pragma omp for schedule(static)
+                for (unsigned int current_node = 0; current_node < g -> N_nodes; current_node++)
+                {
+                    if (params -> optimizer != OPTIMIZER_SGD)
+                    {
+                        MDE_node_optimized(g, current_node, eps, factor*sampled_neg_eps, negatives, factor*bh_scale,
+                                           params, &state, i, &rng_state);
+                        continue;
+                    }
+                    MDE_node(g, current_node, eps, factor*sampled_neg_eps, negatives, &rng_state);
+                    if (barnes_hut) barnes_hut_repulsion(g, current_node, factor*bh_scale, params -> theta);
+                }
+                #pragma omp master
+                stats -> time_update += wall_time() - phase_start;
+            }
+
+            #pragma omp master
+            {
+                stats -> steps++;
+                stats -> edge_samples += (params -> optimizer == OPTIMIZER_EDGES) ? samples : N_slots;
+            }
+
+            if (stats -> estimate_every > 0 && (i + 1) % stats -> estimate_every == 0)
+            {
+                #pragma omp master
+                {
+                    now = wall_time();
+                    stats -> distortion_estimate = sampled_distortion(g, stats -> estimate_sample, &estimate_rng_state);
+                    stats -> time_distortion += wall_time() - now;
+                }
+                // The others don't move the nodes of the next step while the positions are read
+                #pragma omp barrier
+            }
+
+            if (params -> tol > 0. && (i + 1) % window == 0)
+            {
+                #pragma omp single
+                {
+                    now = wall_time();
+                    float distortion = get_distortion(g);
+                    if (last_distortion - distortion < params -> tol*last_distortion)
+                    {
+                        stop = true;
+                        steps_done = i + 1 - params -> start;
+                    }
+                    last_distortion = distortion;
+                    stats -> distortion_estimate = distortion;
+                    stats -> time_distortion += wall_time() - now;
+                }
+                // The single construct ends with a barrier, so every thread sees the same stop
+                if (stop) break;
+            }
+
+            if (params -> callback != NULL && (i + 1) % params -> callback_every == 0)
             {
-                return child_local_index;
+                #pragma omp master
+                {
+                    now = wall_time();
+                    stats -> time_total = time_before + now - run_start;
+                    if (MDE_callback(g, params -> callback, i + 1) != 0)
+                    {
+                        stop = true;
+                        steps_done = i + 1 - params -> start;
+                    }
+                    stats -> time_callback += wall_time() - now;
+                }
+                #pragma omp barrier
+                if (stop) break;
             }
         }
-    return (unsigned int) -1;
+    }
+    stats -> time_total = time_before + wall_time() - run_start;
+    free(state.velocity);
+    free(state.second_moment);
+    free(sources);
+    alias_free(&alias);
+    return steps_done;
 }
 
-void random_init(){
-    if (RAND_INIT == 0)
+int nancheck(Graph * g)
+{
+    /* Sets a FloatingPointError and returns -1 if a position is NaN */
+    size_t N_coords = (size_t) g -> N_nodes*g -> embedding_dimension;
+    for (size_t k = 0; k < N_coords; k++)
     {
-        srand(time(0));
+        if (isNan(g -> positions[k]))
+        {
+            PyErr_Format(PyExc_FloatingPointError, "NaN detected in the position of node %lu", k/g -> embedding_dimension);
+            return -1;
+        }
     }
-    else
+    return 0;
+}
+
+static double node_distortion(Graph * g, unsigned int node)
+{
+    double distortion = 0.;
+    float error;
+    for (size_t slot = g -> offsets[node]; slot < g -> offsets[node + 1]; slot++)
+    {
+        error = euclidean_distance(POSITION(g, node), POSITION(g, g -> childs[slot]), g -> embedding_dimension) - g -> distances[slot];
+        distortion += error*error;
+    }
+    return distortion;
+}
+
+float get_distortion(Graph * g)
+{
+    double distortion = 0.;
+    for (unsigned int node = 0; node < g -> N_nodes; node++)
+    {
+        distortion += node_distortion(g, node);
+    }
+    return distortion/g -> N_nodes;
+}
+
+float sampled_distortion(Graph * g, unsigned int sample, rng_t * rng_state)
+{
+    /* Estimates get_distortion() from the links of sample random nodes (exact if sample >= N) */
+    if (sample == 0 || sample >= g -> N_nodes) return get_distortion(g);
+    double distortion = 0.;
+    for (unsigned int k = 0; k < sample; k++)
+    {
+        distortion += node_distortion(g, rng_below(rng_state, g -> N_nodes));
+    }
+    return distortion/sample;
+}
+
+// Dynamic graphs --------------------------------------------------------------------------------------------------------
+// Links and nodes are inserted and deleted in place: the adjacency is merged in a single
+// pass over the rows, while the positions of the nodes already there are kept
+
+#define REMOVED_CHILD UINT32_MAX    // Marks the slots to be dropped by compact_rows
+#define LOCAL_NEGATIVES 10          // Repulsions per node in local refinements, if negatives_per_node is not set
+
+int graph_resize(Graph * g, unsigned int N_nodes)
+{
+    /* Makes room for nodes up to N_nodes - 1 (they have no childs and value 0). Positions are not touched. */
+    float * values = (float *) realloc(g -> values, sizeof(float)*(N_nodes + 1));
+    if (values == NULL) return -1;
+    g -> values = values;
+    size_t * offsets = (size_t *) realloc(g -> offsets, sizeof(size_t)*(N_nodes + 1));
+    if (offsets == NULL) return -1;
+    g -> offsets = offsets;
+    for (unsigned int n = g -> N_nodes; n < N_nodes; n++)
     {
-        srand(RAND_INIT);
+        g -> values[n] = 0.;
+        g -> offsets[n + 1] = g -> offsets[g -> N_nodes];
     }
+    g -> N_nodes = N_nodes;
+    return 0;
+}
 
-    for (unsigned int n = 0; n < G.N_nodes; n++)
+static void compact_rows(Graph * g)
+{
+    /* Drops the slots marked as REMOVED_CHILD, in place */
+    size_t write = 0, start = 0, end;
+    for (unsigned int n = 0; n < g -> N_nodes; n++)
     {
-        G.nodes[n].position = (float *) malloc(sizeof(float)*G.embedding_dimension);
-        for (unsigned int d = 0; d < G.embedding_dimension; d++)
+        end = g -> offsets[n + 1];
+        for (size_t slot = start; slot < end; slot++)
         {
-            G.nodes[n].position[d] = ((float) rand())/((float) RAND_MAX);
+            if (g -> childs[slot] == REMOVED_CHILD) continue;
+            g -> childs[write] = g -> childs[slot];
+            g -> distances[write++] = g -> distances[slot];
         }
+        g -> offsets[n + 1] = write;
+        start = end;
     }
-    return;
+    g -> N_links = write/2;
 }
 
-// Python enters here first 90% of the time
-PyObject * init_network(PyObject * self, PyObject * args){
+long graph_insert_links(Graph * g, const unsigned int * i, const unsigned int * j, const float * d, size_t N_new)
+{
+    /* Inserts the links (i, j, d), both ends must be already in the graph.
 
-    // The PyObjs for the two lists
-    PyObject * Psparse = NULL;
-    PyObject * Pvalues = NULL;
-    unsigned int embedding_dim = 0;
+    Links that are already there only get the new distance. The new childs of each node
+    are sorted and merged with its row, so the cost is O(E + N_new log N_new).
+    Returns the number of links inserted or -1 if memory is over.
+    */
+    unsigned int N = g -> N_nodes;
+    size_t * add_offsets = (size_t *) calloc(N + 1, sizeof(size_t));
+    bool * is_new = (bool *) malloc(sizeof(bool)*(N_new + 1));
+    if (add_offsets == NULL || is_new == NULL)
+    {
+        free(add_offsets);
+        free(is_new);
+        return -1;
+    }
 
-    // The C sparse matrix and the values array
-    SparseRow * SM = NULL;
-    float * values = NULL;
+    // Counting pass: links already there are updated
+    size_t slot;
+    for (size_t k = 0; k < N_new; k++)
+    {
+        is_new[k] = false;
+        if (!is_valid_link(i[k], j[k], d[k])) continue;
+        slot = child_slot_by_child_name(g, i[k], j[k]);
+        if (slot != (size_t) -1)
+        {
+            g -> distances[slot] = d[k];
+            g -> distances[child_slot_by_child_name(g, j[k], i[k])] = d[k];
+            continue;
+        }
+        is_new[k] = true;
+        add_offsets[i[k] + 1]++;
+        add_offsets[j[k] + 1]++;
+    }
+    for (unsigned int n = 0; n < N; n++)
+    {
+        add_offsets[n + 1] += add_offsets[n];
+    }
+    size_t N_added = add_offsets[N], N_old = g -> offsets[N];
+    if (N_added == 0)
+    {
+        free(add_offsets);
+        free(is_new);
+        return 0;
+    }
 
-    // Take the args and divide them in two pyobjects
-    if (!PyArg_ParseTuple(args,"OOi",&Psparse, &Pvalues, &embedding_dim))
+    // The new childs of each node, sorted
+    unsigned int * add_childs = (unsigned int *) malloc(sizeof(unsigned int)*N_added);
+    float * add_distances = (float *) malloc(sizeof(float)*N_added);
+    size_t * fill = (size_t *) malloc(sizeof(size_t)*(N + 1));
+    unsigned int * childs = (unsigned int *) malloc(sizeof(unsigned int)*(N_old + N_added + 1));
+    float * distances = (float *) malloc(sizeof(float)*(N_old + N_added + 1));
+    if (add_childs == NULL || add_distances == NULL || fill == NULL || childs == NULL || distances == NULL)
     {
-        printf("\n");
-        errprint("init_network got bad arguments\n");
-        Py_RETURN_NONE;
+        free(add_childs); free(add_distances); free(fill); free(childs); free(distances);
+        free(add_offsets);
+        free(is_new);
+        return -1;
+    }
+    memcpy(fill, add_offsets, sizeof(size_t)*(N + 1));
+    for (size_t k = 0; k < N_new; k++)
+    {
+        if (!is_new[k]) continue;
+        add_childs[fill[i[k]]] = j[k];
+        add_distances[fill[i[k]]++] = d[k];
+        add_childs[fill[j[k]]] = i[k];
+        add_distances[fill[j[k]]++] = d[k];
     }
+    sort_rows(add_offsets, add_childs, add_distances, N);
 
-    unsigned int N_elements = (unsigned int) PyList_Size(Pvalues);
-    unsigned long N_links = (unsigned long) PyList_Size(Psparse);
-    if (N_links < 1 ||  N_elements < 2)
+    // Merging pass (a link given twice in the same call is inserted once)
+    size_t write = 0, old_slot, new_slot, old_end, new_end;
+    unsigned int child;
+    float distance;
+    for (unsigned int n = 0; n < N; n++)
     {
-        errprint("invalid network G = (%d, %ld)\n", N_elements, N_links);
-        exit(2);
+        old_slot = g -> offsets[n];
+        old_end = g -> offsets[n + 1];
+        new_slot = add_offsets[n];
+        new_end = add_offsets[n + 1];
+        g -> offsets[n] = write;
+        while (old_slot < old_end || new_slot < new_end)
+        {
+            if (new_slot == new_end || (old_slot < old_end && g -> childs[old_slot] < add_childs[new_slot]))
+            {
+                child = g -> childs[old_slot];
+                distance = g -> distances[old_slot++];
+            }
+            else
+            {
+                child = add_childs[new_slot];
+                distance = add_distances[new_slot++];
+            }
+            if (write > g -> offsets[n] && childs[write - 1] == child) continue;
+            childs[write] = child;
+            distances[write++] = distance;
+        }
     }
+    g -> offsets[N] = write;
+
+    free(g -> childs);
+    free(g -> distances);
+    g -> childs = childs;
+    g -> distances = distances;
+    long inserted = (long)(write - N_old)/2;
+    g -> N_links += inserted;
+
+    free(add_childs); free(add_distances); free(fill);
+    free(add_offsets);
+    free(is_new);
+    return inserted;
+}
 
-    // Convert each element of the lists into a valid element of the C-object
-    SM = PyList_to_SM(Psparse, N_links);
-    values = PyList_to_float(Pvalues, N_elements);
+long graph_delete_links(Graph * g, const unsigned int * i, const unsigned int * j, size_t N_links)
+{
+    /* Deletes the links (i, j) (those that are not there are ignored), returns the number of deleted links */
+    size_t slot1, slot2;
+    long deleted = 0;
+    for (size_t k = 0; k < N_links; k++)
+    {
+        if (i[k] >= g -> N_nodes || j[k] >= g -> N_nodes) continue;
+        slot1 = child_slot_by_child_name(g, i[k], j[k]);
+        slot2 = child_slot_by_child_name(g, j[k], i[k]);
+        if (slot1 == (size_t) -1 || slot2 == (size_t) -1) continue;
+        g -> childs[slot1] = REMOVED_CHILD;
+        g -> childs[slot2] = REMOVED_CHILD;
+        deleted++;
+    }
+    if (deleted > 0) compact_rows(g);
+    return deleted;
+}
 
-    infoprint("Generating network...");
-    G = to_Net(SM, values, N_elements, N_links);
-    free(SM);
-    free(values);
-    G.embedding_dimension = embedding_dim;
-    printf("\tDone.\n");
+int graph_delete_nodes(Graph * g, const bool * removed, float * new_positions)
+{
+    /* Deletes the marked nodes and their links. The others keep their order (so rows stay sorted)
+    and their positions are copied to new_positions.
+    Returns -1 if memory is over, leaving the graph as it is.
+    */
+    unsigned int N = g -> N_nodes, kept = 0;
+    unsigned int * new_index = (unsigned int *) malloc(sizeof(unsigned int)*(N + 1));
+    if (new_index == NULL) return -1;
+    for (unsigned int n = 0; n < N; n++)
+    {
+        new_index[n] = removed[n] ? REMOVED_CHILD : kept++;
+    }
 
-    // Initializes the position randomly
-    infoprint("Random initialization in R%d...", G.embedding_dimension);
-    random_init();
-    printf("\tDone.\n");
-    nancheck();
-    Py_RETURN_NONE;
+    size_t write = 0, start = 0, end;
+    for (unsigned int n = 0; n < N; n++)
+    {
+        end = g -> offsets[n + 1];
+        if (!removed[n])
+        {
+            unsigned int m = new_index[n];
+            g -> offsets[m] = write;
+            for (size_t slot = start; slot < end; slot++)
+            {
+                if (removed[g -> childs[slot]]) continue;
+                g -> childs[write] = new_index[g -> childs[slot]];
+                g -> distances[write++] = g -> distances[slot];
+            }
+            g -> values[m] = g -> values[n];
+            memcpy(new_positions + (size_t) m*g -> embedding_dimension, POSITION(g, n), sizeof(float)*g -> embedding_dimension);
+        }
+        start = end;
+    }
+    g -> offsets[kept] = write;
+    g -> N_nodes = kept;
+    g -> N_links = write/2;
+    g -> positions = new_positions;
+    free(new_index);
+    return 0;
 }
 
-void move_away_from_random_not_child(unsigned int node, float eps){
-    // Picks a guy at random until it is not a child
-    unsigned int not_child;
-    unsigned int draws = 0;
-    do{
-        not_child = (unsigned int)((G.N_nodes-1)*((float) rand()/RAND_MAX));
-        draws++;
-        if (draws > G.N_nodes){
-            return;
+int graph_place_nodes(Graph * g, unsigned int first_new)
+{
+    /* Places the nodes from first_new on near the barycentre of their placed neighbours.
+
+    New nodes linked only to other new nodes are placed once their neighbours are,
+    those with no placed neighbour at all go at random inside the box of the old nodes.
+    A node with a single neighbour is put at the target distance in a random direction,
+    the others get a small random shift, so that no two nodes start at the same point.
+    Returns -1 if memory is over, leaving the new nodes where they are.
+    */
+    unsigned int dim = g -> embedding_dimension, placed_neighbours, n, child;
+    bool * placed = (bool *) malloc(sizeof(bool)*(g -> N_nodes + 1));
+    float low[dim], high[dim], shift[dim], mean_distance, norm;
+    bool progress = true;
+    if (placed == NULL) return -1;
+
+    for (n = 0; n < g -> N_nodes; n++) placed[n] = (n < first_new);
+    for (unsigned int k = 0; k < dim; k++)
+    {
+        low[k] = 0.;
+        high[k] = 1.;
+        for (n = 0; n < first_new; n++)
+        {
+            if (n == 0 || POSITION(g, n)[k] < low[k]) low[k] = POSITION(g, n)[k];
+            if (n == 0 || POSITION(g, n)[k] > high[k]) high[k] = POSITION(g, n)[k];
+        }
+    }
+
+    while (progress)
+    {
+        progress = false;
+        for (n = first_new; n < g -> N_nodes; n++)
+        {
+            if (placed[n]) continue;
+            placed_neighbours = 0;
+            mean_distance = 0.;
+            for (unsigned int k = 0; k < dim; k++) POSITION(g, n)[k] = 0.;
+            for (size_t slot = g -> offsets[n]; slot < g -> offsets[n + 1]; slot++)
+            {
+                child = g -> childs[slot];
+                if (!placed[child]) continue;
+                for (unsigned int k = 0; k < dim; k++) POSITION(g, n)[k] += POSITION(g, child)[k];
+                mean_distance += g -> distances[slot];
+                placed_neighbours++;
+            }
+            if (placed_neighbours == 0) continue;
+
+            mean_distance /= placed_neighbours;
+            norm = 0.;
+            for (unsigned int k = 0; k < dim; k++)
+            {
+                shift[k] = rng_uniform(&(g -> rng_state)) - 0.5;
+                norm += shift[k]*shift[k];
+            }
+            norm = sqrt(norm) + 1e-12;
+            for (unsigned int k = 0; k < dim; k++)
+            {
+                POSITION(g, n)[k] /= placed_neighbours;
+                POSITION(g, n)[k] += shift[k]/norm*mean_distance*((placed_neighbours == 1) ? 1. : 0.1);
+            }
+            placed[n] = true;
+            progress = true;
+        }
+    }
+
+    for (n = first_new; n < g -> N_nodes; n++)
+    {
+        if (placed[n]) continue;
+        for (unsigned int k = 0; k < dim; k++)
+        {
+            POSITION(g, n)[k] = low[k] + (high[k] - low[k])*rng_uniform(&(g -> rng_state));
+        }
+    }
+    free(placed);
+    return 0;
+}
+
+long graph_neighbourhood(Graph * g, const unsigned int * nodes, size_t N_seeds, unsigned int hops, unsigned int * neighbourhood)
+{
+    /* Writes in neighbourhood (N_nodes long) the nodes within hops links from the given ones,
+    returns how many they are or -1 if memory is over.
+    */
+    bool * seen = (bool *) calloc(g -> N_nodes + 1, sizeof(bool));
+    size_t count = 0, frontier_start = 0, frontier_end;
+    if (seen == NULL) return -1;
+    for (size_t k = 0; k < N_seeds; k++)
+    {
+        if (nodes[k] >= g -> N_nodes || seen[nodes[k]]) continue;
+        seen[nodes[k]] = true;
+        neighbourhood[count++] = nodes[k];
+    }
+    for (unsigned int hop = 0; hop < hops; hop++)
+    {
+        frontier_end = count;
+        for (size_t k = frontier_start; k < frontier_end; k++)
+        {
+            unsigned int n = neighbourhood[k];
+            for (size_t slot = g -> offsets[n]; slot < g -> offsets[n + 1]; slot++)
+            {
+                if (seen[g -> childs[slot]]) continue;
+                seen[g -> childs[slot]] = true;
+                neighbourhood[count++] = g -> childs[slot];
+            }
+        }
+        frontier_start = frontier_end;
+    }
+    free(seen);
+    return (long) count;
+}
+
+void local_MDE(Graph * g, const unsigned int * nodes, size_t N_local, MDEParams * params)
+{
+    /* Runs the MDE steps moving only the given nodes (the others are still felt) */
+    uint64_t base_seed = rng_next(&(g -> rng_state));
+    int num_threads = (g -> num_threads > 0) ? g -> num_threads : 1;
+    unsigned int negatives = (g -> negatives_per_node != 0) ? g -> negatives_per_node : LOCAL_NEGATIVES;
+
+    #pragma omp parallel num_threads(num_threads)
+    {
+        rng_t rng_state = rng_seed(base_seed, omp_get_thread_num());
+        for (unsigned int step = 0; step < params -> number_of_steps; step++)
+        {
+            #pragma omp for schedule(static)
+            for (size_t k = 0; k < N_local; k++)
+            {
+                MDE_node(g, nodes[k], params -> eps, params -> neg_eps, negatives, &rng_state);
+            }
+        }
+    }
+}
+
+// Checkpoints -----------------------------------------------------------------------------------------------------------
+// A checkpoint is a header followed by the arrays of the graph, each one starting at a multiple of 8 bytes:
+//   values (float, N) | positions (float, N x dim) | offsets (uint64, N + 1) | childs (uint32, slots) | distances (float, slots)
+// Files are written in the byte order of the machine and read back with a memory map.
+
+#define CHECKPOINT_MAGIC "CNETSCKP"
+#define CHECKPOINT_VERSION 1
+#define CHECKPOINT_ALIGN(size) (((size) + 7) & ~((size_t) 7))
+
+static void Graph_clear(Graph * self);
+
+typedef struct checkpointheader
+{
+    char magic[8];
+    uint32_t version;
+    uint32_t embedding_dimension;
+    uint64_t N_nodes;
+    uint64_t N_links;
+    uint64_t N_slots;                   // offsets[N_nodes]: each link is stored in both its rows
+    uint64_t rng_state;
+    uint64_t steps;                     // Steps done when the checkpoint was written
+    float negative_sampling_fraction;
+    uint32_t negatives_per_node;
+} CheckpointHeader;
+
+static size_t checkpoint_size(CheckpointHeader * header, size_t sections[5])
+{
+    /* Fills the start of each section and returns the size of the file */
+    size_t N = header -> N_nodes, slots = header -> N_slots;
+    size_t lengths[5] = {sizeof(float)*N, sizeof(float)*N*header -> embedding_dimension,
+                         sizeof(uint64_t)*(N + 1), sizeof(uint32_t)*slots, sizeof(float)*slots};
+    size_t position = CHECKPOINT_ALIGN(sizeof(CheckpointHeader));
+    for (int k = 0; k < 5; k++)
+    {
+        sections[k] = position;
+        position = CHECKPOINT_ALIGN(position + lengths[k]);
+    }
+    return position;
+}
+
+static int write_section(FILE * file, const void * data, size_t length)
+{
+    static const char padding[8] = {0};
+    if (length > 0 && fwrite(data, 1, length, file) != length) return -1;
+    if (CHECKPOINT_ALIGN(length) > length && fwrite(padding, 1, CHECKPOINT_ALIGN(length) - length, file) != CHECKPOINT_ALIGN(length) - length) return -1;
+    return 0;
+}
+
+static int write_padding(FILE * file, size_t length)
+{
+    static const char padding[8] = {0};
+    size_t missing = CHECKPOINT_ALIGN(length) - length;
+    return (missing > 0 && fwrite(padding, 1, missing, file) != missing) ? -1 : 0;
+}
+
+typedef struct rankeddistance
+{
+    unsigned int child;
+    float distance;
+} RankedDistance;
+
+static int compare_ranked(const void * a, const void * b)
+{
+    unsigned int ca = ((const RankedDistance *) a) -> child, cb = ((const RankedDistance *) b) -> child;
+    return (ca > cb) - (ca < cb);
+}
+
+static int write_permuted(FILE * file, Graph * g, const unsigned int * order)
+{
+    /* Writes the sections of g with the nodes renamed: the new node n is the old order[n].
+    Rows are read one at a time, so only O(N) memory is used besides the graph.
+    */
+    unsigned int N = g -> N_nodes, dim = g -> embedding_dimension;
+    size_t max_row = 0;
+    unsigned int * rank = (unsigned int *) malloc(sizeof(unsigned int)*(N + 1));
+    uint64_t * offsets = (uint64_t *) malloc(sizeof(uint64_t)*(N + 1));
+    float * values = (float *) malloc(sizeof(float)*(N + 1));
+    if (rank == NULL || offsets == NULL || values == NULL)
+    {
+        free(rank);
+        free(offsets);
+        free(values);
+        errno = ENOMEM;
+        return -1;
+    }
+    offsets[0] = 0;
+    for (unsigned int n = 0; n < N; n++)
+    {
+        rank[order[n]] = n;
+        values[n] = g -> values[order[n]];
+        offsets[n + 1] = offsets[n] + CHILDS_NUMBER(g, order[n]);
+        if (CHILDS_NUMBER(g, order[n]) > max_row) max_row = CHILDS_NUMBER(g, order[n]);
+    }
+    RankedDistance * row = (RankedDistance *) malloc(sizeof(RankedDistance)*(max_row + 1));
+    int result = (row == NULL) ? -1 : 0;
+    if (result < 0) errno = ENOMEM;
+
+    if (result == 0 && write_section(file, values, sizeof(float)*N) < 0) result = -1;
+    for (unsigned int n = 0; result == 0 && n < N; n++)
+    {
+        if (fwrite(POSITION(g, order[n]), sizeof(float), dim, file) != dim) result = -1;
+    }
+    if (result == 0 && write_padding(file, sizeof(float)*N*dim) < 0) result = -1;
+    if (result == 0 && write_section(file, offsets, sizeof(uint64_t)*(N + 1)) < 0) result = -1;
+
+    // Childs and distances are two sections: rows are sorted by the new names twice
+    for (int pass = 0; pass < 2 && result == 0; pass++)
+    {
+        for (unsigned int n = 0; result == 0 && n < N; n++)
+        {
+            unsigned int old = order[n], length = CHILDS_NUMBER(g, old);
+            for (unsigned int k = 0; k < length; k++)
+            {
+                row[k].child = rank[g -> childs[g -> offsets[old] + k]];
+                row[k].distance = g -> distances[g -> offsets[old] + k];
+            }
+            qsort(row, length, sizeof(RankedDistance), compare_ranked);
+            for (unsigned int k = 0; k < length && result == 0; k++)
+            {
+                if (fwrite((pass == 0) ? (void *) &(row[k].child) : (void *) &(row[k].distance), 4, 1, file) != 1) result = -1;
+            }
+        }
+        if (result == 0 && write_padding(file, 4*offsets[N]) < 0) result = -1;
+    }
+    free(rank);
+    free(offsets);
+    free(values);
+    free(row);
+    return result;
+}
+
+int graph_save(Graph * g, const char * path, uint64_t steps, const unsigned int * order)
+{
+    /* Writes the checkpoint of g in a temporary file that is then renamed over path,
+    so that a crash while saving never spoils the previous checkpoint.
+    If order is given the new node n is the old node order[n].
+    Returns -1 and sets errno on failure.
+    */
+    CheckpointHeader header = {0};
+    memcpy(header.magic, CHECKPOINT_MAGIC, 8);
+    header.version = CHECKPOINT_VERSION;
+    header.embedding_dimension = g -> embedding_dimension;
+    header.N_nodes = g -> N_nodes;
+    header.N_links = g -> N_links;
+    header.N_slots = g -> offsets[g -> N_nodes];
+    header.rng_state = g -> rng_state;
+    header.steps = steps;
+    header.negative_sampling_fraction = g -> negative_sampling_fraction;
+    header.negatives_per_node = g -> negatives_per_node;
+
+    size_t temporary_length = strlen(path) + 5;
+    char * temporary = (char *) malloc(temporary_length);
+    uint64_t * offsets = (uint64_t *) malloc(sizeof(uint64_t)*(header.N_nodes + 1));
+    if (temporary == NULL || offsets == NULL)
+    {
+        free(temporary);
+        free(offsets);
+        errno = ENOMEM;
+        return -1;
+    }
+    snprintf(temporary, temporary_length, "%s.tmp", path);
+    for (size_t n = 0; n <= header.N_nodes; n++) offsets[n] = g -> offsets[n];
+
+    FILE * file = fopen(temporary, "wb");
+    int result = (file == NULL) ? -1 : 0;
+    if (result == 0)
+    {
+        if (write_section(file, &header, sizeof(CheckpointHeader)) < 0) result = -1;
+        else if (order != NULL) result = write_permuted(file, g, order);
+        else if (write_section(file, g -> values, sizeof(float)*header.N_nodes) < 0
+            || write_section(file, g -> positions, sizeof(float)*header.N_nodes*header.embedding_dimension) < 0
+            || write_section(file, offsets, sizeof(uint64_t)*(header.N_nodes + 1)) < 0
+            || write_section(file, g -> childs, sizeof(uint32_t)*header.N_slots) < 0
+            || write_section(file, g -> distances, sizeof(float)*header.N_slots) < 0) result = -1;
+        if (fclose(file) != 0) result = -1;
+        if (result == 0 && rename(temporary, path) != 0) result = -1;
+        if (result < 0)
+        {
+            int error = errno;
+            remove(temporary);
+            errno = error;
+        }
+    }
+    free(temporary);
+    free(offsets);
+    return result;
+}
+
+static const char * checkpoint_check(const char * map, size_t size, CheckpointHeader * header, bool full)
+{
+    /* Returns NULL if the mapped file is a valid checkpoint, otherwise what is wrong with it.
+    Childs are checked only if full, since that reads the whole adjacency: they must be nodes
+    and each row must be sorted without repeats, as link_slots and negative sampling bisect it.
+    */
+    size_t sections[5];
+    if (size < sizeof(CheckpointHeader)) return "file too short";
+    memcpy(header, map, sizeof(CheckpointHeader));
+    if (memcmp(header -> magic, CHECKPOINT_MAGIC, 8) != 0) return "not a cnets checkpoint";
+    if (header -> version != CHECKPOINT_VERSION) return "unsupported checkpoint version";
+    if (header -> N_nodes < 2 || header -> N_nodes > UINT32_MAX || header -> embedding_dimension == 0) return "invalid header";
+    if (checkpoint_size(header, sections) != size) return "file size does not match its header";
+
+    const uint64_t * offsets = (const uint64_t *) (map + sections[2]);
+    const uint32_t * childs = (const uint32_t *) (map + sections[3]);
+    if (offsets[0] != 0 || offsets[header -> N_nodes] != header -> N_slots) return "corrupted adjacency";
+    for (size_t n = 0; n < header -> N_nodes; n++)
+    {
+        if (offsets[n + 1] < offsets[n]) return "corrupted adjacency";
+    }
+    for (size_t n = 0; full && n < header -> N_nodes; n++)
+    {
+        for (size_t slot = offsets[n]; slot < offsets[n + 1]; slot++)
+        {
+            if (childs[slot] >= header -> N_nodes) return "corrupted adjacency";
+            if (slot > offsets[n] && childs[slot] <= childs[slot - 1]) return "unsorted adjacency";
+        }
+    }
+    return NULL;
+}
+
+// File-backed graphs: the arrays of a checkpoint are used in place, the operating system
+// pages them in and out as MDE walks the nodes in order. Links can't be added or removed.
+
+typedef struct graphmap
+{
+    char * address;
+    size_t size;
+    bool writable;                      // Shared map: positions and targets are written to the file
+} GraphMap;
+
+static void graphmap_destroy(PyObject * capsule)
+{
+    GraphMap * map = (GraphMap *) PyCapsule_GetPointer(capsule, "cnets.GraphMap");
+    munmap(map -> address, map -> size);
+    free(map);
+}
+
+int graph_map(Graph * g, const char * path, bool writable, bool validate)
+{
+    /* Makes g use the arrays of a checkpoint file in place.
+    If not writable the map is private (copy on write): the changes stay in memory and the file is not touched.
+    With validate all the childs are checked to be valid nodes (this reads the whole adjacency).
+    Returns -1 with a python exception set on failure.
+    */
+    if (sizeof(size_t) != sizeof(uint64_t) || sizeof(unsigned int) != sizeof(uint32_t))
+    {
+        PyErr_SetString(PyExc_RuntimeError, "file-backed graphs need 64 bit sizes and 32 bit ints");
+        return -1;
+    }
+    int fd = open(path, writable ? O_RDWR : O_RDONLY);
+    if (fd < 0)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        return -1;
+    }
+    struct stat info;
+    if (fstat(fd, &info) < 0)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        close(fd);
+        return -1;
+    }
+    if (info.st_size < (off_t) sizeof(CheckpointHeader))
+    {
+        PyErr_Format(PyExc_ValueError, "%s: file too short", path);
+        close(fd);
+        return -1;
+    }
+    size_t size = (size_t) info.st_size;
+    char * address = (char *) mmap(NULL, size, PROT_READ | PROT_WRITE, writable ? MAP_SHARED : MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (address == MAP_FAILED)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        return -1;
+    }
+
+    CheckpointHeader header;
+    size_t sections[5];
+    const char * problem = checkpoint_check(address, size, &header, validate);
+    GraphMap * map = (problem == NULL) ? (GraphMap *) malloc(sizeof(GraphMap)) : NULL;
+    if (map == NULL)
+    {
+        if (problem != NULL) PyErr_Format(PyExc_ValueError, "%s: %s", path, problem);
+        else PyErr_NoMemory();
+        munmap(address, size);
+        return -1;
+    }
+    map -> address = address;
+    map -> size = size;
+    map -> writable = writable;
+    PyObject * capsule = PyCapsule_New(map, "cnets.GraphMap", graphmap_destroy);
+    if (capsule == NULL)
+    {
+        munmap(address, size);
+        free(map);
+        return -1;
+    }
+    checkpoint_size(&header, sections);
+
+    // The positions array keeps the map alive as long as someone holds a view of it
+    npy_intp dims[2] = {(npy_intp) header.N_nodes, header.embedding_dimension};
+    PyObject * positions_array = PyArray_SimpleNewFromData(2, dims, NPY_FLOAT32, address + sections[1]);
+    if (positions_array == NULL)
+    {
+        Py_DECREF(capsule);
+        return -1;
+    }
+    Py_INCREF(capsule);
+    if (PyArray_SetBaseObject((PyArrayObject *) positions_array, capsule) < 0)
+    {
+        Py_DECREF(positions_array);
+        Py_DECREF(capsule);
+        return -1;
+    }
+
+    Graph_clear(g);
+    g -> mapping = capsule;
+    g -> N_nodes = header.N_nodes;
+    g -> N_links = header.N_links;
+    g -> values = (float *) (address + sections[0]);
+    g -> offsets = (size_t *) (address + sections[2]);
+    g -> childs = (unsigned int *) (address + sections[3]);
+    g -> distances = (float *) (address + sections[4]);
+    g -> embedding_dimension = header.embedding_dimension;
+    g -> positions_array = positions_array;
+    g -> positions = (float *) PyArray_DATA((PyArrayObject *) positions_array);
+    g -> rng_state = header.rng_state;
+    g -> negative_sampling_fraction = header.negative_sampling_fraction;
+    g -> negatives_per_node = header.negatives_per_node;
+    g -> num_threads = NUM_THREADS;
+    g -> stats = (MDEStats) {0};
+    g -> stats.steps = header.steps;
+    g -> stats.distortion_estimate = NAN;
+    g -> stats.estimate_every = STATS_ESTIMATE_EVERY;
+    g -> stats.estimate_sample = STATS_ESTIMATE_SAMPLE;
+    return 0;
+}
+
+static GraphMap * graph_mapping(Graph * g)
+{
+    return (g -> mapping == NULL) ? NULL : (GraphMap *) PyCapsule_GetPointer(g -> mapping, "cnets.GraphMap");
+}
+
+int graph_load(Graph * g, const char * path)
+{
+    /* Restores a checkpoint: its arrays are mapped copy on write, so nothing is read
+    until it is used and only the pages that change are copied.
+    Returns -1 with a python exception set on failure, the step count is left in g -> stats.steps.
+    */
+    return graph_map(g, path, false, true);
+}
+
+int graph_unmap(Graph * g)
+{
+    /* Moves the arrays of a privately mapped graph to memory, so that they can be resized.
+    Returns -1 with a MemoryError set if memory is over.
+    */
+    if (g -> mapping == NULL) return 0;
+    size_t N = g -> N_nodes, slots = g -> offsets[N];
+    float * values = (float *) malloc(sizeof(float)*(N + 1));
+    size_t * offsets = (size_t *) malloc(sizeof(size_t)*(N + 1));
+    unsigned int * childs = (unsigned int *) malloc(sizeof(unsigned int)*(slots + 1));
+    float * distances = (float *) malloc(sizeof(float)*(slots + 1));
+    PyObject * positions_array = PyArray_NewCopy((PyArrayObject *) g -> positions_array, NPY_CORDER);
+    if (values == NULL || offsets == NULL || childs == NULL || distances == NULL || positions_array == NULL)
+    {
+        free(values);
+        free(offsets);
+        free(childs);
+        free(distances);
+        Py_XDECREF(positions_array);
+        if (!PyErr_Occurred()) PyErr_NoMemory();
+        return -1;
+    }
+    memcpy(values, g -> values, sizeof(float)*N);
+    memcpy(offsets, g -> offsets, sizeof(size_t)*(N + 1));
+    memcpy(childs, g -> childs, sizeof(unsigned int)*slots);
+    memcpy(distances, g -> distances, sizeof(float)*slots);
+    g -> values = values;
+    g -> offsets = offsets;
+    g -> childs = childs;
+    g -> distances = distances;
+    // Views of the old positions keep the map alive
+    Py_SETREF(g -> positions_array, positions_array);
+    g -> positions = (float *) PyArray_DATA((PyArrayObject *) positions_array);
+    Py_CLEAR(g -> mapping);
+    return 0;
+}
+
+void graph_sync_header(Graph * g)
+{
+    /* Keeps the header of a writable file-backed graph up to date, so the file is a checkpoint */
+    GraphMap * map = graph_mapping(g);
+    if (map == NULL || !map -> writable) return;
+    CheckpointHeader * header = (CheckpointHeader *) map -> address;
+    header -> rng_state = g -> rng_state;
+    header -> steps = g -> stats.steps;
+    header -> negative_sampling_fraction = g -> negative_sampling_fraction;
+    header -> negatives_per_node = g -> negatives_per_node;
+}
+
+// Node orderings -------------------------------------------------------------------------------------------------------
+// Renaming the nodes so that linked nodes get close indexes makes MDE read the positions
+// (and the adjacency of a file-backed graph) almost sequentially
+
+typedef struct degreenode
+{
+    unsigned int degree;
+    unsigned int node;
+} DegreeNode;
+
+static int compare_degree(const void * a, const void * b)
+{
+    const DegreeNode * da = (const DegreeNode *) a, * db = (const DegreeNode *) b;
+    if (da -> degree != db -> degree) return (da -> degree > db -> degree) - (da -> degree < db -> degree);
+    return (da -> node > db -> node) - (da -> node < db -> node);
+}
+
+int graph_node_order(Graph * g, unsigned int * order, bool cuthill_mckee)
+{
+    /* Fills order with a breadth-first visit of the nodes: each connected component starts
+    from its node of minimum degree. With cuthill_mckee the childs of a node are visited
+    by increasing degree and the order is reversed (reverse Cuthill-McKee).
+    Returns -1 if memory is missing.
+    */
+    unsigned int N = g -> N_nodes, max_degree = 0;
+    for (unsigned int n = 0; n < N; n++)
+    {
+        if (CHILDS_NUMBER(g, n) > max_degree) max_degree = CHILDS_NUMBER(g, n);
+    }
+    bool * visited = (bool *) calloc(N + 1, sizeof(bool));
+    unsigned int * by_degree = (unsigned int *) malloc(sizeof(unsigned int)*(N + 1));
+    size_t * counts = (size_t *) calloc((size_t) max_degree + 2, sizeof(size_t));
+    DegreeNode * row = (DegreeNode *) malloc(sizeof(DegreeNode)*((size_t) max_degree + 1));
+    if (visited == NULL || by_degree == NULL || counts == NULL || row == NULL)
+    {
+        free(visited);
+        free(by_degree);
+        free(counts);
+        free(row);
+        return -1;
+    }
+    // Counting sort of the nodes by degree
+    for (unsigned int n = 0; n < N; n++) counts[CHILDS_NUMBER(g, n) + 1]++;
+    for (unsigned int d = 0; d <= max_degree; d++) counts[d + 1] += counts[d];
+    for (unsigned int n = 0; n < N; n++) by_degree[counts[CHILDS_NUMBER(g, n)]++] = n;
+
+    size_t head = 0, tail = 0;
+    for (unsigned int k = 0; k < N; k++)
+    {
+        if (visited[by_degree[k]]) continue;
+        visited[by_degree[k]] = true;
+        order[tail++] = by_degree[k];
+        while (head < tail)
+        {
+            unsigned int node = order[head++], found = 0;
+            for (size_t slot = g -> offsets[node]; slot < g -> offsets[node + 1]; slot++)
+            {
+                unsigned int child = g -> childs[slot];
+                if (visited[child]) continue;
+                visited[child] = true;
+                if (cuthill_mckee)
+                {
+                    row[found].degree = CHILDS_NUMBER(g, child);
+                    row[found++].node = child;
+                }
+                else order[tail++] = child;
+            }
+            if (found > 0)
+            {
+                qsort(row, found, sizeof(DegreeNode), compare_degree);
+                for (unsigned int c = 0; c < found; c++) order[tail++] = row[c].node;
+            }
+        }
+    }
+    if (cuthill_mckee && N > 1)
+    {
+        for (unsigned int a = 0, b = N - 1; a < b; a++, b--)
+        {
+            unsigned int swap = order[a];
+            order[a] = order[b];
+            order[b] = swap;
+        }
+    }
+    free(visited);
+    free(by_degree);
+    free(counts);
+    free(row);
+    return 0;
+}
+
+// Multilevel embedding ---------------------------------------------------------------------------------------------------
+// A graph is coarsened by merging pairs of linked nodes until it is small, the smallest one is embedded
+// and each finer level starts from the positions of the coarser one (see Network.multilevel_init)
+
+#define UNMATCHED ((unsigned int) -1)
+
+int graph_coarsen(Graph * g, Graph * coarse, unsigned int * parent)
+{
+    /* Heavy edge matching: visiting the nodes in random order, each node still alone is merged
+    with the closest (shortest target) of its childs still alone. The links of the merged nodes
+    become the links of coarse, the targets of parallel links are averaged.
+    parent[n] is the coarse node of n. Returns the number of coarse nodes, -1 if memory is missing.
+    */
+    unsigned int N = g -> N_nodes, N_coarse = 0;
+    unsigned int * mate = (unsigned int *) malloc(sizeof(unsigned int)*(N + 1));
+    unsigned int * visit = (unsigned int *) malloc(sizeof(unsigned int)*(N + 1));
+    unsigned int * members = (unsigned int *) calloc(N + 1, sizeof(unsigned int));
+    if (mate == NULL || visit == NULL || members == NULL)
+    {
+        free(mate);
+        free(visit);
+        free(members);
+        return -1;
+    }
+    for (unsigned int n = 0; n < N; n++)
+    {
+        mate[n] = UNMATCHED;
+        visit[n] = n;
+    }
+    for (unsigned int n = N - 1; N > 1 && n > 0; n--)
+    {
+        unsigned int k = rng_below(&(g -> rng_state), n + 1), swap = visit[n];
+        visit[n] = visit[k];
+        visit[k] = swap;
+    }
+    for (unsigned int k = 0; k < N; k++)
+    {
+        unsigned int node = visit[k], best = UNMATCHED;
+        float best_distance = INFINITY;
+        if (mate[node] != UNMATCHED) continue;
+        for (size_t slot = g -> offsets[node]; slot < g -> offsets[node + 1]; slot++)
+        {
+            if (mate[g -> childs[slot]] == UNMATCHED && g -> distances[slot] < best_distance)
+            {
+                best = g -> childs[slot];
+                best_distance = g -> distances[slot];
+            }
+        }
+        mate[node] = (best == UNMATCHED) ? node : best;
+        if (best != UNMATCHED) mate[best] = node;
+    }
+    free(visit);
+
+    // Coarse nodes follow their first member, so that an ordering of the nodes is kept
+    for (unsigned int n = 0; n < N; n++)
+    {
+        parent[n] = (mate[n] >= n) ? N_coarse++ : parent[mate[n]];
+        members[parent[n]]++;
+    }
+    free(mate);
+
+    coarse -> values = (float *) calloc(N_coarse + 1, sizeof(float));
+    coarse -> offsets = (size_t *) calloc(N_coarse + 1, sizeof(size_t));
+    if (coarse -> values == NULL || coarse -> offsets == NULL)
+    {
+        free(members);
+        return -1;
+    }
+    for (unsigned int n = 0; n < N; n++)
+    {
+        coarse -> values[parent[n]] += g -> values[n]/members[parent[n]];
+        for (size_t slot = g -> offsets[n]; slot < g -> offsets[n + 1]; slot++)
+        {
+            if (parent[g -> childs[slot]] != parent[n]) coarse -> offsets[parent[n] + 1]++;
+        }
+    }
+    free(members);
+    for (unsigned int c = 0; c < N_coarse; c++) coarse -> offsets[c + 1] += coarse -> offsets[c];
+
+    coarse -> childs = (unsigned int *) malloc(sizeof(unsigned int)*(coarse -> offsets[N_coarse] + 1));
+    coarse -> distances = (float *) malloc(sizeof(float)*(coarse -> offsets[N_coarse] + 1));
+    size_t * fill = (size_t *) malloc(sizeof(size_t)*(N_coarse + 1));
+    if (coarse -> childs == NULL || coarse -> distances == NULL || fill == NULL)
+    {
+        free(fill);
+        return -1;
+    }
+    memcpy(fill, coarse -> offsets, sizeof(size_t)*N_coarse);
+    for (unsigned int n = 0; n < N; n++)
+    {
+        for (size_t slot = g -> offsets[n]; slot < g -> offsets[n + 1]; slot++)
+        {
+            unsigned int child = parent[g -> childs[slot]];
+            if (child == parent[n]) continue;
+            coarse -> childs[fill[parent[n]]] = child;
+            coarse -> distances[fill[parent[n]]++] = g -> distances[slot];
+        }
+    }
+    free(fill);
+    sort_rows(coarse -> offsets, coarse -> childs, coarse -> distances, N_coarse);
+
+    // Parallel links are now next to each other: one is kept with the mean target
+    size_t write = 0;
+    for (unsigned int c = 0; c < N_coarse; c++)
+    {
+        size_t start = coarse -> offsets[c], end = coarse -> offsets[c + 1];
+        unsigned int count = 0;
+        coarse -> offsets[c] = write;
+        for (size_t slot = start; slot < end; slot++)
+        {
+            if (count > 0 && coarse -> childs[write - 1] == coarse -> childs[slot])
+            {
+                coarse -> distances[write - 1] += coarse -> distances[slot];
+                count++;
+                continue;
+            }
+            if (count > 0) coarse -> distances[write - 1] /= count;
+            coarse -> childs[write] = coarse -> childs[slot];
+            coarse -> distances[write++] = coarse -> distances[slot];
+            count = 1;
+        }
+        if (count > 0) coarse -> distances[write - 1] /= count;
+    }
+    coarse -> offsets[N_coarse] = write;
+
+    coarse -> N_nodes = N_coarse;
+    coarse -> N_links = write/2;
+    coarse -> embedding_dimension = g -> embedding_dimension;
+    return (int) N_coarse;
+}
+
+int graph_prolong(Graph * g, Graph * coarse, const unsigned int * parent)
+{
+    /* Places the nodes of g where their coarse node is: the two nodes merged in a coarse node
+    are set apart along a random direction at their target distance.
+    Returns -1 if memory is missing, leaving the positions of g as they are.
+    */
+    unsigned int dim = g -> embedding_dimension;
+    unsigned int * first = (unsigned int *) malloc(sizeof(unsigned int)*(coarse -> N_nodes + 1));
+    float * direction = (float *) malloc(sizeof(float)*dim);
+    if (first == NULL || direction == NULL)
+    {
+        free(first);
+        free(direction);
+        return -1;
+    }
+    for (unsigned int c = 0; c < coarse -> N_nodes; c++) first[c] = UNMATCHED;
+    for (unsigned int n = 0; n < g -> N_nodes; n++)
+    {
+        float * center = POSITION(coarse, parent[n]);
+        if (first[parent[n]] == UNMATCHED)
+        {
+            first[parent[n]] = n;
+            memcpy(POSITION(g, n), center, sizeof(float)*dim);
+            continue;
+        }
+        unsigned int mate = first[parent[n]];
+        size_t slot = child_slot_by_child_name(g, mate, n);
+        float half = (slot == (size_t) -1) ? 0. : 0.5*g -> distances[slot];
+        float norm = 0.;
+        while (norm < 1e-6)
+        {
+            norm = 0.;
+            for (unsigned int d = 0; d < dim; d++)
+            {
+                direction[d] = rng_uniform(&(g -> rng_state)) - 0.5;
+                norm += direction[d]*direction[d];
+            }
+        }
+        norm = sqrtf(norm);
+        for (unsigned int d = 0; d < dim; d++)
+        {
+            POSITION(g, mate)[d] = center[d] + half*direction[d]/norm;
+            POSITION(g, n)[d] = center[d] - half*direction[d]/norm;
+        }
+    }
+    free(first);
+    free(direction);
+    return 0;
+}
+
+// cnets.Graph python type -----------------------------------------------------------------------------------------------
+
+static void Graph_clear(Graph * self)
+{
+    // The arrays of a file-backed graph belong to the map, that goes with the last view of the positions
+    if (self -> mapping == NULL)
+    {
+        free(self -> values);
+        free(self -> offsets);
+        free(self -> childs);
+        free(self -> distances);
+    }
+    self -> values = NULL;
+    self -> offsets = NULL;
+    self -> childs = NULL;
+    self -> distances = NULL;
+    self -> positions = NULL;
+    Py_CLEAR(self -> positions_array);
+    Py_CLEAR(self -> mapping);
+    bhtree_free(&(self -> bhtree));
+    self -> N_nodes = 0;
+    self -> N_links = 0;
+}
+
+static void Graph_dealloc(Graph * self)
+{
+    Graph_clear(self);
+    Py_TYPE(self) -> tp_free((PyObject *) self);
+}
+
+// Python enters here first 90% of the time
+static int Graph_init(Graph * self, PyObject * args, PyObject * kwargs){
+
+    static char * kwlist[] = {"links", "values", "dim", "seed", NULL};
+
+    // The PyObjs for the links and the values
+    PyObject * Psparse = NULL;
+    PyObject * Pvalues = NULL;
+    unsigned int embedding_dim = 0;
+    int seed = RAND_INIT;
+
+    // The C links buffer and the values array
+    EdgeBuffer links;
+    float * values = NULL;
+    unsigned int N_elements = 0;
+
+    // Take the args and divide them in two pyobjects
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOI|i", kwlist, &Psparse, &Pvalues, &embedding_dim, &seed))
+    {
+        errprint("init_network got bad arguments\n");
+        return -1;
+    }
+    if (embedding_dim == 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "embedding dimension must be positive");
+        return -1;
+    }
+    double conversion_start = wall_time();
+
+    // Links are read in place when a buffer is given
+    if (EdgeBuffer_from_object(Psparse, &links) < 0) return -1;
+    values = PyObject_to_float(Pvalues, &N_elements);
+    if (values == NULL)
+    {
+        EdgeBuffer_release(&links);
+        return -1;
+    }
+
+    if (links.N_links < 1 ||  N_elements < 2)
+    {
+        errprint("invalid network G = (%d, %ld)\n", N_elements, links.N_links);
+        EdgeBuffer_release(&links);
+        free(values);
+        PyErr_SetString(PyExc_ValueError, "network must have at least two nodes and one link");
+        return -1;
+    }
+    for (unsigned long k = 0; k < links.N_links; k++)
+    {
+        if (edge_i(&links, k) >= N_elements || edge_j(&links, k) >= N_elements)
+        {
+            PyErr_Format(PyExc_IndexError, "link %lu refers to a node out of range (%u nodes)", k, N_elements);
+            EdgeBuffer_release(&links);
+            free(values);
+            return -1;
+        }
+    }
+
+    if (self -> busy)
+    {
+        EdgeBuffer_release(&links);
+        free(values);
+        PyErr_SetString(PyExc_RuntimeError, "graph is busy in another thread");
+        return -1;
+    }
+
+    // A second __init__ call replaces the previous graph
+    Graph_clear(self);
+    self -> negative_sampling_fraction = NEGATIVE_SAMPLING_FRACTION;
+    self -> negatives_per_node = 0;
+    self -> num_threads = NUM_THREADS;
+    self -> stats = (MDEStats) {0};
+    self -> stats.distortion_estimate = NAN;
+    self -> stats.estimate_every = STATS_ESTIMATE_EVERY;
+    self -> stats.estimate_sample = STATS_ESTIMATE_SAMPLE;
+
+    int result = to_Net(self, &links, values, N_elements);
+    EdgeBuffer_release(&links);
+    free(values);
+    if (result < 0)
+    {
+        Graph_clear(self);
+        return -1;
+    }
+    self -> embedding_dimension = embedding_dim;
+    infoprint("generated network with %u nodes and %lu links\n", self -> N_nodes, self -> N_links);
+
+    // Initializes the position randomly
+    if (random_init(self, seed) < 0)
+    {
+        Graph_clear(self);
+        return -1;
+    }
+    infoprint("random initialization in R%d\n", self -> embedding_dimension);
+    if (nancheck(self) < 0) return -1;
+    self -> stats.time_conversion += wall_time() - conversion_start;
+    return 0;
+}
+
+static int Graph_check_initialized(Graph * self)
+{
+    if (self == NULL || self -> positions_array == NULL)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "network is not initialized");
+        return -1;
+    }
+    if (self -> busy)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "graph is busy in another thread");
+        return -1;
+    }
+    return 0;
+}
+
+static int Graph_check_resizable(Graph * self)
+{
+    /* Writable file-backed graphs can't change size, private ones are moved to memory first */
+    GraphMap * map = graph_mapping(self);
+    if (map == NULL) return 0;
+    if (map -> writable)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "links and nodes of a writable file-backed graph can't be added or removed");
+        return -1;
+    }
+    return graph_unmap(self);
+}
+
+static PyObject * Graph_mde(Graph * self, PyObject * args, PyObject * kwargs){
+    static char * kwlist[] = {"eps", "neg_eps", "Nsteps", "repulsion", "theta",
+                              "tol", "window", "schedule", "final_ratio", "optimizer", "momentum",
+                              "callback", "callback_every", "start", "samples", "weights", NULL};
+    MDEParams params = MDE_DEFAULT_PARAMS;
+    const char * repulsion = "sampled", * schedule = "constant", * optimizer = "sgd";
+    Py_ssize_t samples = 0;
+    PyObject * Pweights = Py_None;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "ffI|sffIsfsfOIInO", kwlist,
+                                     &params.eps, &params.neg_eps, &params.number_of_steps, &repulsion, &params.theta,
+                                     &params.tol, &params.window, &schedule, &params.final_ratio, &optimizer, &params.momentum,
+                                     &params.callback, &params.callback_every, &params.start, &samples, &Pweights))
+    {
+        errprint("parsing MDE args\n");
+        return NULL;
+    }
+    if (params.start > params.number_of_steps)
+    {
+        PyErr_SetString(PyExc_ValueError, "start must not exceed Nsteps");
+        return NULL;
+    }
+    if (params.callback == Py_None) params.callback = NULL;
+    if (params.callback != NULL && !PyCallable_Check(params.callback))
+    {
+        PyErr_SetString(PyExc_TypeError, "callback must be callable or None");
+        return NULL;
+    }
+    if (params.callback_every == 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "callback_every must be positive");
+        return NULL;
+    }
+    if (params.tol < 0. || params.window == 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "tol must be non negative and window positive");
+        return NULL;
+    }
+    if (params.final_ratio <= 0. || params.momentum < 0. || params.momentum >= 1.)
+    {
+        PyErr_SetString(PyExc_ValueError, "final_ratio must be positive and momentum in [0, 1)");
+        return NULL;
+    }
+    if (strcmp(schedule, "constant") == 0) params.schedule = SCHEDULE_CONSTANT;
+    else if (strcmp(schedule, "exponential") == 0) params.schedule = SCHEDULE_EXPONENTIAL;
+    else if (strcmp(schedule, "cosine") == 0) params.schedule = SCHEDULE_COSINE;
+    else
+    {
+        PyErr_Format(PyExc_ValueError, "unknown schedule '%s' (must be 'constant', 'exponential' or 'cosine')", schedule);
+        return NULL;
+    }
+    if (strcmp(optimizer, "sgd") == 0) params.optimizer = OPTIMIZER_SGD;
+    else if (strcmp(optimizer, "momentum") == 0) params.optimizer = OPTIMIZER_MOMENTUM;
+    else if (strcmp(optimizer, "adam") == 0) params.optimizer = OPTIMIZER_ADAM;
+    else if (strcmp(optimizer, "edges") == 0) params.optimizer = OPTIMIZER_EDGES;
+    else
+    {
+        PyErr_Format(PyExc_ValueError, "unknown optimizer '%s' (must be 'sgd', 'momentum', 'adam' or 'edges')", optimizer);
+        return NULL;
+    }
+    if (samples < 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "samples must be non negative");
+        return NULL;
+    }
+    params.samples = (size_t) samples;
+    if (strcmp(repulsion, "sampled") == 0)
+    {
+        params.repulsion = REPULSION_SAMPLED;
+    }
+    else if (strcmp(repulsion, "barneshut") == 0)
+    {
+        if (self -> embedding_dimension != 2 && self -> embedding_dimension != 3)
+        {
+            PyErr_SetString(PyExc_ValueError, "barneshut repulsion is available only in 2D and 3D embeddings");
+            return NULL;
+        }
+        params.repulsion = REPULSION_BARNES_HUT;
+    }
+    else
+    {
+        PyErr_Format(PyExc_ValueError, "unknown repulsion '%s' (must be 'sampled' or 'barneshut')", repulsion);
+        return NULL;
+    }
+    if (params.optimizer == OPTIMIZER_EDGES && params.repulsion == REPULSION_BARNES_HUT)
+    {
+        PyErr_SetString(PyExc_ValueError, "the edges optimizer uses sampled repulsion only");
+        return NULL;
+    }
+
+    // One weight for each slot, the links are drawn with a chance proportional to them
+    PyArrayObject * weights_array = NULL;
+    if (Pweights != Py_None)
+    {
+        weights_array = (PyArrayObject *) PyArray_FROMANY(Pweights, NPY_FLOAT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+        if (weights_array == NULL) return NULL;
+        float * weights = (float *) PyArray_DATA(weights_array);
+        double total = 0.;
+        bool valid = (PyArray_SIZE(weights_array) == (npy_intp) self -> offsets[self -> N_nodes]);
+        for (npy_intp k = 0; valid && k < PyArray_SIZE(weights_array); k++)
+        {
+            valid = (weights[k] >= 0. && isfinite(weights[k]));
+            total += weights[k];
+        }
+        if (!valid || !(total > 0.))
+        {
+            PyErr_SetString(PyExc_ValueError, "weights must be one non negative number for each slot, with a positive sum");
+            Py_DECREF(weights_array);
+            return NULL;
+        }
+        params.weights = weights;
+    }
+    if (nancheck(self) < 0)
+    {
+        Py_XDECREF(weights_array);
+        return NULL;
+    }
+    infoprint("starting MDE with eps = %.3lf, neg_eps = %.3lf, Nsteps = %d\n", params.eps, params.neg_eps, params.number_of_steps);
+
+    // Other python threads can run during the embedding
+    unsigned int steps_done;
+    self -> busy = true;
+    Py_XINCREF(params.callback);
+    Py_BEGIN_ALLOW_THREADS
+    steps_done = MDE(self, &params);
+    Py_END_ALLOW_THREADS
+    Py_XDECREF(params.callback);
+    Py_XDECREF(weights_array);
+    self -> busy = false;
+    if (PROGRESS_BAR_VISIBLE) printf("\n");
+    progress_bar_status = 0;
+    if (PyErr_Occurred()) return NULL;      // Raised by the callback or out of memory
+    infoprint("MDE end after %u steps\n", steps_done);
+    graph_sync_header(self);
+    if (nancheck(self) < 0) return NULL;
+    return PyLong_FromUnsignedLong(steps_done);
+}
+
+static PyObject * positions_view(Graph * self)
+{
+    /* A read-only view of the positions that keeps the block alive */
+    PyArrayObject * view = (PyArrayObject *) PyArray_View((PyArrayObject *) self -> positions_array, NULL, NULL);
+    if (view == NULL) return NULL;
+    PyArray_CLEARFLAGS(view, NPY_ARRAY_WRITEABLE);
+    return (PyObject *) view;
+}
+
+static PyObject * Graph_get_positions(Graph * self, PyObject * args, PyObject * kwargs){
+    /* Returns the positions as a (N, dim) float32 array.
+
+    By default the position block is copied (a single memcpy),
+    if copy=False a read-only view is returned instead: it stays valid
+    after the graph is deleted but it is updated in place by mde().
+    */
+    static char * kwlist[] = {"copy", NULL};
+    int copy = 1;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|p", kwlist, &copy))
+    {
+        return NULL;
+    }
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (nancheck(self) < 0) return NULL;
+    if (copy)
+    {
+        double start = wall_time();
+        PyObject * positions = PyArray_NewCopy((PyArrayObject *) self -> positions_array, NPY_CORDER);
+        self -> stats.time_conversion += wall_time() - start;
+        return positions;
+    }
+    return positions_view(self);
+}
+
+static PyObject * Graph_positions(Graph * self, void * closure)
+{
+    if (Graph_check_initialized(self) < 0) return NULL;
+    return positions_view(self);
+}
+
+static PyObject * Graph_distortion(Graph * self, PyObject * Py_UNUSED(args))
+{
+    if (Graph_check_initialized(self) < 0) return NULL;
+    return PyFloat_FromDouble(get_distortion(self));
+}
+
+static PyObject * Graph_get_distanceSM(Graph * self, PyObject * Py_UNUSED(args))
+{
+    if (Graph_check_initialized(self) < 0) return NULL;
+
+    PyObject * distanceSM = PyList_New(self -> N_nodes*self -> N_nodes); // Mmmh, not so clever! N**2 - > 9*N**2
+    float d;
+    long row_index = 0;
+
+    for (unsigned int node_index = 0; node_index < self -> N_nodes; node_index++)
+    {   
+        for (unsigned int another_node_index = 0; another_node_index < self -> N_nodes; another_node_index++)
+        {   
+            PyObject * row = PyList_New(3);
+
+            d = euclidean_distance(POSITION(self, node_index), POSITION(self, another_node_index), self -> embedding_dimension);
+            PyList_SetItem(row, 0, PyLong_FromLong(node_index));
+            PyList_SetItem(row, 1, PyLong_FromLong(another_node_index));
+            PyList_SetItem(row, 2, PyFloat_FromDouble(d));
+
+            PyList_SetItem(distanceSM, row_index, row);
+            row_index ++;
+        }
+        
+    }
+    return distanceSM;
+}
+
+PyObject * matrix_to_list_of_list(float **mat, unsigned int N)
+{
+    /* Returns a matrix as list of lists (lol).
+        Waiting to implement numpy arrays. */
+    PyObject * lol = PyList_New(N);
+
+    for (unsigned int i = 0; i < N; i++)
+    {   
+        PyObject * i_th_row = PyList_New(N);
+        for (unsigned int j = 0; j < N; j++)
+        {   
+            PyList_SetItem(i_th_row, j , PyFloat_FromDouble((double) mat[i][j]));
+        }
+        PyList_SetItem(lol, i , i_th_row);  
+    }
+    return lol;
+}
+
+static PyObject * Graph_get_distanceM(Graph * self, PyObject * Py_UNUSED(args))
+{
+    if (Graph_check_initialized(self) < 0) return NULL;
+    infoprint("getting distances\n");
+    /* Returns a matrix of distances as list of lists.
+        Waiting to implement numpy arrays. */
+    float ** distanceM = (float**) malloc(sizeof(float*)*self -> N_nodes);
+    for (unsigned int k=0; k< self -> N_nodes; k ++)
+    {
+        distanceM[k] = (float*) malloc(sizeof(float)*self -> N_nodes);
+    }
+    float d;
+
+    for (unsigned int node_index = 0; node_index < self -> N_nodes; node_index++)
+    {   
+        for (unsigned int another_node_index = node_index; another_node_index < self -> N_nodes; another_node_index++)
+        {   
+            d = euclidean_distance(POSITION(self, node_index), POSITION(self, another_node_index), self -> embedding_dimension);
+            distanceM[node_index][another_node_index] = d;
+            distanceM[another_node_index][node_index] = d;
+        }        
+    }
+    PyObject * lol = matrix_to_list_of_list(distanceM, self -> N_nodes);
+    for (unsigned int k=0; k< self -> N_nodes; k ++)
+    {
+        free(distanceM[k]);
+    }
+    free(distanceM);
+    return lol;
+}
+
+static PyObject * Graph_set_target(Graph * self, PyObject * args)
+{
+    // printf("cnets - updating target distances\n");
+    PyObject * PySM;
+    EdgeBuffer links;
+    unsigned int node1_number, node2_number;
+    size_t slot1, slot2;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if(! PyArg_ParseTuple(args, "O", &PySM))
+    {
+        errprint("set_target: paring failed\n");
+        return NULL;
+    }
+    double start = wall_time();
+    if (EdgeBuffer_from_object(PySM, &links) < 0) return NULL;
+    for (unsigned long link = 0; link < links.N_links; link++)
+    {
+        node1_number = edge_i(&links, link);
+        node2_number = edge_j(&links, link);
+        if (node1_number >= self -> N_nodes || node2_number >= self -> N_nodes)
+        {
+            warnprint("set_target - link (%u, %u) skipped: node out of range\n", node1_number, node2_number);
+            continue;
+        }
+        slot1 = child_slot_by_child_name(self, node1_number, node2_number);
+        slot2 = child_slot_by_child_name(self, node2_number, node1_number);
+        if (slot1 == (size_t) -1 || slot2 == (size_t) -1)
+        {
+            warnprint("set_target - link (%u, %u) skipped: nodes are not linked\n", node1_number, node2_number);
+            continue;
+        }
+        self -> distances[slot1] = edge_d(&links, link);
+        self -> distances[slot2] = edge_d(&links, link);
+    }
+    EdgeBuffer_release(&links);
+    self -> stats.time_conversion += wall_time() - start;
+    Py_RETURN_NONE;
+}
+
+static PyObject * Graph_link_slots(Graph * self, PyObject * args)
+{
+    // Positions of the links i -> j and j -> i in the adjacency arrays,
+    // to be resolved once and given back to update_targets
+    PyObject * Pyi, * Pyj;
+    PyArrayObject * i_array, * j_array;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (!PyArg_ParseTuple(args, "OO", &Pyi, &Pyj)) return NULL;
+
+    i_array = (PyArrayObject *) PyArray_FROMANY(Pyi, NPY_UINT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    j_array = (PyArrayObject *) PyArray_FROMANY(Pyj, NPY_UINT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (i_array == NULL || j_array == NULL)
+    {
+        Py_XDECREF(i_array);
+        Py_XDECREF(j_array);
+        return NULL;
+    }
+    if (PyArray_SIZE(i_array) != PyArray_SIZE(j_array))
+    {
+        PyErr_SetString(PyExc_ValueError, "i and j must have the same length");
+        Py_DECREF(i_array);
+        Py_DECREF(j_array);
+        return NULL;
+    }
+
+    npy_intp dims[2] = {PyArray_SIZE(i_array), 2};
+    PyObject * slots_array = PyArray_SimpleNew(2, dims, NPY_INT64);
+    if (slots_array == NULL)
+    {
+        Py_DECREF(i_array);
+        Py_DECREF(j_array);
+        return NULL;
+    }
+    unsigned int * i = (unsigned int *) PyArray_DATA(i_array);
+    unsigned int * j = (unsigned int *) PyArray_DATA(j_array);
+    int64_t * slots = (int64_t *) PyArray_DATA((PyArrayObject *) slots_array);
+
+    #pragma omp parallel for num_threads(self -> num_threads)
+    for (npy_intp link = 0; link < dims[0]; link++)
+    {
+        if (i[link] >= self -> N_nodes || j[link] >= self -> N_nodes)
+        {
+            slots[2*link] = slots[2*link + 1] = -1;
+            continue;
+        }
+        slots[2*link] = (int64_t) child_slot_by_child_name(self, i[link], j[link]);
+        slots[2*link + 1] = (int64_t) child_slot_by_child_name(self, j[link], i[link]);
+    }
+    Py_DECREF(i_array);
+    Py_DECREF(j_array);
+    return slots_array;
+}
+
+static PyObject * Graph_update_targets(Graph * self, PyObject * args)
+{
+    // Sets the target distances of the slots given by link_slots (negative slots are skipped)
+    PyObject * Pyslots, * Pyd;
+    PyArrayObject * slots_array, * d_array;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (!PyArg_ParseTuple(args, "OO", &Pyslots, &Pyd)) return NULL;
+
+    slots_array = (PyArrayObject *) PyArray_FROMANY(Pyslots, NPY_INT64, 1, 2, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    d_array = (PyArrayObject *) PyArray_FROMANY(Pyd, NPY_FLOAT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (slots_array == NULL || d_array == NULL)
+    {
+        Py_XDECREF(slots_array);
+        Py_XDECREF(d_array);
+        return NULL;
+    }
+    npy_intp N_links = PyArray_DIM(slots_array, 0);
+    npy_intp per_link = (PyArray_NDIM(slots_array) == 2) ? PyArray_DIM(slots_array, 1) : 1;
+    if (PyArray_SIZE(d_array) != N_links)
+    {
+        PyErr_SetString(PyExc_ValueError, "one distance must be given for each row of slots");
+        Py_DECREF(slots_array);
+        Py_DECREF(d_array);
+        return NULL;
+    }
+    int64_t * slots = (int64_t *) PyArray_DATA(slots_array);
+    float * d = (float *) PyArray_DATA(d_array);
+    int64_t N_slots = (int64_t) self -> offsets[self -> N_nodes];
+    for (npy_intp k = 0; k < N_links*per_link; k++)
+    {
+        if (slots[k] >= N_slots)
+        {
+            PyErr_Format(PyExc_IndexError, "slot %lld out of range", (long long) slots[k]);
+            Py_DECREF(slots_array);
+            Py_DECREF(d_array);
+            return NULL;
+        }
+    }
+    for (npy_intp k = 0; k < N_links*per_link; k++)
+    {
+        if (slots[k] >= 0) self -> distances[slots[k]] = d[k/per_link];
+    }
+    Py_DECREF(slots_array);
+    Py_DECREF(d_array);
+    Py_RETURN_NONE;
+}
+
+static PyArrayObject * node_array(PyObject * obj)
+{
+    return (PyArrayObject *) PyArray_FROMANY(obj, NPY_UINT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+}
+
+static int Graph_replace_positions(Graph * self, unsigned int N_nodes, unsigned int N_copied)
+{
+    /* Moves the positions to a new (N_nodes, dim) block, copying the first N_copied rows */
+    npy_intp dims[2] = {N_nodes, self -> embedding_dimension};
+    PyObject * positions_array = PyArray_ZEROS(2, dims, NPY_FLOAT32, 0);
+    if (positions_array == NULL) return -1;
+    float * positions = (float *) PyArray_DATA((PyArrayObject *) positions_array);
+    memcpy(positions, self -> positions, sizeof(float)*N_copied*self -> embedding_dimension);
+    Py_SETREF(self -> positions_array, positions_array);
+    self -> positions = positions;
+    return 0;
+}
+
+static PyObject * Graph_add_links(Graph * self, PyObject * args, PyObject * kwargs)
+{
+    /* Inserts links keeping the embedding: nodes out of range are created and placed near their neighbours */
+    static char * kwlist[] = {"i", "j", "d", "N", NULL};
+    PyObject * Pyi, * Pyj, * Pyd;
+    PyArrayObject * i_array, * j_array, * d_array;
+    unsigned int N_max = REMOVED_CHILD;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (Graph_check_resizable(self) < 0) return NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOO|I", kwlist, &Pyi, &Pyj, &Pyd, &N_max)) return NULL;
+    i_array = node_array(Pyi);
+    j_array = node_array(Pyj);
+    d_array = (PyArrayObject *) PyArray_FROMANY(Pyd, NPY_FLOAT32, 1, 1, NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (i_array == NULL || j_array == NULL || d_array == NULL) goto fail;
+
+    npy_intp N_new = PyArray_SIZE(i_array);
+    if (PyArray_SIZE(j_array) != N_new || PyArray_SIZE(d_array) != N_new)
+    {
+        PyErr_SetString(PyExc_ValueError, "i, j and d must have the same length");
+        goto fail;
+    }
+    unsigned int * i = (unsigned int *) PyArray_DATA(i_array);
+    unsigned int * j = (unsigned int *) PyArray_DATA(j_array);
+    float * d = (float *) PyArray_DATA(d_array);
+
+    unsigned int N_old = self -> N_nodes, N_nodes = N_old;
+    for (npy_intp k = 0; k < N_new; k++)
+    {
+        if (i[k] >= N_max || j[k] >= N_max)
+        {
+            PyErr_Format(PyExc_IndexError, "node index out of range (at most %u nodes)", N_max);
+            goto fail;
+        }
+        if (i[k] + 1 > N_nodes) N_nodes = i[k] + 1;
+        if (j[k] + 1 > N_nodes) N_nodes = j[k] + 1;
+    }
+    if (N_nodes > N_old)
+    {
+        // The rows are resized first: on failure the positions are still those of the N_old nodes
+        if (graph_resize(self, N_nodes) < 0)
+        {
+            PyErr_NoMemory();
+            goto fail;
+        }
+        if (Graph_replace_positions(self, N_nodes, N_old) < 0)
+        {
+            self -> N_nodes = N_old;
+            goto fail;
+        }
+    }
+    long inserted = graph_insert_links(self, i, j, d, (size_t) N_new);
+    if (inserted < 0)
+    {
+        PyErr_NoMemory();
+        goto fail;
+    }
+    if (N_nodes > N_old && graph_place_nodes(self, N_old) < 0)
+    {
+        PyErr_NoMemory();
+        goto fail;
+    }
+
+    Py_DECREF(i_array);
+    Py_DECREF(j_array);
+    Py_DECREF(d_array);
+    return PyLong_FromLong(inserted);
+
+fail:
+    Py_XDECREF(i_array);
+    Py_XDECREF(j_array);
+    Py_XDECREF(d_array);
+    return NULL;
+}
+
+static PyObject * Graph_remove_links(Graph * self, PyObject * args)
+{
+    PyObject * Pyi, * Pyj;
+    PyArrayObject * i_array, * j_array;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (Graph_check_resizable(self) < 0) return NULL;
+    if (!PyArg_ParseTuple(args, "OO", &Pyi, &Pyj)) return NULL;
+    i_array = node_array(Pyi);
+    j_array = node_array(Pyj);
+    if (i_array == NULL || j_array == NULL)
+    {
+        Py_XDECREF(i_array);
+        Py_XDECREF(j_array);
+        return NULL;
+    }
+    if (PyArray_SIZE(i_array) != PyArray_SIZE(j_array))
+    {
+        PyErr_SetString(PyExc_ValueError, "i and j must have the same length");
+        Py_DECREF(i_array);
+        Py_DECREF(j_array);
+        return NULL;
+    }
+    long deleted = graph_delete_links(self, (unsigned int *) PyArray_DATA(i_array),
+                                      (unsigned int *) PyArray_DATA(j_array), PyArray_SIZE(i_array));
+    Py_DECREF(i_array);
+    Py_DECREF(j_array);
+    return PyLong_FromLong(deleted);
+}
+
+static PyObject * Graph_remove_nodes(Graph * self, PyObject * args)
+{
+    /* Deletes nodes and their links, the following nodes are renumbered keeping their order */
+    PyObject * Pynodes;
+    PyArrayObject * nodes_array;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (Graph_check_resizable(self) < 0) return NULL;
+    if (!PyArg_ParseTuple(args, "O", &Pynodes)) return NULL;
+    nodes_array = node_array(Pynodes);
+    if (nodes_array == NULL) return NULL;
+
+    unsigned int * nodes = (unsigned int *) PyArray_DATA(nodes_array);
+    bool * removed = (bool *) calloc(self -> N_nodes + 1, sizeof(bool));
+    unsigned int N_removed = 0;
+    if (removed == NULL)
+    {
+        Py_DECREF(nodes_array);
+        return PyErr_NoMemory();
+    }
+    for (npy_intp k = 0; k < PyArray_SIZE(nodes_array); k++)
+    {
+        if (nodes[k] >= self -> N_nodes)
+        {
+            PyErr_Format(PyExc_IndexError, "node %u out of range (%u nodes)", nodes[k], self -> N_nodes);
+            free(removed);
+            Py_DECREF(nodes_array);
+            return NULL;
+        }
+        if (!removed[nodes[k]]) N_removed++;
+        removed[nodes[k]] = true;
+    }
+    Py_DECREF(nodes_array);
+
+    npy_intp dims[2] = {self -> N_nodes - N_removed, self -> embedding_dimension};
+    PyObject * positions_array = PyArray_ZEROS(2, dims, NPY_FLOAT32, 0);
+    if (positions_array == NULL)
+    {
+        free(removed);
+        return NULL;
+    }
+    if (graph_delete_nodes(self, removed, (float *) PyArray_DATA((PyArrayObject *) positions_array)) < 0)
+    {
+        free(removed);
+        Py_DECREF(positions_array);
+        return PyErr_NoMemory();
+    }
+    Py_SETREF(self -> positions_array, positions_array);
+    free(removed);
+    Py_RETURN_NONE;
+}
+
+static PyObject * Graph_refine(Graph * self, PyObject * args, PyObject * kwargs)
+{
+    /* MDE steps that move only the given nodes and those within hops links from them */
+    static char * kwlist[] = {"nodes", "eps", "neg_eps", "Nsteps", "hops", NULL};
+    MDEParams params = MDE_DEFAULT_PARAMS;
+    unsigned int hops = 1;
+    PyObject * Pynodes;
+    PyArrayObject * nodes_array;
+
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OffI|I", kwlist, &Pynodes,
+                                     &params.eps, &params.neg_eps, &params.number_of_steps, &hops))
+    {
+        return NULL;
+    }
+    nodes_array = node_array(Pynodes);
+    if (nodes_array == NULL) return NULL;
+    unsigned int * neighbourhood = (unsigned int *) malloc(sizeof(unsigned int)*(self -> N_nodes + 1));
+    if (neighbourhood == NULL)
+    {
+        Py_DECREF(nodes_array);
+        return PyErr_NoMemory();
+    }
+    long N_local = graph_neighbourhood(self, (unsigned int *) PyArray_DATA(nodes_array),
+                                       PyArray_SIZE(nodes_array), hops, neighbourhood);
+    Py_DECREF(nodes_array);
+    if (N_local < 0)
+    {
+        free(neighbourhood);
+        return PyErr_NoMemory();
+    }
+
+    self -> busy = true;
+    Py_BEGIN_ALLOW_THREADS
+    local_MDE(self, neighbourhood, (size_t) N_local, &params);
+    Py_END_ALLOW_THREADS
+    self -> busy = false;
+    free(neighbourhood);
+    graph_sync_header(self);
+    if (nancheck(self) < 0) return NULL;
+    return PyLong_FromLong(N_local);
+}
+
+static PyObject * Graph_get_stats(Graph * self, PyObject * Py_UNUSED(args))
+{
+    /* What the graph has done since it was created (or since reset_stats).
+       Counters are only read, so it can be called while the graph is busy */
+    if (self == NULL || self -> positions_array == NULL)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "network is not initialized");
+        return NULL;
+    }
+    MDEStats * stats = &(self -> stats);
+    double time_total = (stats -> time_total > 0.) ? stats -> time_total : NAN;
+    return Py_BuildValue("{s:k,s:d,s:d,s:d,s:d,s:d,s:d,s:d,s:d,s:K,s:d,s:d}",
+                         "steps", stats -> steps,
+                         "time_total", stats -> time_total,
+                         "time_attraction", stats -> time_attraction,
+                         "time_repulsion", stats -> time_repulsion,
+                         "time_update", stats -> time_update,
+                         "time_distortion", stats -> time_distortion,
+                         "time_conversion", stats -> time_conversion,
+                         "time_callback", stats -> time_callback,
+                         "steps_per_second", stats -> steps/time_total,
+                         "edge_samples", stats -> edge_samples,
+                         "edges_per_second", stats -> edge_samples/time_total,
+                         "distortion_estimate", (double) stats -> distortion_estimate);
+}
+
+static PyObject * Graph_reset_stats(Graph * self, PyObject * Py_UNUSED(args))
+{
+    unsigned int every = self -> stats.estimate_every, sample = self -> stats.estimate_sample;
+    self -> stats = (MDEStats) {0};
+    self -> stats.distortion_estimate = NAN;
+    self -> stats.estimate_every = every;
+    self -> stats.estimate_sample = sample;
+    Py_RETURN_NONE;
+}
+
+static PyObject * Graph_save(Graph * self, PyObject * args, PyObject * kwargs)
+{
+    /* Writes a checkpoint. It can be called from an MDE callback, while the other threads wait */
+    static char * kwlist[] = {"path", "step", "order", NULL};
+    PyObject * path = NULL;
+    unsigned long long step = 0;
+    PyObject * Pstep = Py_None, * Porder = Py_None;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&|OO", kwlist, PyUnicode_FSConverter, &path, &Pstep, &Porder)) return NULL;
+    if ((self == NULL || !self -> in_callback) && Graph_check_initialized(self) < 0)
+    {
+        Py_DECREF(path);
+        return NULL;
+    }
+    if (Pstep == Py_None)
+    {
+        step = self -> stats.steps;
+    }
+    else
+    {
+        step = PyLong_AsUnsignedLongLong(Pstep);
+        if (PyErr_Occurred())
+        {
+            Py_DECREF(path);
+            return NULL;
+        }
+    }
+
+    // The order must be a permutation of the nodes
+    PyArrayObject * order_array = NULL;
+    unsigned int * order = NULL;
+    if (Porder != Py_None)
+    {
+        order_array = node_array(Porder);
+        bool * seen = (bool *) calloc(self -> N_nodes + 1, sizeof(bool));
+        if (order_array == NULL || seen == NULL)
+        {
+            if (order_array != NULL) PyErr_NoMemory();
+            Py_XDECREF(order_array);
+            free(seen);
+            Py_DECREF(path);
+            return NULL;
         }
-    }while(child_local_index_by_child_name(node, not_child) != (unsigned int)-1 || node == not_child);
-    float dist = euclidean_distance(G.nodes[node].position, G.nodes[not_child].position, G.embedding_dimension);
-    for (unsigned int d = 0; d < G.embedding_dimension; d++)
+        order = (unsigned int *) PyArray_DATA(order_array);
+        bool valid = (PyArray_SIZE(order_array) == self -> N_nodes);
+        for (unsigned int n = 0; valid && n < self -> N_nodes; n++)
+        {
+            valid = (order[n] < self -> N_nodes && !seen[order[n]]);
+            if (valid) seen[order[n]] = true;
+        }
+        free(seen);
+        if (!valid)
+        {
+            PyErr_SetString(PyExc_ValueError, "order must be a permutation of the nodes");
+            Py_DECREF(order_array);
+            Py_DECREF(path);
+            return NULL;
+        }
+    }
+
+    int result;
+    bool was_busy = self -> busy;
+    double start = wall_time();
+    self -> busy = true;
+    Py_BEGIN_ALLOW_THREADS
+    result = graph_save(self, PyBytes_AS_STRING(path), step, order);
+    Py_END_ALLOW_THREADS
+    self -> busy = was_busy;
+    self -> stats.time_conversion += wall_time() - start;
+    Py_XDECREF(order_array);
+    if (result < 0)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, PyBytes_AS_STRING(path));
+        Py_DECREF(path);
+        return NULL;
+    }
+    Py_DECREF(path);
+    Py_RETURN_NONE;
+}
+
+static PyObject * Graph_load(PyTypeObject * type, PyObject * args)
+{
+    PyObject * path = NULL;
+    if (!PyArg_ParseTuple(args, "O&", PyUnicode_FSConverter, &path)) return NULL;
+    Graph * graph = (Graph *) type -> tp_alloc(type, 0);
+    if (graph == NULL)
+    {
+        Py_DECREF(path);
+        return NULL;
+    }
+    double start = wall_time();
+    if (graph_load(graph, PyBytes_AS_STRING(path)) < 0)
+    {
+        Py_DECREF(path);
+        Py_DECREF(graph);
+        return NULL;
+    }
+    graph -> stats.time_conversion = wall_time() - start;
+    infoprint("loaded checkpoint with %u nodes and %lu links at step %lu\n", graph -> N_nodes, graph -> N_links, graph -> stats.steps);
+    Py_DECREF(path);
+    return (PyObject *) graph;
+}
+
+static PyObject * Graph_open(PyTypeObject * type, PyObject * args, PyObject * kwargs)
+{
+    static char * kwlist[] = {"path", "writable", "validate", NULL};
+    PyObject * path = NULL;
+    int writable = 1;
+    int validate = 1;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&|pp", kwlist, PyUnicode_FSConverter, &path, &writable, &validate)) return NULL;
+    Graph * graph = (Graph *) type -> tp_alloc(type, 0);
+    if (graph == NULL)
+    {
+        Py_DECREF(path);
+        return NULL;
+    }
+    if (graph_map(graph, PyBytes_AS_STRING(path), writable, validate) < 0)
+    {
+        Py_DECREF(path);
+        Py_DECREF(graph);
+        return NULL;
+    }
+    infoprint("opened file-backed graph with %u nodes and %lu links at step %lu\n", graph -> N_nodes, graph -> N_links, graph -> stats.steps);
+    Py_DECREF(path);
+    return (PyObject *) graph;
+}
+
+static PyObject * Graph_sync(Graph * self, PyObject * Py_UNUSED(args))
+{
+    /* Writes the changes of a file-backed graph to its file (nothing to do for the other graphs) */
+    if (Graph_check_initialized(self) < 0) return NULL;
+    GraphMap * map = graph_mapping(self);
+    if (map == NULL || !map -> writable) Py_RETURN_NONE;
+    graph_sync_header(self);
+    int result;
+    Py_BEGIN_ALLOW_THREADS
+    result = msync(map -> address, map -> size, MS_SYNC);
+    Py_END_ALLOW_THREADS
+    if (result < 0) return PyErr_SetFromErrno(PyExc_OSError);
+    Py_RETURN_NONE;
+}
+
+static PyObject * Graph_node_order(Graph * self, PyObject * args, PyObject * kwargs)
+{
+    static char * kwlist[] = {"method", NULL};
+    const char * method = "rcm";
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|s", kwlist, &method)) return NULL;
+    if (Graph_check_initialized(self) < 0) return NULL;
+    bool cuthill_mckee;
+    if (strcmp(method, "rcm") == 0) cuthill_mckee = true;
+    else if (strcmp(method, "bfs") == 0) cuthill_mckee = false;
+    else
+    {
+        PyErr_Format(PyExc_ValueError, "unknown order '%s' (must be 'rcm' or 'bfs')", method);
+        return NULL;
+    }
+    npy_intp dims[1] = {self -> N_nodes};
+    PyObject * order_array = PyArray_SimpleNew(1, dims, NPY_UINT32);
+    if (order_array == NULL) return NULL;
+    int result;
+    self -> busy = true;
+    Py_BEGIN_ALLOW_THREADS
+    result = graph_node_order(self, (unsigned int *) PyArray_DATA((PyArrayObject *) order_array), cuthill_mckee);
+    Py_END_ALLOW_THREADS
+    self -> busy = false;
+    if (result < 0)
+    {
+        Py_DECREF(order_array);
+        return PyErr_NoMemory();
+    }
+    Py_SETREF(order_array, PyArray_Cast((PyArrayObject *) order_array, NPY_INT64));
+    return order_array;
+}
+
+static PyObject * Graph_coarsen(Graph * self, PyObject * Py_UNUSED(args))
+{
+    if (Graph_check_initialized(self) < 0) return NULL;
+    if (self -> N_nodes < 2)
+    {
+        PyErr_Format(PyExc_ValueError, "can't coarsen a graph with %u nodes", self -> N_nodes);
+        return NULL;
+    }
+    npy_intp dims[1] = {self -> N_nodes};
+    PyObject * parent_array = PyArray_SimpleNew(1, dims, NPY_UINT32);
+    if (parent_array == NULL) return NULL;
+    Graph * coarse = (Graph *) Py_TYPE(self) -> tp_alloc(Py_TYPE(self), 0);
+    if (coarse == NULL)
     {
-        G.nodes[node].position[d] += eps/(dist*dist)*(G.nodes[node].position[d] - G.nodes[not_child].position[d]);
-        if (isNan(G.nodes[node].position[d])){
-            errprint("NAN detected\n");
-            printf("%d <-> %d = %lf\n", node, not_child, dist);
-            exit(5);
-        }
+        Py_DECREF(parent_array);
+        return NULL;
     }
-    return;
-}
 
-PyObject * MDE(PyObject * self, PyObject * args){
-    float eps = 0., neg_eps = 0.;
-    unsigned int number_of_steps = 0;
+    int result;
+    self -> busy = true;
+    Py_BEGIN_ALLOW_THREADS
+    result = graph_coarsen(self, coarse, (unsigned int *) PyArray_DATA((PyArrayObject *) parent_array));
+    Py_END_ALLOW_THREADS
+    self -> busy = false;
+    if (result < 0)
+    {
+        Py_DECREF(parent_array);
+        Py_DECREF(coarse);
+        return PyErr_NoMemory();
+    }
 
-    if (!PyArg_ParseTuple(args, "ffi", &eps, &neg_eps, &number_of_steps))
+    // The coarse graph runs MDE as the fine one does
+    coarse -> negative_sampling_fraction = self -> negative_sampling_fraction;
+    coarse -> negatives_per_node = self -> negatives_per_node;
+    coarse -> num_threads = self -> num_threads;
+    coarse -> stats.distortion_estimate = NAN;
+    coarse -> stats.estimate_every = self -> stats.estimate_every;
+    coarse -> stats.estimate_sample = self -> stats.estimate_sample;
+    if (random_init(coarse, (int) (rng_next(&(self -> rng_state)) >> 33) | 1) < 0)
     {
-        errprint("parsing MDE args\n");
-        Py_RETURN_NONE;
+        Py_DECREF(parent_array);
+        Py_DECREF(coarse);
+        return NULL;
     }
-    infoprint("starting MDE with eps = %.3lf, neg_eps = %.3lf, Nsteps = %d\n",eps, neg_eps, number_of_steps);
-    nancheck();
-    float actual_distance = 0., factor;
-    unsigned int child_index;
-    for (unsigned int i = 0; i < number_of_steps; i++)
-    {   
-        progress_bar(((float)i)/( (float) number_of_steps) , PROGRESSS_BAR_LENGTH, 1);
-        for (unsigned int current_node = 0; current_node < G.N_nodes; current_node++)
-        {
-            for (unsigned int current_child = 0; current_child < G.nodes[current_node].childs_number; current_child++ )
-            {
-                child_index = G.nodes[current_node].childs[current_child];
-                actual_distance = euclidean_distance(G.nodes[current_node].position, G.nodes[child_index].position, G.embedding_dimension);
-                if (actual_distance == 0.0){
-                    warnprint("MDE - skipped update (zero distance in embedding): link(%d, %d) = %lf",current_node, child_index, G.nodes[current_node].distances[current_child]);
-                }
-                else
-                {              
-                    factor = eps*(1.- G.nodes[current_node].distances[current_child]/actual_distance)/G.nodes[current_node].childs_number;
-                    for (unsigned int d = 0; d < G.embedding_dimension; d++)
-                    {
-                        G.nodes[current_node].position[d] += factor*(G.nodes[child_index].position[d] - G.nodes[current_node].position[d]) ;
-                    }
-                }
-            }
-            if (neg_eps != 0.){
-                for (unsigned int mv_aw = 0; mv_aw < (unsigned int)(NEGATIVE_SAMPLING_FRACTION*G.N_nodes); mv_aw++)
-                {
-                    move_away_from_random_not_child(current_node, neg_eps);
-                }
-            }
-        }
+    infoprint("coarsened %u nodes to %u nodes and %lu links\n", self -> N_nodes, coarse -> N_nodes, coarse -> N_links);
+
+    Py_SETREF(parent_array, PyArray_Cast((PyArrayObject *) parent_array, NPY_INT64));
+    if (parent_array == NULL)
+    {
+        Py_DECREF(coarse);
+        return NULL;
     }
-    printf("\n");
-    infoprint("MDE end\n");
-    nancheck();
-    progress_bar_status = 0;
-    Py_RETURN_NONE;
+    return Py_BuildValue("(NN)", coarse, parent_array);
 }
 
-PyObject * get_positions(PyObject * self, PyObject * args){
-    // infoprint("Checking and passing positions back to python...");
-    nancheck();
-    PyObject * list = PyList_New(G.N_nodes);
-    for (unsigned int n = 0; n < G.N_nodes; n++)
+static PyObject * Graph_prolong(Graph * self, PyObject * args)
+{
+    Graph * coarse = NULL;
+    PyObject * Pparent = NULL;
+    if (!PyArg_ParseTuple(args, "O!O", &GraphType, &coarse, &Pparent)) return NULL;
+    if (Graph_check_initialized(self) < 0 || Graph_check_initialized(coarse) < 0) return NULL;
+    if (coarse -> embedding_dimension != self -> embedding_dimension)
     {
-        PyObject * single = PyList_New(G.embedding_dimension);
-        for (unsigned int d = 0; d < G.embedding_dimension; d++)
-        {
-            PyList_SetItem(single, d, PyFloat_FromDouble(G.nodes[n].position[d]));
-        }
-        PyList_SetItem(list, n, single);
+        PyErr_SetString(PyExc_ValueError, "coarse graph is embedded in a different dimension");
+        return NULL;
+    }
+    PyArrayObject * parent_array = node_array(Pparent);
+    if (parent_array == NULL) return NULL;
+    unsigned int * parent = (unsigned int *) PyArray_DATA(parent_array);
+    bool valid = (PyArray_SIZE(parent_array) == self -> N_nodes);
+    for (unsigned int n = 0; valid && n < self -> N_nodes; n++) valid = (parent[n] < coarse -> N_nodes);
+    if (!valid)
+    {
+        PyErr_SetString(PyExc_ValueError, "parent must give a coarse node for each node");
+        Py_DECREF(parent_array);
+        return NULL;
     }
-    return list;
+    int result;
+    self -> busy = true;
+    coarse -> busy = true;
+    Py_BEGIN_ALLOW_THREADS
+    result = graph_prolong(self, coarse, parent);
+    Py_END_ALLOW_THREADS
+    self -> busy = false;
+    coarse -> busy = false;
+    Py_DECREF(parent_array);
+    if (result < 0) return PyErr_NoMemory();
+    if (nancheck(self) < 0) return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef GraphMethods[] = {
+    {"mde", (PyCFunction)(void(*)(void)) Graph_mde, METH_VARARGS | METH_KEYWORDS, "Executes minumum distortion embedding routine, returns the number of steps done\nARGS\n\teps\t(float)\n\tneg_eps\t(float)\n\tNsteps\t(int)\n\trepulsion\t('sampled' or 'barneshut', default 'sampled')\n\ttheta\t(float, Barnes-Hut opening angle, default 0.5)\n\ttol\t(float, stops when the distortion improves less than tol (relative) in a window, default 0: never)\n\twindow\t(int, steps between two checks of the distortion, default 10)\n\tschedule\t('constant', 'exponential' or 'cosine', default 'constant')\n\tfinal_ratio\t(float, last step over first step of decaying schedules, default 0.01)\n\toptimizer\t('sgd', 'momentum', 'adam' or 'edges', default 'sgd'): 'edges' draws links at random instead of sweeping the nodes,\n\t\tmoves both their nodes and pushes the first away from negatives_per_node (default 1) random nodes\n\tmomentum\t(float, default 0.9)\n\tcallback\t(callable, called as callback(step, positions, stats) with a read-only view of the positions\n\t\tand the dict of get_stats(), a true return value stops the run)\n\tcallback_every\t(int, steps between two calls of callback, default 10)\n\tstart\t(int, first step, to continue a run restored from a checkpoint, default 0)\n\tsamples\t(int, links drawn in each step by 'edges', default 0: one for each link)\n\tweights\t(array, chance of each slot (see link_slots) to be drawn by 'edges', default uniform)"},
+    {"get_positions", (PyCFunction)(void(*)(void)) Graph_get_positions, METH_VARARGS | METH_KEYWORDS, "Gives the computed positions of the network as a (N, dim) float32 array.\nARGS\n\tcopy\t(bool, default True): if False returns a read-only view"},
+    {"distortion", (PyCFunction) Graph_distortion, METH_NOARGS, "Returns the distortion of the network"},
+    {"set_target", (PyCFunction) Graph_set_target, METH_VARARGS, "sets the target sparse matrix"},
+    {"link_slots", (PyCFunction) Graph_link_slots, METH_VARARGS, "Gives the (E, 2) int64 array of the positions of the links i -> j and j -> i among the targets, -1 where not linked\nARGS\n\ti\t(array)\n\tj\t(array)"},
+    {"update_targets", (PyCFunction) Graph_update_targets, METH_VARARGS, "Sets the target distances of the links at the given slots (see link_slots)\nARGS\n\tslots\t(array, (E,) or (E, 2))\n\td\t(array, (E,))"},
+    {"add_links", (PyCFunction)(void(*)(void)) Graph_add_links, METH_VARARGS | METH_KEYWORDS, "Inserts links keeping the embedding, returns how many were not there.\nNodes out of range are created and placed near the barycentre of their neighbours.\nARGS\n\ti\t(array)\n\tj\t(array)\n\td\t(array)\n\tN\t(int, optional): nodes from N on are an IndexError instead of being created"},
+    {"remove_links", (PyCFunction) Graph_remove_links, METH_VARARGS, "Deletes links keeping the embedding, returns how many were deleted\nARGS\n\ti\t(array)\n\tj\t(array)"},
+    {"remove_nodes", (PyCFunction) Graph_remove_nodes, METH_VARARGS, "Deletes nodes and their links keeping the embedding (the other nodes are renumbered in order)\nARGS\n\tnodes\t(array)"},
+    {"refine", (PyCFunction)(void(*)(void)) Graph_refine, METH_VARARGS | METH_KEYWORDS, "MDE steps that move only the given nodes and their neighbours, returns how many nodes were moved\nARGS\n\tnodes\t(array)\n\teps\t(float)\n\tneg_eps\t(float)\n\tNsteps\t(int)\n\thops\t(int, default 1)"},
+    {"save", (PyCFunction)(void(*)(void)) Graph_save, METH_VARARGS | METH_KEYWORDS, "Writes a checkpoint of the graph (links, targets, values, positions, random state)\nthat Graph.load restores. It can be called from an MDE callback.\nARGS\n\tpath\t(str or path)\n\tstep\t(int, step count stored in the checkpoint, default get_stats()['steps'])\n\torder\t(array, if given the saved node n is the node order[n], see node_order)"},
+    {"load", (PyCFunction) Graph_load, METH_VARARGS | METH_CLASS, "Restores a graph from a checkpoint written by Graph.save. The file is mapped copy on write, so only\nthe pages that are used are read and the file must not be changed in place while the graph lives\n(Graph.save replaces it). The step count of the checkpoint is in get_stats()['steps']\nARGS\n\tpath\t(str or path)"},
+    {"open", (PyCFunction)(void(*)(void)) Graph_open, METH_VARARGS | METH_KEYWORDS | METH_CLASS, "Opens a checkpoint written by Graph.save as a file-backed graph: its arrays are memory mapped\nand used in place, so the graph needs not fit in memory. Links can't be added or removed.\nARGS\n\tpath\t(str or path)\n\twritable\t(bool, default True): positions and targets are written to the file,\n\t\totherwise they change only in memory\n\tvalidate\t(bool, default True): checks that the childs in the file are valid nodes,\n\t\twhich reads the whole adjacency once (offsets are always checked)"},
+    {"sync", (PyCFunction) Graph_sync, METH_NOARGS, "Flushes positions, targets, random state and step count of a writable file-backed graph to its file"},
+    {"node_order", (PyCFunction)(void(*)(void)) Graph_node_order, METH_VARARGS | METH_KEYWORDS, "Gives an order of the nodes that keeps linked nodes close (order[new] = old), to be given to save()\nARGS\n\tmethod\t('rcm' reverse Cuthill-McKee or 'bfs' breadth-first, default 'rcm')"},
+    {"coarsen", (PyCFunction) Graph_coarsen, METH_NOARGS, "Merges pairs of linked nodes (heavy edge matching on the shortest targets), returns the coarse graph\nand the int64 array of the coarse node of each node. Targets of merged links are averaged.\nThe graph must have at least 2 nodes."},
+    {"prolong", (PyCFunction) Graph_prolong, METH_VARARGS, "Places each node at the position of its coarse node, setting merged pairs apart at their target distance\nARGS\n\tcoarse\t(Graph, embedded)\n\tparent\t(array, as given by coarsen)"},
+    {"get_stats", (PyCFunction) Graph_get_stats, METH_NOARGS, "Returns a dict with the number of MDE steps done, the wall time (seconds) of each phase\n(attraction: edge sampling, repulsion: Barnes-Hut trees, update: node sweeps, distortion, conversion, callback), steps per second,\nlinks visited (edge_samples) and per second and the last distortion estimate (sampled every stats_every steps on stats_sample nodes)"},
+    {"reset_stats", (PyCFunction) Graph_reset_stats, METH_NOARGS, "Sets the counters of get_stats to zero"},
+    {"get_distanceSM", (PyCFunction) Graph_get_distanceSM, METH_NOARGS, "Returns the computed distance sparse matrix"},
+    {"get_distanceM", (PyCFunction) Graph_get_distanceM, METH_NOARGS, "Returns the distance matrix"},
+    {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef GraphMembers[] = {
+    {"N_nodes", T_UINT, offsetof(Graph, N_nodes), READONLY, "number of nodes"},
+    {"N_links", T_ULONG, offsetof(Graph, N_links), READONLY, "number of links"},
+    {"embedding_dimension", T_UINT, offsetof(Graph, embedding_dimension), READONLY, "dimension of the embedding"},
+    {"negative_sampling_fraction", T_FLOAT, offsetof(Graph, negative_sampling_fraction), 0, "fraction of random nodes used to perform negative sampling"},
+    {"negatives_per_node", T_UINT, offsetof(Graph, negatives_per_node), 0, "fixed number of negative samples per node and step (0 means negative_sampling_fraction*N_nodes)"},
+    {"num_threads", T_INT, offsetof(Graph, num_threads), 0, "number of threads used by mde()"},
+    {"stats_every", T_UINT, offsetof(Graph, stats.estimate_every), 0, "steps between two estimates of the distortion during mde() (0 means never)"},
+    {"stats_sample", T_UINT, offsetof(Graph, stats.estimate_sample), 0, "number of nodes sampled to estimate the distortion (0 means all)"},
+    {NULL}
+};
+
+static PyObject * Graph_values(Graph * self, void * closure)
+{
+    if (Graph_check_initialized(self) < 0) return NULL;
+    npy_intp dims[1] = {self -> N_nodes};
+    PyObject * values = PyArray_SimpleNew(1, dims, NPY_FLOAT32);
+    if (values == NULL) return NULL;
+    memcpy(PyArray_DATA((PyArrayObject *) values), self -> values, sizeof(float)*self -> N_nodes);
+    return values;
 }
 
-PyObject * get_distanceSM(PyObject * self, PyObject * args)
+static PyObject * Graph_N_slots(Graph * self, void * closure)
 {
+    if (Graph_check_initialized(self) < 0) return NULL;
+    return PyLong_FromSize_t(self -> offsets[self -> N_nodes]);
+}
 
-    PyObject * distanceSM = PyList_New(G.N_nodes*G.N_nodes); // Mmmh, not so clever! N**2 - > 9*N**2
-    float d;
-    long row_index = 0;
-    Node node, another_node;
+static PyObject * Graph_file_backed(Graph * self, void * closure)
+{
+    return PyBool_FromLong(self -> mapping != NULL);
+}
 
-    for (unsigned int node_index = 0; node_index < G.N_nodes; node_index++)
-    {   
-        for (unsigned int another_node_index = 0; another_node_index < G.N_nodes; another_node_index++)
-        {   
-            PyObject * row = PyList_New(3);
+static PyGetSetDef GraphGetSet[] = {
+    {"positions", (getter) Graph_positions, NULL, "read-only (N, dim) view of the positions", NULL},
+    {"values", (getter) Graph_values, NULL, "copy of the values of the nodes", NULL},
+    {"N_slots", (getter) Graph_N_slots, NULL, "number of entries of the adjacency (two for each link, see link_slots)", NULL},
+    {"file_backed", (getter) Graph_file_backed, NULL, "whether the arrays of the graph are mapped from a file (see open)", NULL},
+    {NULL}
+};
 
-            node = G.nodes[node_index];
-            another_node = G.nodes[another_node_index];
+PyTypeObject GraphType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "cnets.Graph",
+    .tp_doc = "Graph(links, values, dim, seed=0)\n\nA network embedded in R^dim.\nARGS\n\tlinks\t(list of [i, j, d], (E, 3) array or (i, j, d) arrays)\n\tvalues\t(list or array)\n\tdim\t(int)\n\tseed\t(int, 0 means time-based)",
+    .tp_basicsize = sizeof(Graph),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc) Graph_init,
+    .tp_dealloc = (destructor) Graph_dealloc,
+    .tp_methods = GraphMethods,
+    .tp_members = GraphMembers,
+    .tp_getset = GraphGetSet,
+};
 
-            d = euclidean_distance(node.position, another_node.position, G.embedding_dimension);
-            PyList_SetItem(row, 0, PyLong_FromLong(node.n));
-            PyList_SetItem(row, 1, PyLong_FromLong(another_node.n));
-            PyList_SetItem(row, 2, PyFloat_FromDouble(d));
+// Module-level functions, acting on the default graph ------------------------------------------------------------------
 
-            PyList_SetItem(distanceSM, row_index, row);
-            row_index ++;
-        }
-        
-    }
-    return distanceSM;
+PyObject * init_network(PyObject * self, PyObject * args){
+    // The previous graph is freed when replaced
+    Graph * graph = (Graph *) PyObject_CallObject((PyObject *) &GraphType, args);
+    if (graph == NULL) return NULL;
+    Py_XSETREF(default_graph, graph);
+    Py_RETURN_NONE;
 }
 
-PyObject * matrix_to_list_of_list(float **mat, unsigned int N)
-{
-    /* Returns a matrix as list of lists (lol).
-        Waiting to implement numpy arrays. */
-    PyObject * lol = PyList_New(G.N_nodes);
+PyObject * MDE_default(PyObject * self, PyObject * args, PyObject * kwargs){
+    return Graph_mde(default_graph, args, kwargs);
+}
 
-    for (unsigned int i = 0; i < N; i++)
-    {   
-        PyObject * i_th_row = PyList_New(N);
-        for (unsigned int j = 0; j < N; j++)
-        {   
-            PyList_SetItem(i_th_row, j , PyFloat_FromDouble((double) mat[i][j]));
-        }
-        PyList_SetItem(lol, i , i_th_row);  
-    }
-    return lol;
+PyObject * get_positions(PyObject * self, PyObject * args, PyObject * kwargs){
+    return Graph_get_positions(default_graph, args, kwargs);
 }
 
-PyObject * get_distanceM(PyObject * self, PyObject * args)
-{
-    infoprint("getting distances...");
-    /* Returns a matrix of distances as list of lists.
-        Waiting to implement numpy arrays. */
-    float ** distanceM = (float**) malloc(sizeof(float*)*G.N_nodes);
-    for (unsigned int k=0; k< G.N_nodes; k ++)
-    {
-        distanceM[k] = (float*) malloc(sizeof(float)*G.N_nodes);
-    }
-    float d;
-    Node node, another_node;
+PyObject * get_distanceSM(PyObject * self, PyObject * args){
+    return Graph_get_distanceSM(default_graph, NULL);
+}
 
-    for (unsigned int node_index = 0; node_index < G.N_nodes; node_index++)
-    {   
-        for (unsigned int another_node_index = node_index; another_node_index < G.N_nodes; another_node_index++)
-        {   
-            node = G.nodes[node_index];
-            another_node = G.nodes[another_node_index];
-            d = euclidean_distance(node.position, another_node.position, G.embedding_dimension);
-            distanceM[node_index][another_node_index] = d;
-            distanceM[another_node_index][node_index] = d;
-        }        
-    }
-    printf("Done.\n");
-    return matrix_to_list_of_list(distanceM, G.N_nodes);
+PyObject * get_distanceM(PyObject * self, PyObject * args){
+    return Graph_get_distanceM(default_graph, NULL);
 }
 
-PyObject * set_target(PyObject * self, PyObject * args)
-{
-    // printf("cnets - updating target distances\n");
-    PyObject * PySM;
-    unsigned int node1_number, node2_number;
+PyObject * set_target(PyObject * self, PyObject * args){
+    return Graph_set_target(default_graph, args);
+}
 
-    if(! PyArg_ParseTuple(args, "O", &PySM))
-    {
-        errprint("set_target: paring failed\n");
-    }
-    SparseRow * SM = PyList_to_SM(PySM, G.N_links);
-    for (unsigned long link = 0; link < G.N_links; link++)
-    {
-        node1_number = SM[link].i;
-        node2_number = SM[link].j;
-        // printf("cnet - set_target - (row %d of SM) --> (%d, %d) was (%lf), now is (%lf)\n", link, node1_number,node2_number, G.nodes[node1_number].distances[child_local_index_by_child_name(node1_number, node2_number)] , SM[link].d);
-        
-        G.nodes[node1_number].distances[child_local_index_by_child_name(node1_number, node2_number)] = SM[link].d;
-        G.nodes[node2_number].distances[child_local_index_by_child_name(node2_number, node1_number)] = SM[link].d;
+PyObject * save_checkpoint(PyObject * self, PyObject * args, PyObject * kwargs){
+    return Graph_save(default_graph, args, kwargs);
+}
 
-    }
+PyObject * load_checkpoint(PyObject * self, PyObject * args){
+    // The previous graph is freed when replaced
+    Graph * graph = (Graph *) Graph_load(&GraphType, args);
+    if (graph == NULL) return NULL;
+    Py_XSETREF(default_graph, graph);
     Py_RETURN_NONE;
 }
 
+PyObject * get_stats(PyObject * self, PyObject * args){
+    return Graph_get_stats(default_graph, NULL);
+}
+
+// Python wrapper
+PyObject * Py_get_distortion(PyObject * self, PyObject * args){
+    return Graph_distortion(default_graph, NULL);
+}
+
 PyObject * set_seed(PyObject * self, PyObject * args)
 {
     int seed;
     if (!PyArg_ParseTuple(args, "i", &seed)){
         errprint("parsing failed in set_seed()\n");
+        return NULL;
     }
     RAND_INIT = seed;
     Py_RETURN_NONE;
 }
 
+PyObject * set_verbose(PyObject * self, PyObject * args)
+{
+    int verbose;
+    if (!PyArg_ParseTuple(args, "p", &verbose)) return NULL;
+    VERBOSE = verbose;
+    Py_RETURN_NONE;
+}
+
+PyObject * set_log_handler(PyObject * self, PyObject * args)
+{
+    // Returns the previous handler, so that it can be restored
+    PyObject * handler;
+    if (!PyArg_ParseTuple(args, "O", &handler)) return NULL;
+    if (handler != Py_None && !PyCallable_Check(handler))
+    {
+        PyErr_SetString(PyExc_TypeError, "log handler must be callable or None");
+        return NULL;
+    }
+    PyObject * previous = (LOG_HANDLER == NULL) ? Py_None : LOG_HANDLER;
+    if (LOG_HANDLER == NULL) Py_INCREF(Py_None);
+    if (handler == Py_None)
+    {
+        LOG_HANDLER = NULL;
+    }
+    else
+    {
+        Py_INCREF(handler);
+        LOG_HANDLER = handler;
+    }
+    return previous;
+}
+
 PyObject * set_negative_sampling_fraction(PyObject * self, PyObject * args)
 {
     float neg_samp_frac;
     if (!PyArg_ParseTuple(args, "f", &neg_samp_frac)){
         errprint("parsing failed in set_negative_sampling()\n");
+        return NULL;
     }
     if (neg_samp_frac > 1.){
         errprint("negative sampling fration must be > 0 and < 1\n");
     }
     NEGATIVE_SAMPLING_FRACTION = neg_samp_frac;
+    if (default_graph != NULL) default_graph -> negative_sampling_fraction = neg_samp_frac;
     Py_RETURN_NONE;
 }
 
+static int new_link_arrays(npy_intp N_links, PyObject ** i_array, PyObject ** j_array, PyObject ** d_array)
+{
+    /* Allocates the (i, j, d) arrays of a list of links */
+    *i_array = PyArray_SimpleNew(1, &N_links, NPY_UINT32);
+    *j_array = PyArray_SimpleNew(1, &N_links, NPY_UINT32);
+    *d_array = PyArray_SimpleNew(1, &N_links, NPY_FLOAT32);
+    if (*i_array == NULL || *j_array == NULL || *d_array == NULL)
+    {
+        Py_CLEAR(*i_array);
+        Py_CLEAR(*j_array);
+        Py_CLEAR(*d_array);
+        return -1;
+    }
+    return 0;
+}
 
-PyObject * stupid_knn(PyObject * self, PyObject * args)
+static int exact_knn(const PointSet * points, unsigned int k, unsigned int * neighbours, float * distances)
+{
+    /* Writes the k nearest neighbours of each point (rows of k, sorted by distance)
+    using a KD-tree. Does not touch python objects, returns -1 if memory is over */
+    KDTree tree;
+    if (kdtree_build(&tree, points -> data, points -> N, points -> D) < 0) return -1;
+    #pragma omp parallel for schedule(dynamic, 256) num_threads(NUM_THREADS)
+    for (long obj_index = 0; obj_index < (long) points -> N; obj_index++)
+    {
+        size_t first = (size_t) obj_index*k;
+        kdtree_knn(&tree, points -> data + (size_t) obj_index*(points -> D), k, obj_index,
+                   neighbours + first, distances + first);
+    }
+    kdtree_free(&tree);
+    return 0;
+}
+
+static PyObject * knn_graph(PyObject * objects, int k)
+{
+    /* Builds the k-nearest-neighbours graph of a set of points using a KD-tree.
+
+    Returns the tuple of arrays (i, j, d) with the k neighbours j of each point i,
+    sorted by distance d. The queries run on NUM_THREADS threads without the GIL.
+    */
+    if (k < 1)
+    {
+        PyErr_SetString(PyExc_ValueError, "k must be at least 1");
+        return NULL;
+    }
+    PointSet points;
+    if (PointSet_from_object(objects, &points) < 0) return NULL;
+    unsigned int N_objs = points.N, obj_space_dim = points.D;
+    if ((unsigned int) k >= N_objs)
+    {
+        PyErr_Format(PyExc_ValueError, "k cannot be more than the number of other points (%u)", N_objs - 1);
+        PointSet_release(&points);
+        return NULL;
+    }
+    infoprint("requested knn with k = %d of %u objects in R%u\n", k, N_objs, obj_space_dim);
+
+    PyObject * i_array, * j_array, * d_array;
+    if (new_link_arrays((npy_intp) N_objs*k, &i_array, &j_array, &d_array) < 0)
+    {
+        PointSet_release(&points);
+        return NULL;
+    }
+    unsigned int * i_data = (unsigned int *) PyArray_DATA((PyArrayObject *) i_array);
+    unsigned int * j_data = (unsigned int *) PyArray_DATA((PyArrayObject *) j_array);
+    float * d_data = (float *) PyArray_DATA((PyArrayObject *) d_array);
+
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = exact_knn(&points, (unsigned int) k, j_data, d_data);
+    for (size_t l = 0; l < (size_t) N_objs*k; l++) i_data[l] = (unsigned int) (l/k);
+    Py_END_ALLOW_THREADS
+    PointSet_release(&points);
+
+    if (status < 0)
+    {
+        Py_DECREF(i_array);
+        Py_DECREF(j_array);
+        Py_DECREF(d_array);
+        return PyErr_NoMemory();
+    }
+    infoprint("knn done.\n");
+    return Py_BuildValue("(NNN)", i_array, j_array, d_array);
+}
+
+PyObject * knn(PyObject * self, PyObject * args)
 {
-    /* Implementation of a really stupid knn graph contruction
-    by stupid N*N lookup in euclidean ndistance 
-    I'm not proud of this but I'm waiting to implement EFANNA
-    
+    /* k-nearest-neighbours graph of an (N, D) set of points.
+
     Args
     ----
-        objects 
-            a list of vectors in Rn
+        objects
+            an (N, D) array (or a list of vectors in R^D)
         k
             the k in knn
 
+    Returns
+    -------
+        the arrays (i, j, d) of the links, ready for Network.from_sparse
     */
-    nancheck();
     PyObject * objects;
     int k;
     if (!PyArg_ParseTuple(args, "Oi", &objects, &k)){
-       errprint("supid_knn - parsing failed\n");
-       Py_RETURN_NONE;
-    }
-    if (k == 0){
-        errprint("stupid_knn - k cannot be zero\n");
-        exit(70000);
-    }
-    if (!PyList_CheckExact(objects)){
-        errprint("stupid_knn - the given list of objects is not a list (numpy array not supported yet).\n");
-        exit(5);
-    }
-    int N_objs = PyList_Size(objects);
-    unsigned int obj_space_dim = PyList_Size(PyList_GetItem(objects, 0));
-
-    infoprint("requested knn with k = %d of %d objects in R%d\n",k,N_objs, obj_space_dim);
-    if (k > N_objs)
-    {
-        errprint("stupid_knn - k cannot be more than the total number of elements\n");
-        exit(4);
-    }
-    // big stupid loop
-    // please god forgive me for what I'm doing
-    PyObject * sparse_knn = PyList_New(0), * tmp;
-    int neighbor_indexes[k], init_index, k_, insertion_index, number_of_links = 0, found_initials = 0;
-    float neighbor_distances[k], current_distance;
-    float *obj_pos, *other_obj_pos;
-    for (long obj_index = 0; obj_index < N_objs; obj_index++)
-    {
-        progress_bar(((float)obj_index)/( (float) N_objs) , PROGRESSS_BAR_LENGTH, 0);
-        obj_pos = PyList_to_float(PyList_GetItem(objects, obj_index) , obj_space_dim);
-
-        // Initialization of neighbours array from node ordering:
-        //  - for node n takes node n+1, n+2, etc. (the last node is connected to the first one)
-        //  - if distance != 0 adds node to the list of plausible neighbours
-        //  - if this is not, continues searching
-        found_initials = 0;
-        k_ = 0;
-        while (found_initials < k)
-        {
-            init_index = (int) (obj_index + k_ + 1 )%N_objs;
-            other_obj_pos = PyList_to_float(PyList_GetItem(objects, init_index), obj_space_dim);
-            current_distance = euclidean_distance(obj_pos, other_obj_pos, obj_space_dim);
-            if (current_distance != 0.0)
-            {
-                neighbor_indexes[found_initials] = init_index;
-                neighbor_distances[found_initials] = current_distance;
-                found_initials++;
-            }
-            k_ ++; // The searching continues
+       errprint("knn - parsing failed\n");
+       return NULL;
+    }
+    return knn_graph(objects, k);
+}
 
-        }
-        sort_descendent(neighbor_distances, neighbor_indexes, k);
-        for (long other_obj_index = 0; other_obj_index < N_objs; other_obj_index++)
-        {
-            if (other_obj_index != obj_index)
-            {   
-                // insertion must be like (e.g.)
-                //      current distance = 5.0
-                //      current list of neghbour distances = [ 8.0 6.0 2.0 1.0 ] 
-                // so result should be
-                //      list post insertion = [6.0 5.0 2.0 1.0]
-                // so the new one must be inserted right behind the first value wrt the new one is smaller
-                other_obj_pos = PyList_to_float(PyList_GetItem(objects, other_obj_index), obj_space_dim);
-                current_distance = euclidean_distance(obj_pos, other_obj_pos, obj_space_dim);
+PyObject * stupid_knn(PyObject * self, PyObject * args)
+{
+    /* The old interface of knn, returns a list of [i, j, d] lists.
 
-                insertion_index = -1; // stands for "this value has not to be inserted at all"
-                for (k_ = 0; k_ < k; k_++)
-                {
-                    // cycles over the current closest neighbors
-                    //
-                    // e.g.:
-                    // 5.0                      5.0                     5.0
-                    // 8.0 6.0 2.0 1.0      8.0 6.0 2.0 1.0     8.0 6.0 2.0 1.0
-                    // no (index = -1)          no (index = 0)          yes (index = 1)
-                    if (current_distance >= neighbor_distances[k_]) break;
-                    else insertion_index = k_;
-                }
-                if (insertion_index > -1)
-                {     
-                    if (neighbor_indexes[insertion_index] != other_obj_index)
-                    {   // this prevents redundancy like
-                        // 8.0 6.0 2.0 2.0
-                        // 1    2   3   3
-                        insert_f(neighbor_distances, (float) current_distance, insertion_index, k); // the typecasting is the only thing that makes it work
-                        insert_i(neighbor_indexes, (int) other_obj_index, insertion_index, k);
-                    }
-                }
-            }
-        }
-        // For each element of the found list creates a sparse entry
-        for (k_ = 0; k_ < k; k_++)
-        {
-            tmp = PyList_New(3);
-            PyList_SetItem(tmp, 0, PyLong_FromLong(obj_index));
-            PyList_SetItem(tmp, 1, PyLong_FromLong(neighbor_indexes[k_]));
-            PyList_SetItem(tmp, 2, PyFloat_FromDouble(neighbor_distances[k_]));
-            PyList_Append(sparse_knn, tmp);
-            number_of_links++;
-            if(obj_index == neighbor_indexes[k_]){
-                errprint("something went wrong\n");
-                exit(23974);
-            }
+    Kept for compatibility, knn() is much cheaper on big sets.
+    */
+    PyObject * objects;
+    int k;
+    if (!PyArg_ParseTuple(args, "Oi", &objects, &k)){
+       errprint("supid_knn - parsing failed\n");
+       return NULL;
+    }
+    PyObject * arrays = knn_graph(objects, k);
+    if (arrays == NULL) return NULL;
+
+    PyArrayObject * i_array = (PyArrayObject *) PyTuple_GET_ITEM(arrays, 0);
+    PyArrayObject * j_array = (PyArrayObject *) PyTuple_GET_ITEM(arrays, 1);
+    PyArrayObject * d_array = (PyArrayObject *) PyTuple_GET_ITEM(arrays, 2);
+    npy_intp N_links = PyArray_SIZE(i_array);
+    PyObject * sparse_knn = PyList_New(N_links);
+    if (sparse_knn == NULL)
+    {
+        Py_DECREF(arrays);
+        return NULL;
+    }
+    for (npy_intp l = 0; l < N_links; l++)
+    {
+        PyObject * link = Py_BuildValue("[kkd]",
+                                        (unsigned long) ((unsigned int *) PyArray_DATA(i_array))[l],
+                                        (unsigned long) ((unsigned int *) PyArray_DATA(j_array))[l],
+                                        (double) ((float *) PyArray_DATA(d_array))[l]);
+        if (link == NULL)
+        {
+            Py_DECREF(sparse_knn);
+            Py_DECREF(arrays);
+            return NULL;
         }
+        PyList_SET_ITEM(sparse_knn, l, link);
     }
-    printf("\n");
-    infoprint("stupid_knn done.\n");
-    progress_bar_status = 0;
+    Py_DECREF(arrays);
     return sparse_knn;
 }
 
-PyObject * ball_neighbours(PyObject * self, PyObject * args){
-    /* Given a set of points, cycles though them and collects, for each one,
-    all the points which distance is less than a given threshold.
+PyObject * Py_nndescent(PyObject * self, PyObject * args, PyObject * kwargs)
+{
+    /* Approximate k-nearest-neighbours graph for high dimensional points (NN-descent).
+
+    Args
+    ----
+        points
+            an (N, D) array
+        k
+            the k in knn
+        iterations
+            maximum number of iterations
+        delta
+            stops when less than delta*N*k neighbours change in an iteration
+        rho
+            fraction of the neighbours compared in each iteration (higher is slower and more accurate)
+        trees
+            number of random projection trees used for the initial graph (0 means random)
+        seed
+            the seed of the random numbers (0 means time-based)
+        recall_sample
+            if not zero the recall is measured on this number of points and printed
+
+    Returns
+    -------
+        the arrays (i, j, d) of the links, ready for Network.from_sparse
     */
-    nancheck();
+    static char * kwlist[] = {"points", "k", "iterations", "delta", "rho", "trees", "seed", "recall_sample", NULL};
     PyObject * objects;
-    float ball_radius;
-    if (!PyArg_ParseTuple(args, "Of", &objects, &ball_radius)){
-       errprint("ball_neighbours - parsing failed\n");
-       Py_RETURN_NONE;
+    int k;
+    NNDParams params = {0, 10, 0.001, 1.0, 1, 0, NUM_THREADS};
+    int seed = RAND_INIT;
+    unsigned int recall_sample = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Oi|IffIiI", kwlist, &objects, &k, &params.max_iterations,
+                                     &params.delta, &params.rho, &params.rp_trees, &seed, &recall_sample)){
+       errprint("nndescent - parsing failed\n");
+       return NULL;
+    }
+    if (k < 1)
+    {
+        PyErr_SetString(PyExc_ValueError, "k must be at least 1");
+        return NULL;
     }
-    if (ball_radius <= 0.0){
-        errprint("ball_neighbours - radius cannot <= 0\n");
-        exit(70000);
+    if (params.rho <= 0. || params.rho > 1.)
+    {
+        PyErr_SetString(PyExc_ValueError, "rho must be in (0, 1]");
+        return NULL;
     }
-    if (!PyList_CheckExact(objects)){
-        errprint("ball_neighbours - the given list of objects is not a list (numpy array not supported yet).\n");
-        exit(5);
+    PointSet points;
+    if (PointSet_from_object(objects, &points) < 0) return NULL;
+    if ((unsigned int) k >= points.N)
+    {
+        PyErr_Format(PyExc_ValueError, "k cannot be more than the number of other points (%u)", points.N - 1);
+        PointSet_release(&points);
+        return NULL;
     }
-    int N_objs = PyList_Size(objects);
-    unsigned int obj_space_dim = PyList_Size(PyList_GetItem(objects, 0));
+    params.k = (unsigned int) k;
+    params.seed = (seed == 0) ? (uint64_t) time(0) : (uint64_t) seed;
+    infoprint("requested nndescent with k = %d of %u objects in R%u\n", k, points.N, points.D);
 
-    infoprint("requested ball_neighbours with radius = %lf of %d objects in R%d\n",ball_radius,N_objs, obj_space_dim);
+    PyObject * i_array, * j_array, * d_array;
+    if (new_link_arrays((npy_intp) points.N*k, &i_array, &j_array, &d_array) < 0)
+    {
+        PointSet_release(&points);
+        return NULL;
+    }
+    unsigned int * i_data = (unsigned int *) PyArray_DATA((PyArrayObject *) i_array);
+    unsigned int * j_data = (unsigned int *) PyArray_DATA((PyArrayObject *) j_array);
+    float * d_data = (float *) PyArray_DATA((PyArrayObject *) d_array);
+
+    int iterations;
+    float recall = 1.;
+    Py_BEGIN_ALLOW_THREADS
+    iterations = nndescent(points.data, points.N, points.D, &params, j_data, d_data);
+    for (size_t l = 0; l < (size_t) points.N*k; l++) i_data[l] = (unsigned int) (l/k);
+    if (iterations >= 0 && recall_sample > 0)
+    {
+        recall = knn_recall(points.data, points.N, points.D, i_data, j_data, (unsigned long) points.N*k,
+                            recall_sample, params.seed);
+    }
+    Py_END_ALLOW_THREADS
+    PointSet_release(&points);
 
-    float *obj_pos, *other_obj_pos;
-    long * neighbours = (long *)malloc(sizeof(int));
-    float * distances = (float *)malloc(sizeof(float));
-    int neighbours_counter;
-    float dist;
-    PyObject * sparse_matrix = PyList_New(0);
-    for (long obj_index = 0; obj_index < N_objs; obj_index++)
-    {   
-        neighbours_counter=0;
-        obj_pos =  PyList_to_float(PyList_GetItem(objects, obj_index), obj_space_dim);
-        progress_bar(((float)obj_index)/( (float) N_objs) , PROGRESSS_BAR_LENGTH, 0);
+    if (iterations < 0 || recall < 0)
+    {
+        Py_DECREF(i_array);
+        Py_DECREF(j_array);
+        Py_DECREF(d_array);
+        return PyErr_NoMemory();
+    }
+    infoprint("nndescent done in %d iterations.\n", iterations);
+    if (recall_sample > 0)
+    {
+        infoprint("measured recall on %u points: %.3f\n", recall_sample, recall);
+    }
+    return Py_BuildValue("(NNN)", i_array, j_array, d_array);
+}
 
-        for (long other_obj_index = 0; other_obj_index < N_objs; other_obj_index++)
-        {   
-            if (other_obj_index != obj_index)
-            {
-                other_obj_pos = PyList_to_float(PyList_GetItem(objects, other_obj_index), obj_space_dim);
-                dist = euclidean_distance(obj_pos, other_obj_pos, obj_space_dim);
-                if ( dist <= ball_radius){
-                    neighbours_counter++;
-                    neighbours = (long *) realloc(neighbours, sizeof(long)*neighbours_counter);
-                    distances = (float *) realloc(distances, sizeof(float)*neighbours_counter);
-                    neighbours[neighbours_counter-1] = other_obj_index;
-                    distances[neighbours_counter-1] = dist;
-                }
-            }
+PyObject * Py_knn_recall(PyObject * self, PyObject * args, PyObject * kwargs)
+{
+    /* Measures the recall of a kNN graph against the exact one on a sample of points */
+    static char * kwlist[] = {"points", "links", "sample", "seed", NULL};
+    PyObject * objects, * links;
+    unsigned int sample = 100;
+    int seed = RAND_INIT;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|Ii", kwlist, &objects, &links, &sample, &seed)){
+       errprint("knn_recall - parsing failed\n");
+       return NULL;
+    }
+    PointSet points;
+    if (PointSet_from_object(objects, &points) < 0) return NULL;
+    EdgeBuffer eb;
+    if (EdgeBuffer_from_object(links, &eb) < 0)
+    {
+        PointSet_release(&points);
+        return NULL;
+    }
+    unsigned int * sources = (unsigned int *) malloc(sizeof(unsigned int)*(eb.N_links + 1));
+    unsigned int * targets = (unsigned int *) malloc(sizeof(unsigned int)*(eb.N_links + 1));
+    float recall = -1.;
+    if (sources != NULL && targets != NULL)
+    {
+        for (unsigned long l = 0; l < eb.N_links; l++)
+        {
+            sources[l] = edge_i(&eb, l);
+            targets[l] = edge_j(&eb, l);
         }
+        Py_BEGIN_ALLOW_THREADS
+        recall = knn_recall(points.data, points.N, points.D, sources, targets, eb.N_links, sample,
+                            (seed == 0) ? (uint64_t) time(0) : (uint64_t) seed);
+        Py_END_ALLOW_THREADS
+    }
+    free(sources);
+    free(targets);
+    EdgeBuffer_release(&eb);
+    PointSet_release(&points);
+    if (recall < 0) return PyErr_NoMemory();
+    return PyFloat_FromDouble(recall);
+}
+
+PyObject * ball_neighbours(PyObject * self, PyObject * args){
+    /* Given a set of points, collects for each one all the points which distance
+    is less than a given threshold.
+
+    Points are binned in a grid of cells of side equal to the radius (or put in a KD-tree
+    in more than 3 dimensions), so only close points are compared.
+
+    Args
+    ----
+        objects
+            an (N, D) array (or a list of vectors in R^D)
+        ball_radius
+            the threshold distance
+
+    Returns
+    -------
+        the arrays (i, j, d) of the links, ready for Network.from_sparse
+    */
+    PyObject * objects;
+    float ball_radius;
+    if (!PyArg_ParseTuple(args, "Of", &objects, &ball_radius)){
+       errprint("ball_neighbours - parsing failed\n");
+       return NULL;
+    }
+    if (!(ball_radius > 0.0)){
+        PyErr_SetString(PyExc_ValueError, "radius must be > 0");
+        return NULL;
+    }
+    PointSet points;
+    if (PointSet_from_object(objects, &points) < 0) return NULL;
+    infoprint("requested ball_neighbours with radius = %lf of %u objects in R%u\n", ball_radius, points.N, points.D);
 
-        PyObject * tmp;
-        for (int i = 0; i < neighbours_counter; i++)
+    int num_threads = NUM_THREADS;
+    LinkBuffer * buffers = (LinkBuffer *) calloc(num_threads, sizeof(LinkBuffer));
+    if (buffers == NULL)
+    {
+        PointSet_release(&points);
+        return PyErr_NoMemory();
+    }
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = radius_graph(points.data, points.N, points.D, ball_radius, num_threads, buffers);
+    Py_END_ALLOW_THREADS
+    PointSet_release(&points);
+
+    PyObject * i_array = NULL, * j_array = NULL, * d_array = NULL;
+    npy_intp N_links = 0;
+    for (int t = 0; t < num_threads; t++) N_links += buffers[t].N_links;
+    if (status < 0) PyErr_NoMemory();
+    else if (new_link_arrays(N_links, &i_array, &j_array, &d_array) == 0)
+    {
+        size_t offset = 0;
+        for (int t = 0; t < num_threads; t++)
         {
-            tmp = PyList_New(3);
-            PyList_SetItem(tmp, 0, PyLong_FromLong(obj_index));
-            PyList_SetItem(tmp, 1, PyLong_FromLong(neighbours[i]));
-            PyList_SetItem(tmp, 2, PyFloat_FromDouble(distances[i]));
-            PyList_Append(sparse_matrix, tmp);
-            if(obj_index == neighbours[i]){
-                errprint("something went wrong\n");
-                exit(23974);
-            }
+            size_t N_thread = buffers[t].N_links;
+            if (N_thread == 0) continue;
+            memcpy((unsigned int *) PyArray_DATA((PyArrayObject *) i_array) + offset, buffers[t].i, sizeof(unsigned int)*N_thread);
+            memcpy((unsigned int *) PyArray_DATA((PyArrayObject *) j_array) + offset, buffers[t].j, sizeof(unsigned int)*N_thread);
+            memcpy((float *) PyArray_DATA((PyArrayObject *) d_array) + offset, buffers[t].d, sizeof(float)*N_thread);
+            offset += N_thread;
         }
     }
-    printf("\n");
-    infoprint("ball_neighbours done.\n");
-    progress_bar_status = 0;
-    return sparse_matrix;
+    for (int t = 0; t < num_threads; t++) LinkBuffer_free(&(buffers[t]));
+    free(buffers);
+    if (i_array == NULL) return NULL;
+
+    infoprint("ball_neighbours done (%ld links).\n", (long) N_links);
+    return Py_BuildValue("(NNN)", i_array, j_array, d_array);
 }
 
-// TODO 
-PyObject * variable_metric_ball_neighbours(PyObject * self, PyObject * args){
+PyObject * variable_metric_ball_neighbours(PyObject * self, PyObject * args, PyObject * kwargs){
     /* Using a variable metric generates a network in which each node has at least
     one neighbour but the number of neighbours is not fixed.
 
-    To do so, first executes a 2-nearest-neighbours.
-    The second closest neighbour distance is the unit distance of the metric.
+    To do so, first executes a k-nearest-neighbours (exact up to KNN_EXACT_MAX_DIM
+    dimensions, NN-descent above). The distance to the closest neighbour
+    (or to the local_connectivity-th) and a scale found by bisection give the
+    unit distance of the metric of each point, then the memberships of the two
+    directions of each link are merged (fuzzy union).
 
     See UMAP algorithm.
-    */
-}
 
-void nancheck()
-{
-    for (unsigned int d = 0; d < G.embedding_dimension; d++ )
+    Returns
+    -------
+        the arrays (i, j, d, w) of the links with i < j, where d is the distance
+        and w the membership strength in (0, 1]
+    */
+    static char * kwlist[] = {"points", "k", "local_connectivity", NULL};
+    PyObject * objects;
+    int k = 15;
+    unsigned int local_connectivity = 1;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|iI", kwlist, &objects, &k, &local_connectivity)){
+       errprint("variable_metric_ball_neighbours - parsing failed\n");
+       return NULL;
+    }
+    if (k < 1)
+    {
+        PyErr_SetString(PyExc_ValueError, "k must be at least 1");
+        return NULL;
+    }
+    if (local_connectivity < 1 || local_connectivity > (unsigned int) k)
+    {
+        PyErr_SetString(PyExc_ValueError, "local_connectivity must be between 1 and k");
+        return NULL;
+    }
+    PointSet points;
+    if (PointSet_from_object(objects, &points) < 0) return NULL;
+    if ((unsigned int) k >= points.N)
+    {
+        PyErr_Format(PyExc_ValueError, "k cannot be more than the number of other points (%u)", points.N - 1);
+        PointSet_release(&points);
+        return NULL;
+    }
+    infoprint("requested variable_metric_ball_neighbours with k = %d of %u objects in R%u\n", k, points.N, points.D);
+
+    size_t N_directed = (size_t) points.N*k;
+    unsigned int * neighbours = (unsigned int *) malloc(sizeof(unsigned int)*N_directed);
+    float * distances = (float *) malloc(sizeof(float)*N_directed);
+    FuzzyEdge * edges = (FuzzyEdge *) malloc(sizeof(FuzzyEdge)*N_directed);
+    size_t N_edges = 0;
+    int status = -1;
+    if (neighbours != NULL && distances != NULL && edges != NULL)
     {
-        for (unsigned int i = 0; i < G.N_nodes; i++)
+        NNDParams params = {(unsigned int) k, 10, 0.001, 1.0, 1,
+                            (RAND_INIT == 0) ? (uint64_t) time(0) : (uint64_t) RAND_INIT, NUM_THREADS};
+        Py_BEGIN_ALLOW_THREADS
+        if (points.D <= KNN_EXACT_MAX_DIM) status = exact_knn(&points, (unsigned int) k, neighbours, distances);
+        else status = (nndescent(points.data, points.N, points.D, &params, neighbours, distances) < 0) ? -1 : 0;
+        if (status == 0)
         {
-            if (isNan(G.nodes[i].position[d]))
-            {
-                errprint("NaN detected\n");
-                exit(5);
-            }
+            N_edges = fuzzy_graph(neighbours, distances, points.N, (unsigned int) k, local_connectivity, NUM_THREADS, edges);
         }
+        Py_END_ALLOW_THREADS
+    }
+    free(neighbours);
+    free(distances);
+    PointSet_release(&points);
+    if (status < 0)
+    {
+        free(edges);
+        return PyErr_NoMemory();
+    }
 
+    npy_intp N_links = (npy_intp) N_edges;
+    PyObject * i_array, * j_array, * d_array, * w_array = PyArray_SimpleNew(1, &N_links, NPY_FLOAT32);
+    if (w_array == NULL || new_link_arrays(N_links, &i_array, &j_array, &d_array) < 0)
+    {
+        Py_XDECREF(w_array);
+        free(edges);
+        return NULL;
     }
-    return;
+    for (size_t e = 0; e < N_edges; e++)
+    {
+        ((unsigned int *) PyArray_DATA((PyArrayObject *) i_array))[e] = edges[e].i;
+        ((unsigned int *) PyArray_DATA((PyArrayObject *) j_array))[e] = edges[e].j;
+        ((float *) PyArray_DATA((PyArrayObject *) d_array))[e] = edges[e].d;
+        ((float *) PyArray_DATA((PyArrayObject *) w_array))[e] = edges[e].w;
+    }
+    free(edges);
+    infoprint("variable_metric_ball_neighbours done (%ld links).\n", (long) N_links);
+    return Py_BuildValue("(NNNN)", i_array, j_array, d_array, w_array);
 }
 
-float get_distortion()
+PyObject * set_num_threads(PyObject * self, PyObject * args)
 {
-    unsigned int node = 0, child = 0;
-    float distortion = 0, actual_distance;
-    float * child_position;
-    for (node = 0; node < G.N_nodes; node++)
-    {
-        for (child = 0; child < G.nodes[node].childs_number; child++)
-        {
-            child_position =  G.nodes[G.nodes[node].childs[child]].position;
-            actual_distance = euclidean_distance(G.nodes[node].position, child_position, G.embedding_dimension);
-            distortion += pow(actual_distance - G.nodes[node].distances[child], 2);
-        }
+    int num_threads;
+    if (!PyArg_ParseTuple(args, "i", &num_threads)){
+        errprint("parsing failed in set_num_threads()\n");
+        return NULL;
     }
-    distortion /= G.N_nodes;
-    return distortion;
+    if (num_threads < 1){
+        PyErr_SetString(PyExc_ValueError, "number of threads must be at least 1");
+        return NULL;
+    }
+    NUM_THREADS = num_threads;
+    if (default_graph != NULL) default_graph -> num_threads = num_threads;
+    Py_RETURN_NONE;
 }
 
-// Python wrapper
-PyObject * Py_get_distortion(){
-    return PyFloat_FromDouble(get_distortion());
+PyObject * get_max_threads(PyObject * self, PyObject * args)
+{
+    return PyLong_FromLong(omp_get_max_threads());
 }
 
 // Python link part - follow the API ------------------------------------------------------------------------------------
 
 // Methods table definition
 static PyMethodDef cnetsMethods[] = {
-    {"init_network", init_network, METH_VARARGS, "Initializes the network given a sparse list and a list of values.\nARGS\n\tsparse link matrix\t(list)\n\tvalues array\t(list)\n\tembedding dimension\t(int)"},
-    {"MDE", MDE, METH_VARARGS, "Executes minumum distortion embedding routine"},
-    {"get_positions", get_positions, METH_VARARGS, "Gives the computed positions of the network"},
+    {"init_network", init_network, METH_VARARGS, "Initializes the default network given a sparse list and a list of values.\nARGS\n\tsparse link matrix\t(list or array)\n\tvalues array\t(list or array)\n\tembedding dimension\t(int)"},
+    {"MDE", (PyCFunction)(void(*)(void)) MDE_default, METH_VARARGS | METH_KEYWORDS, "Executes minumum distortion embedding routine on the default network (same arguments of Graph.mde, callback included)"},
+    {"get_positions", (PyCFunction)(void(*)(void)) get_positions, METH_VARARGS | METH_KEYWORDS, "Gives the computed positions of the network as a (N, dim) float32 array.\nARGS\n\tcopy\t(bool, default True): if False returns a read-only view"},
     {"get_distanceSM", get_distanceSM, METH_VARARGS, "Returns the computed distance sparse matrix"},
     {"get_distanceM", get_distanceM, METH_VARARGS,"Returns the distance matrix"},
     {"get_distortion", Py_get_distortion, METH_VARARGS, "Returns the distortion of the network"},
     {"set_target", set_target, METH_VARARGS,"sets the target sparse matrix"},
     {"set_seed", set_seed, METH_VARARGS, "Set the seed for random numbers"},
     {"set_negative_sampling_fraction", set_negative_sampling_fraction, METH_VARARGS, "Set the fraction of random nodes used to perform negative sampling (0.0 < neg_samp_frac < 1.0)"},
-    {"stupid_knn", stupid_knn, METH_VARARGS, "A stupid k-nearest neighbor graph generator."},
-    {"ball_neighbours", ball_neighbours, METH_VARARGS, "Generates a neighbour network of the elements inside a n-dimensional sphere of given raidus"},
+    {"set_num_threads", set_num_threads, METH_VARARGS, "Set the number of threads used by MDE in the graphs created afterwards (and in the default one)"},
+    {"save_checkpoint", (PyCFunction)(void(*)(void)) save_checkpoint, METH_VARARGS | METH_KEYWORDS, "Writes a checkpoint of the default network (see Graph.save)"},
+    {"load_checkpoint", load_checkpoint, METH_VARARGS, "Makes the graph of a checkpoint the default network (see Graph.load)"},
+    {"get_stats", get_stats, METH_NOARGS, "Returns the statistics of the default network (see Graph.get_stats)"},
+    {"set_verbose", set_verbose, METH_VARARGS, "If False cnets reports only errors and hides the progress bar"},
+    {"set_log_handler", set_log_handler, METH_VARARGS, "Sends the messages of cnets to handler(level, message) instead of printing them\n(levels are the ones of the logging module). None restores printing.\nThe progress bar is hidden while a handler is set. Returns the previous handler"},
+    {"get_max_threads", get_max_threads, METH_NOARGS, "Returns the number of threads available (1 if cnets was compiled without OpenMP)"},
+    {"knn", knn, METH_VARARGS, "Generates the k-nearest neighbours network of a set of points using a KD-tree.\nARGS\n\tpoints\t((N, D) array)\n\tk\t(int)\nRETURNS\n\t(i, j, d) arrays of the links"},
+    {"nndescent", (PyCFunction)(void(*)(void)) Py_nndescent, METH_VARARGS | METH_KEYWORDS, "Generates an approximate k-nearest neighbours network of high dimensional points (NN-descent).\nARGS\n\tpoints\t((N, D) array)\n\tk\t(int)\n\titerations\t(int, default 10)\n\tdelta\t(float, default 0.001): stops when less than delta*N*k neighbours change\n\trho\t(float, default 1.0): sample rate of the neighbours compared at each iteration\n\ttrees\t(int, default 1): random projection trees for the initial graph\n\tseed\t(int)\n\trecall_sample\t(int, default 0): if given, prints the recall measured on this number of points\nRETURNS\n\t(i, j, d) arrays of the links"},
+    {"knn_recall", (PyCFunction)(void(*)(void)) Py_knn_recall, METH_VARARGS | METH_KEYWORDS, "Fraction of the links of a kNN network that are exact, measured on a sample of points.\nARGS\n\tpoints\t((N, D) array)\n\tlinks\t((i, j, d) arrays or (E, 3) array)\n\tsample\t(int, default 100)\n\tseed\t(int)"},
+    {"variable_metric_ball_neighbours", (PyCFunction)(void(*)(void)) variable_metric_ball_neighbours, METH_VARARGS | METH_KEYWORDS, "Generates a fuzzy neighbour network in which each point has its own unit of distance (as in UMAP).\nARGS\n\tpoints\t((N, D) array)\n\tk\t(int, default 15)\n\tlocal_connectivity\t(int, default 1): the neighbour whose distance is subtracted\nRETURNS\n\t(i, j, d, w) arrays of the links (i < j) with distances and membership strengths"},
+    {"stupid_knn", stupid_knn, METH_VARARGS, "Same as knn but returns a list of [i, j, d] lists (kept for compatibility)."},
+    {"ball_neighbours", ball_neighbours, METH_VARARGS, "Generates a neighbour network of the elements inside a n-dimensional sphere of given raidus.\nARGS\n\tpoints\t((N, D) array)\n\tradius\t(float)\nRETURNS\n\t(i, j, d) arrays of the links"},
 
     {NULL, NULL, 0, NULL}//Guardian of The Table
 };
@@ -695,5 +3468,18 @@ static struct PyModuleDef cnetsmodule = {
 
 // Initialization function for the module
 PyMODINIT_FUNC PyInit_cnets(void) {
-    return PyModule_Create(&cnetsmodule);
+    import_array();
+    if (PyType_Ready(&GraphType) < 0) return NULL;
+
+    PyObject * module = PyModule_Create(&cnetsmodule);
+    if (module == NULL) return NULL;
+
+    Py_INCREF(&GraphType);
+    if (PyModule_AddObject(module, "Graph", (PyObject *) &GraphType) < 0)
+    {
+        Py_DECREF(&GraphType);
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
 }
@@ -1,17 +1,107 @@
+#include "cbarneshut.h"
+
 #define PROGRESSS_BAR_LENGTH 60
 
+// Repulsion engines of MDE
+#define REPULSION_SAMPLED 0     // Pushes each node away from random not-childs
+#define REPULSION_BARNES_HUT 1  // All-pairs repulsion approximated with a Barnes-Hut tree
+
 typedef struct sparserow SparseRow;
 
-typedef struct node Node;
+// What a graph has done, read by Graph.get_stats()
+typedef struct mdestats
+{
+    unsigned long steps;            // MDE steps since the last reset
+    double time_total;              // Wall time of the MDE runs
+    double time_attraction;         // Wall time of each phase of MDE: links drawn by edge sampling
+    double time_repulsion;          // Barnes-Hut trees
+    double time_update;             // Node sweeps (attraction and repulsion of each node together)
+    double time_distortion;         // Distortion estimates and early stopping checks
+    double time_conversion;         // Exchange of links and positions with python
+    double time_callback;           // Python callbacks called during MDE
+    unsigned long long edge_samples;  // Links visited (a node sweep visits each link from both ends)
+    float distortion_estimate;      // Last sampled distortion, NaN if not computed yet
+    unsigned int estimate_every;    // Steps between two estimates of the distortion
+    unsigned int estimate_sample;   // Nodes sampled for an estimate
+} MDEStats;
+
+// The graph is a python object (cnets.Graph) that owns all its arrays
+typedef struct graph
+{
+    PyObject_HEAD
+    unsigned int N_nodes;
+    unsigned long N_links;
+    float * values;                 // Value of a general scalar quantity for each node
+
+    // Adjacency in compressed sparse row format:
+    // the childs of node n are childs[offsets[n]:offsets[n+1]]
+    // and their target distances are distances[offsets[n]:offsets[n+1]]
+    size_t * offsets;
+    unsigned int * childs;
+    float * distances;
+
+    unsigned int embedding_dimension;
+    float * positions;              // N_nodes x embedding_dimension block
+    PyObject * positions_array;     // The numpy array that owns the block
+
+    rng_t rng_state;
+    float negative_sampling_fraction;
+    unsigned int negatives_per_node;  // If not zero overrides negative_sampling_fraction
+    int num_threads;
+    bool busy;                      // Set while a computation runs without the GIL
+    bool in_callback;               // Set while the MDE callback runs: the graph can be read (e.g. saved)
+
+    PyObject * mapping;             // Owner of the file map of a file-backed graph, NULL if the arrays are malloc'd
+    BHTree bhtree;                  // Kept between steps to reuse its memory
+    MDEStats stats;
+} Graph;
+
+// Step schedules of MDE
+#define SCHEDULE_CONSTANT 0
+#define SCHEDULE_EXPONENTIAL 1      // eps*final_ratio^(t/T)
+#define SCHEDULE_COSINE 2           // from eps to eps*final_ratio along half a cosine
+
+// Update rules of MDE
+#define OPTIMIZER_SGD 0             // Each node moves by its displacement
+#define OPTIMIZER_MOMENTUM 1        // Heavy ball: displacements are accumulated with decay momentum
+#define OPTIMIZER_ADAM 2            // Adam with one second moment per node: steps are eps long
+#define OPTIMIZER_EDGES 3           // Links are drawn at random and move both their nodes (LargeVis style)
+
+// Negatives drawn for each link by OPTIMIZER_EDGES if the graph does not fix negatives_per_node
+#define EDGE_NEGATIVES 1
+
+// Parameters of an MDE run
+typedef struct mdeparams
+{
+    float eps;
+    float neg_eps;
+    unsigned int number_of_steps;
+    int repulsion;
+    float theta;                    // Opening angle of Barnes-Hut cells
+    float tol;                      // Stops when distortion improves less than tol (relative) over a window, 0 never stops
+    unsigned int window;            // Steps between two checks of the distortion
+    int schedule;
+    float final_ratio;              // Last step over first step in decaying schedules
+    int optimizer;
+    float momentum;
+    PyObject * callback;            // Called as callback(step, positions, stats), a true return stops the run
+    unsigned int callback_every;    // Steps between two calls of the callback
+    unsigned int start;             // First step, to continue an interrupted run
+    size_t samples;                 // Links drawn in each step by OPTIMIZER_EDGES, 0 means one per link
+    float * weights;                // Chance of each slot to be drawn by OPTIMIZER_EDGES, NULL means uniform
+} MDEParams;
+
+// Default parameters (Graph.mde keywords)
+#define MDE_DEFAULT_PARAMS {0., 0., 0, REPULSION_SAMPLED, 0.5, 0., 10, SCHEDULE_CONSTANT, 0.01, OPTIMIZER_SGD, 0.9, NULL, 10, 0, 0, NULL}
 
-// Link structure is useless at the moment,
-// may bind it to Linkin python later
-typedef struct link Link;
+// Position in the embedding of the n-th node
+#define POSITION(g, n) ((g)->positions + (size_t)(n)*(g)->embedding_dimension)
 
-typedef struct graph Graph;
+// Number of childs of the n-th node
+#define CHILDS_NUMBER(g, n) ((unsigned int)((g)->offsets[(n)+1] - (g)->offsets[n]))
 
-// Global variables remain the same call after call
-extern Graph G;
+extern PyTypeObject GraphType;
 
-float get_distortion();
-void nancheck();
\ No newline at end of file
+float get_distortion(Graph * g);
+float sampled_distortion(Graph * g, unsigned int sample, rng_t * rng_state);
+int nancheck(Graph * g);
@@ -0,0 +1,521 @@
+/*
+NN-descent (Dong, Charikar, Li - 2011) for kNN graphs in high dimension.
+
+The neighbour of a neighbour is likely to be a neighbour: starting from
+a rough graph, each iteration compares the pairs of (sampled) neighbours
+and reverse neighbours of every node and keeps the closest ones, until
+almost no neighbour changes. The initial graph comes from the leaves of
+random projection trees (or is random).
+
+Every row of the graph is a max-heap of k candidates, so the farthest one
+is on top and can be replaced in O(log k). Rows are written only by the
+thread that owns them (node % number of threads), so no locks are needed.
+*/
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "cutils.h"
+#include "cnndescent.h"
+
+#define EMPTY ((unsigned int) -1)
+#define JOIN_BLOCK 4096
+
+typedef struct update
+{
+    unsigned int p;
+    unsigned int q;
+    float dist2;
+} Update;
+
+typedef struct updatebuffer
+{
+    Update * updates;
+    size_t N_updates;
+    size_t capacity;
+} UpdateBuffer;
+
+static float squared_distance(const float * a, const float * b, unsigned int D)
+{
+    float dist2 = 0., diff;
+    for (unsigned int d = 0; d < D; d++)
+    {
+        diff = a[d] - b[d];
+        dist2 += diff*diff;
+    }
+    return dist2;
+}
+
+static void sift_down(unsigned int * index, float * key, unsigned char * flag, unsigned int root, unsigned int size)
+{
+    /* Restores a max-heap (flags, if any, follow their element) */
+    while (1)
+    {
+        unsigned int largest = root, left = 2*root + 1, right = 2*root + 2;
+        if (left < size && key[left] > key[largest]) largest = left;
+        if (right < size && key[right] > key[largest]) largest = right;
+        if (largest == root) return;
+        float k = key[root]; key[root] = key[largest]; key[largest] = k;
+        unsigned int i = index[root]; index[root] = index[largest]; index[largest] = i;
+        if (flag != NULL)
+        {
+            unsigned char f = flag[root]; flag[root] = flag[largest]; flag[largest] = f;
+        }
+        root = largest;
+    }
+}
+
+static int heap_push(unsigned int * index, float * key, unsigned char * flag, unsigned int size,
+                     unsigned int element, float element_key, unsigned char element_flag)
+{
+    /* Replaces the top of a full heap if the new element is smaller and not already there.
+    Returns 1 if the heap changed. Empty slots have an infinite key. */
+    if (element_key >= key[0]) return 0;
+    for (unsigned int s = 0; s < size; s++)
+    {
+        if (index[s] == element) return 0;
+    }
+    index[0] = element;
+    key[0] = element_key;
+    if (flag != NULL) flag[0] = element_flag;
+    sift_down(index, key, flag, 0, size);
+    return 1;
+}
+
+static void empty_heaps(unsigned int * index, float * key, size_t length)
+{
+    for (size_t s = 0; s < length; s++)
+    {
+        index[s] = EMPTY;
+        key[s] = INFINITY;
+    }
+}
+
+static void sort_heap(unsigned int * index, float * key, unsigned int size)
+{
+    /* Heapsort: the largest is moved at the end each time */
+    for (unsigned int last = size - 1; last > 0; last--)
+    {
+        float k = key[0]; key[0] = key[last]; key[last] = k;
+        unsigned int i = index[0]; index[0] = index[last]; index[last] = i;
+        sift_down(index, key, NULL, 0, last);
+    }
+}
+
+static int push_update(UpdateBuffer * buffer, unsigned int p, unsigned int q, float dist2)
+{
+    if (buffer -> N_updates == buffer -> capacity)
+    {
+        size_t capacity = (buffer -> capacity == 0) ? 1024 : 2*(buffer -> capacity);
+        Update * updates = (Update *) realloc(buffer -> updates, sizeof(Update)*capacity);
+        if (updates == NULL) return -1;
+        buffer -> updates = updates;
+        buffer -> capacity = capacity;
+    }
+    buffer -> updates[buffer -> N_updates++] = (Update) {p, q, dist2};
+    return 0;
+}
+
+// Initial graph ------------------------------------------------------------------------------------------------------------
+
+static int rp_tree_leaves(const float * points, unsigned int N, unsigned int D, unsigned int leaf_size,
+                          rng_t * rng_state, unsigned int * order, size_t * leaf_bounds, size_t * N_leaves)
+{
+    /* Splits the points recursively with random hyperplanes (the bisectors of two random points).
+
+    On return order[leaf_bounds[l]:leaf_bounds[l+1]] are the points of leaf l.
+    leaf_bounds must have room for N + 1 elements.
+    */
+    size_t * stack = (size_t *) malloc(sizeof(size_t)*2*(N + 1));
+    float * side = (float *) malloc(sizeof(float)*D);
+    if (stack == NULL || side == NULL)
+    {
+        free(stack);
+        free(side);
+        return -1;
+    }
+    for (unsigned int p = 0; p < N; p++) order[p] = p;
+    size_t top = 0;
+    *N_leaves = 0;
+    leaf_bounds[0] = 0;
+    stack[top++] = 0;
+    stack[top++] = N;
+    while (top > 0)
+    {
+        size_t end = stack[--top], start = stack[--top];
+        if (end - start <= leaf_size)
+        {
+            // Leaves come out left to right since the right half is pushed first
+            leaf_bounds[++(*N_leaves)] = end;
+            continue;
+        }
+        unsigned int a = order[start + rng_below(rng_state, (uint32_t) (end - start))];
+        unsigned int b = order[start + rng_below(rng_state, (uint32_t) (end - start))];
+
+        // Normal and offset of the bisector of a and b
+        float offset = 0.;
+        for (unsigned int d = 0; d < D; d++)
+        {
+            side[d] = points[(size_t) a*D + d] - points[(size_t) b*D + d];
+            offset += side[d]*(points[(size_t) a*D + d] + points[(size_t) b*D + d])/2;
+        }
+        size_t store = start;
+        for (size_t s = start; s < end; s++)
+        {
+            float projection = 0.;
+            for (unsigned int d = 0; d < D; d++) projection += side[d]*points[(size_t) order[s]*D + d];
+            if (projection > offset)
+            {
+                unsigned int tmp = order[s]; order[s] = order[store]; order[store] = tmp;
+                store++;
+            }
+        }
+        // Coincident points or an unlucky draw: splits in half
+        if (store == start || store == end) store = start + (end - start)/2;
+
+        stack[top++] = store;
+        stack[top++] = end;
+        stack[top++] = start;
+        stack[top++] = store;
+    }
+    free(stack);
+    free(side);
+    return 0;
+}
+
+static int init_graph(const float * points, unsigned int N, unsigned int D, const NNDParams * params,
+                      unsigned int * index, float * dist2, unsigned char * flag)
+{
+    unsigned int k = params -> k;
+    empty_heaps(index, dist2, (size_t) N*k);
+    memset(flag, 1, (size_t) N*k);
+
+    if (params -> rp_trees > 0)
+    {
+        // Leaves only fill half of each row: the graph of the leaves is disconnected and
+        // the random neighbours are the bridges that NN-descent needs to leave them
+        unsigned int k_tree = (k + 1)/2;
+        unsigned int leaf_size = (2*k > 16) ? 2*k : 16;
+        unsigned int * order = (unsigned int *) malloc(sizeof(unsigned int)*N);
+        size_t * leaf_bounds = (size_t *) malloc(sizeof(size_t)*(N + 1));
+        if (order == NULL || leaf_bounds == NULL)
+        {
+            free(order);
+            free(leaf_bounds);
+            return -1;
+        }
+        rng_t rng_state = rng_seed(params -> seed, 0);
+        for (unsigned int t = 0; t < params -> rp_trees; t++)
+        {
+            size_t N_leaves;
+            if (rp_tree_leaves(points, N, D, leaf_size, &rng_state, order, leaf_bounds, &N_leaves) < 0)
+            {
+                free(order);
+                free(leaf_bounds);
+                return -1;
+            }
+            // Each point is in one leaf, so each row is written by one thread only
+            #pragma omp parallel for schedule(dynamic, 16) num_threads(params -> num_threads)
+            for (long l = 0; l < (long) N_leaves; l++)
+            {
+                for (size_t s = leaf_bounds[l]; s < leaf_bounds[l + 1]; s++)
+                {
+                    unsigned int p = order[s];
+                    for (size_t r = leaf_bounds[l]; r < leaf_bounds[l + 1]; r++)
+                    {
+                        unsigned int q = order[r];
+                        if (p == q) continue;
+                        heap_push(index + (size_t) p*k, dist2 + (size_t) p*k, flag + (size_t) p*k, k_tree,
+                                  q, squared_distance(points + (size_t) p*D, points + (size_t) q*D, D), 1);
+                    }
+                }
+            }
+        }
+        free(order);
+        free(leaf_bounds);
+
+        // Turns the rows back into heaps of k elements
+        #pragma omp parallel for schedule(static) num_threads(params -> num_threads)
+        for (long p = 0; p < (long) N; p++)
+        {
+            for (long root = k/2 - 1; root >= 0; root--)
+            {
+                sift_down(index + (size_t) p*k, dist2 + (size_t) p*k, flag + (size_t) p*k, (unsigned int) root, k);
+            }
+        }
+    }
+
+    // Fills what is left with random neighbours
+    #pragma omp parallel num_threads(params -> num_threads)
+    {
+        rng_t rng_state = rng_seed(params -> seed, 1 + omp_get_thread_num());
+        #pragma omp for schedule(static)
+        for (long p = 0; p < (long) N; p++)
+        {
+            size_t row = (size_t) p*k;
+            while (dist2[row] == INFINITY)
+            {
+                unsigned int q = rng_below(&rng_state, N);
+                if (q == (unsigned int) p) continue;
+                heap_push(index + row, dist2 + row, flag + row, k,
+                          q, squared_distance(points + (size_t) p*D, points + (size_t) q*D, D), 1);
+            }
+        }
+    }
+    return 0;
+}
+
+// Main loop ----------------------------------------------------------------------------------------------------------------
+
+int nndescent(const float * points, unsigned int N, unsigned int D, const NNDParams * params,
+              unsigned int * neighbours, float * distances)
+{
+    /* Writes the k approximate nearest neighbours of each point in neighbours/distances
+    (N*k elements, each row sorted by distance).
+
+    Returns the number of iterations done, or -1 if memory is over.
+    Needs k < N.
+    */
+    unsigned int k = params -> k;
+    int num_threads = (params -> num_threads > 0) ? params -> num_threads : 1;
+    unsigned int max_candidates = (unsigned int) ceilf(params -> rho*k);
+    if (max_candidates < 1) max_candidates = 1;
+
+    // The graph lives in the output buffers, distances are squared until the end
+    unsigned int * index = neighbours;
+    float * dist2 = distances;
+    unsigned char * flag = (unsigned char *) malloc((size_t) N*k);
+    unsigned int * new_candidates = (unsigned int *) malloc(sizeof(unsigned int)*N*max_candidates);
+    unsigned int * old_candidates = (unsigned int *) malloc(sizeof(unsigned int)*N*max_candidates);
+    float * new_priority = (float *) malloc(sizeof(float)*N*max_candidates);
+    float * old_priority = (float *) malloc(sizeof(float)*N*max_candidates);
+    UpdateBuffer * buffers = (UpdateBuffer *) calloc(num_threads, sizeof(UpdateBuffer));
+    int iteration = -1, out_of_memory = 0;
+
+    if (flag == NULL || new_candidates == NULL || old_candidates == NULL ||
+        new_priority == NULL || old_priority == NULL || buffers == NULL) goto end;
+    if (init_graph(points, N, D, params, index, dist2, flag) < 0) goto end;
+
+    for (iteration = 0; iteration < (int) params -> max_iterations; )
+    {
+        empty_heaps(new_candidates, new_priority, (size_t) N*max_candidates);
+        empty_heaps(old_candidates, old_priority, (size_t) N*max_candidates);
+
+        // Samples neighbours and reverse neighbours with random priorities.
+        // Each thread scans the whole graph but fills only the rows it owns
+        #pragma omp parallel num_threads(num_threads)
+        {
+            int thread = omp_get_thread_num(), threads = omp_get_num_threads();
+            rng_t rng_state = rng_seed(params -> seed, ((uint64_t) (iteration + 1) << 16) + thread);
+            for (unsigned int p = 0; p < N; p++)
+            {
+                for (unsigned int s = 0; s < k; s++)
+                {
+                    size_t slot = (size_t) p*k + s;
+                    unsigned int q = index[slot];
+                    float priority = rng_uniform(&rng_state);
+                    unsigned int * candidates = flag[slot] ? new_candidates : old_candidates;
+                    float * priorities = flag[slot] ? new_priority : old_priority;
+                    if ((int) (p % threads) == thread)
+                        heap_push(candidates + (size_t) p*max_candidates, priorities + (size_t) p*max_candidates, NULL,
+                                  max_candidates, q, priority, 0);
+                    if ((int) (q % threads) == thread)
+                        heap_push(candidates + (size_t) q*max_candidates, priorities + (size_t) q*max_candidates, NULL,
+                                  max_candidates, p, priority, 0);
+                }
+            }
+        }
+
+        // The sampled new neighbours will be old ones in the next iteration
+        #pragma omp parallel for schedule(static) num_threads(num_threads)
+        for (long p = 0; p < (long) N; p++)
+        {
+            for (unsigned int s = 0; s < k; s++)
+            {
+                size_t slot = (size_t) p*k + s;
+                if (!flag[slot]) continue;
+                for (unsigned int c = 0; c < max_candidates; c++)
+                {
+                    if (new_candidates[(size_t) p*max_candidates + c] == index[slot])
+                    {
+                        flag[slot] = 0;
+                        break;
+                    }
+                }
+            }
+        }
+
+        // Local joins, by blocks of nodes to bound the memory of the updates
+        unsigned long changes = 0;
+        for (unsigned int block = 0; block < N; block += JOIN_BLOCK)
+        {
+            unsigned int block_end = (block + JOIN_BLOCK < N) ? block + JOIN_BLOCK : N;
+            #pragma omp parallel num_threads(num_threads)
+            {
+                UpdateBuffer * buffer = &(buffers[omp_get_thread_num()]);
+                buffer -> N_updates = 0;
+                #pragma omp for schedule(dynamic, 16)
+                for (long v = block; v < (long) block_end; v++)
+                {
+                    const unsigned int * news = new_candidates + (size_t) v*max_candidates;
+                    const unsigned int * olds = old_candidates + (size_t) v*max_candidates;
+                    for (unsigned int a = 0; a < max_candidates; a++)
+                    {
+                        unsigned int p = news[a];
+                        if (p == EMPTY) continue;
+                        // new-new pairs once, new-old pairs all
+                        for (unsigned int b = a + 1; b < 2*max_candidates; b++)
+                        {
+                            unsigned int q = (b < max_candidates) ? news[b] : olds[b - max_candidates];
+                            if (q == EMPTY || q == p) continue;
+                            float d2 = squared_distance(points + (size_t) p*D, points + (size_t) q*D, D);
+                            if (d2 < dist2[(size_t) p*k] || d2 < dist2[(size_t) q*k])
+                            {
+                                if (push_update(buffer, p, q, d2) < 0)
+                                {
+                                    #pragma omp atomic write
+                                    out_of_memory = 1;
+                                }
+                            }
+                        }
+                    }
+                }
+                // Implicit barrier: every thread applies the updates of the rows it owns
+                int thread = omp_get_thread_num(), threads = omp_get_num_threads();
+                unsigned long thread_changes = 0;
+                for (int t = 0; t < threads; t++)
+                {
+                    for (size_t u = 0; u < buffers[t].N_updates; u++)
+                    {
+                        Update update = buffers[t].updates[u];
+                        if ((int) (update.p % threads) == thread)
+                            thread_changes += heap_push(index + (size_t) update.p*k, dist2 + (size_t) update.p*k,
+                                                        flag + (size_t) update.p*k, k, update.q, update.dist2, 1);
+                        if ((int) (update.q % threads) == thread)
+                            thread_changes += heap_push(index + (size_t) update.q*k, dist2 + (size_t) update.q*k,
+                                                        flag + (size_t) update.q*k, k, update.p, update.dist2, 1);
+                    }
+                }
+                #pragma omp atomic
+                changes += thread_changes;
+            }
+            if (out_of_memory)
+            {
+                iteration = -1;
+                goto end;
+            }
+        }
+        iteration++;
+        if (changes <= params -> delta*N*k) break;
+    }
+
+    #pragma omp parallel for schedule(static) num_threads(num_threads)
+    for (long p = 0; p < (long) N; p++)
+    {
+        sort_heap(index + (size_t) p*k, dist2 + (size_t) p*k, k);
+        for (unsigned int s = 0; s < k; s++) dist2[(size_t) p*k + s] = sqrtf(dist2[(size_t) p*k + s]);
+    }
+
+end:
+    free(flag);
+    free(new_candidates);
+    free(old_candidates);
+    free(new_priority);
+    free(old_priority);
+    if (buffers != NULL)
+    {
+        for (int t = 0; t < num_threads; t++) free(buffers[t].updates);
+        free(buffers);
+    }
+    return iteration;
+}
+
+// Recall -------------------------------------------------------------------------------------------------------------------
+
+float knn_recall(const float * points, unsigned int N, unsigned int D,
+                 const unsigned int * sources, const unsigned int * targets, unsigned long N_links,
+                 unsigned int sample, uint64_t seed)
+{
+    /* Fraction of the links of a kNN graph that are among the exact kNN, measured on
+    a random sample of points by brute force.
+
+    A link counts as right if it is not longer than the exact k-th neighbour
+    distance, so that ties do not spoil the measure. Returns -1 if memory is over.
+    */
+    if (sample > N) sample = N;
+    int * slot_of = (int *) malloc(sizeof(int)*N);
+    unsigned int * sampled = (unsigned int *) malloc(sizeof(unsigned int)*(sample + 1));
+    unsigned int * degree = (unsigned int *) calloc(sample + 1, sizeof(unsigned int));
+    unsigned int * hits = (unsigned int *) calloc(sample + 1, sizeof(unsigned int));
+    float * kth_distance = (float *) malloc(sizeof(float)*(sample + 1));
+    float recall = -1.;
+    if (slot_of == NULL || sampled == NULL || degree == NULL || hits == NULL || kth_distance == NULL) goto end;
+
+    // Sample without repetitions (partial Fisher-Yates on a permutation)
+    rng_t rng_state = rng_seed(seed, 0);
+    for (unsigned int p = 0; p < N; p++) slot_of[p] = (int) p;
+    for (unsigned int s = 0; s < sample; s++)
+    {
+        unsigned int r = s + rng_below(&rng_state, N - s);
+        int tmp = slot_of[s]; slot_of[s] = slot_of[r]; slot_of[r] = tmp;
+        sampled[s] = (unsigned int) slot_of[s];
+    }
+    for (unsigned int p = 0; p < N; p++) slot_of[p] = -1;
+    for (unsigned int s = 0; s < sample; s++) slot_of[sampled[s]] = (int) s;
+
+    for (unsigned long l = 0; l < N_links; l++)
+    {
+        if (sources[l] < N && slot_of[sources[l]] >= 0) degree[slot_of[sources[l]]]++;
+    }
+
+    // Exact k-th distance of each sampled point
+    unsigned long total_degree = 0;
+    for (unsigned int s = 0; s < sample; s++)
+    {
+        unsigned int k = degree[s];
+        total_degree += k;
+        kth_distance[s] = 0.;
+        if (k == 0) continue;
+        if (k > N - 1) k = N - 1;
+        unsigned int * index = (unsigned int *) malloc(sizeof(unsigned int)*k);
+        float * key = (float *) malloc(sizeof(float)*k);
+        if (index == NULL || key == NULL)
+        {
+            free(index);
+            free(key);
+            goto end;
+        }
+        empty_heaps(index, key, k);
+        const float * point = points + (size_t) sampled[s]*D;
+        for (unsigned int q = 0; q < N; q++)
+        {
+            if (q == sampled[s]) continue;
+            heap_push(index, key, NULL, k, q, squared_distance(point, points + (size_t) q*D, D), 0);
+        }
+        kth_distance[s] = key[0];
+        free(index);
+        free(key);
+    }
+
+    for (unsigned long l = 0; l < N_links; l++)
+    {
+        if (sources[l] >= N || targets[l] >= N || slot_of[sources[l]] < 0) continue;
+        int s = slot_of[sources[l]];
+        float d2 = squared_distance(points + (size_t) sources[l]*D, points + (size_t) targets[l]*D, D);
+        if (targets[l] != sources[l] && d2 <= kth_distance[s]*(1 + 1e-6)) hits[s]++;
+    }
+    unsigned long total_hits = 0;
+    for (unsigned int s = 0; s < sample; s++) total_hits += hits[s];
+    recall = (total_degree > 0) ? (float) total_hits/total_degree : 1.;
+
+end:
+    free(slot_of);
+    free(sampled);
+    free(degree);
+    free(hits);
+    free(kth_distance);
+    return recall;
+}
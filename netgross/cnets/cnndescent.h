@@ -0,0 +1,18 @@
+// Approximate k-nearest-neighbours graphs (NN-descent)
+
+typedef struct nndparams
+{
+    unsigned int k;
+    unsigned int max_iterations;
+    float delta;                // Stops when less than delta*N*k neighbours change in an iteration
+    float rho;                  // Fraction of the neighbours sampled for the local joins
+    unsigned int rp_trees;      // Random projection trees used for the initial graph
+    uint64_t seed;
+    int num_threads;
+} NNDParams;
+
+int nndescent(const float * points, unsigned int N, unsigned int D, const NNDParams * params,
+              unsigned int * neighbours, float * distances);
+float knn_recall(const float * points, unsigned int N, unsigned int D,
+                 const unsigned int * sources, const unsigned int * targets, unsigned long N_links,
+                 unsigned int sample, uint64_t seed);
@@ -0,0 +1,215 @@
+/*
+Graphs of the points closer than a given radius.
+
+In low dimension the points are binned in a grid of cells of side r, so
+each point is compared only with the points of its 3^D adjacent cells.
+Only the non-empty cells are stored (sorted by key and looked up by
+bisection), so a sparse cloud in a large box does not need a huge grid.
+In higher dimension the 3^D cells are too many and a KD-tree is used.
+
+Points are split among threads in contiguous ranges and each thread writes
+in its own buffer, so the buffers concatenated in thread order give the
+links sorted by source point.
+*/
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "cutils.h"
+#include "ckdtree.h"
+#include "cradius.h"
+
+typedef struct keyedpoint
+{
+    uint64_t key;
+    unsigned int point;
+} KeyedPoint;
+
+static int compare_keys(const void * a, const void * b)
+{
+    uint64_t ka = ((const KeyedPoint *) a) -> key, kb = ((const KeyedPoint *) b) -> key;
+    if (ka != kb) return (ka > kb) - (ka < kb);
+    // Ties by index, so that the order of the links does not depend on qsort
+    unsigned int pa = ((const KeyedPoint *) a) -> point, pb = ((const KeyedPoint *) b) -> point;
+    return (pa > pb) - (pa < pb);
+}
+
+static size_t lower_bound(const uint64_t * cell_keys, size_t N_cells, uint64_t key)
+{
+    /* Bisection over the sorted keys of the non-empty cells: the first cell with key >= key */
+    size_t lo = 0, hi = N_cells;
+    while (lo < hi)
+    {
+        size_t mid = lo + (hi - lo)/2;
+        if (cell_keys[mid] < key) lo = mid + 1;
+        else hi = mid;
+    }
+    return lo;
+}
+
+static int cell_list_graph(const float * points, unsigned int N, unsigned int D, float radius,
+                           int num_threads, LinkBuffer * links)
+{
+    /* Returns 1 if the grid does not fit a 64 bit key (the caller falls back to the tree) */
+    float min[CELL_LIST_MAX_DIM];
+    int64_t cells_per_dim[CELL_LIST_MAX_DIM];
+    for (unsigned int d = 0; d < D; d++)
+    {
+        float lo = points[d], hi = points[d];
+        for (unsigned int p = 1; p < N; p++)
+        {
+            if (points[(size_t) p*D + d] < lo) lo = points[(size_t) p*D + d];
+            if (points[(size_t) p*D + d] > hi) hi = points[(size_t) p*D + d];
+        }
+        min[d] = lo;
+        double cells = floor(((double) hi - lo)/radius) + 1;
+        if (!(cells < (double) (1 << 20))) return 1;
+        cells_per_dim[d] = (int64_t) cells;
+    }
+
+    KeyedPoint * sorted = (KeyedPoint *) malloc(sizeof(KeyedPoint)*N);
+    uint64_t * cell_keys = (uint64_t *) malloc(sizeof(uint64_t)*N);
+    size_t * cell_starts = (size_t *) malloc(sizeof(size_t)*(N + 1));
+    int64_t * point_cells = (int64_t *) malloc(sizeof(int64_t)*N*D);
+    float * sorted_points = (float *) malloc(sizeof(float)*N*D);
+    int status = -1;
+    if (sorted == NULL || cell_keys == NULL || cell_starts == NULL || point_cells == NULL || sorted_points == NULL) goto end;
+
+    for (unsigned int p = 0; p < N; p++)
+    {
+        uint64_t key = 0;
+        for (unsigned int d = 0; d < D; d++)
+        {
+            int64_t c = (int64_t) floorf((points[(size_t) p*D + d] - min[d])/radius);
+            if (c >= cells_per_dim[d]) c = cells_per_dim[d] - 1;  // Rounding at the upper border
+            point_cells[(size_t) p*D + d] = c;
+            key = key*cells_per_dim[d] + c;
+        }
+        sorted[p] = (KeyedPoint) {key, p};
+    }
+    qsort(sorted, N, sizeof(KeyedPoint), compare_keys);
+
+    size_t N_cells = 0;
+    for (unsigned int s = 0; s < N; s++)
+    {
+        if (s == 0 || sorted[s].key != sorted[s - 1].key)
+        {
+            cell_keys[N_cells] = sorted[s].key;
+            cell_starts[N_cells++] = s;
+        }
+    }
+    cell_starts[N_cells] = N;
+
+    // Points of a cell are contiguous in memory
+    for (unsigned int s = 0; s < N; s++)
+    {
+        memcpy(sorted_points + (size_t) s*D, points + (size_t) sorted[s].point*D, sizeof(float)*D);
+    }
+
+    // Adjacent cells along the last dimension have consecutive keys, so their points
+    // are a single range of the sorted points: only the first D - 1 offsets are enumerated
+    unsigned int N_adjacent = 1;
+    for (unsigned int d = 0; d + 1 < D; d++) N_adjacent *= 3;
+    float radius2 = radius*radius;
+    int out_of_memory = 0;
+
+    #pragma omp parallel num_threads(num_threads)
+    {
+        LinkBuffer * buffer = &(links[omp_get_thread_num()]);
+        #pragma omp for schedule(static)
+        for (long p = 0; p < (long) N; p++)
+        {
+            const float * position = points + (size_t) p*D;
+            for (unsigned int a = 0; a < N_adjacent; a++)
+            {
+                // Decodes the offsets in {-1, 0, 1}^(D-1) of the adjacent row of cells
+                uint64_t key = 0;
+                unsigned int code = a;
+                int outside = 0;
+                for (unsigned int d = 0; d + 1 < D; d++)
+                {
+                    int64_t c = point_cells[(size_t) p*D + d] + (int64_t) (code % 3) - 1;
+                    code /= 3;
+                    if (c < 0 || c >= cells_per_dim[d]) outside = 1;
+                    key = key*cells_per_dim[d] + c;
+                }
+                if (outside) continue;
+                int64_t last = point_cells[(size_t) p*D + D - 1];
+                uint64_t first_key = key*cells_per_dim[D - 1] + (last > 0 ? last - 1 : 0);
+                uint64_t last_key = key*cells_per_dim[D - 1] + (last + 1 < cells_per_dim[D - 1] ? last + 1 : last);
+
+                size_t first_cell = lower_bound(cell_keys, N_cells, first_key);
+                size_t end_cell = lower_bound(cell_keys, N_cells, last_key + 1);
+                for (size_t s = cell_starts[first_cell]; s < cell_starts[end_cell]; s++)
+                {
+                    unsigned int q = sorted[s].point;
+                    if (q == (unsigned int) p) continue;
+                    float dist2 = 0., diff;
+                    for (unsigned int d = 0; d < D; d++)
+                    {
+                        diff = position[d] - sorted_points[s*D + d];
+                        dist2 += diff*diff;
+                    }
+                    if (dist2 <= radius2 && LinkBuffer_push(buffer, (unsigned int) p, q, sqrtf(dist2)) < 0)
+                    {
+                        #pragma omp atomic write
+                        out_of_memory = 1;
+                    }
+                }
+            }
+        }
+    }
+    status = out_of_memory ? -1 : 0;
+
+end:
+    free(sorted);
+    free(cell_keys);
+    free(cell_starts);
+    free(point_cells);
+    free(sorted_points);
+    return status;
+}
+
+static int kdtree_graph(const float * points, unsigned int N, unsigned int D, float radius,
+                        int num_threads, LinkBuffer * links)
+{
+    KDTree tree;
+    if (kdtree_build(&tree, points, N, D) < 0) return -1;
+    int out_of_memory = 0;
+
+    #pragma omp parallel num_threads(num_threads)
+    {
+        LinkBuffer * buffer = &(links[omp_get_thread_num()]);
+        #pragma omp for schedule(static)
+        for (long p = 0; p < (long) N; p++)
+        {
+            if (kdtree_radius(&tree, points + (size_t) p*D, radius, (unsigned int) p, buffer) < 0)
+            {
+                #pragma omp atomic write
+                out_of_memory = 1;
+            }
+        }
+    }
+    kdtree_free(&tree);
+    return out_of_memory ? -1 : 0;
+}
+
+int radius_graph(const float * points, unsigned int N, unsigned int D, float radius,
+                 int num_threads, LinkBuffer * links)
+{
+    /* Finds the links (i, j, d) with d <= radius, both i -> j and j -> i.
+
+    links must be an array of num_threads empty buffers: concatenated
+    in order they give the links sorted by i.
+    Returns -1 if memory is over.
+    */
+    if (D <= CELL_LIST_MAX_DIM)
+    {
+        int status = cell_list_graph(points, N, D, radius, num_threads, links);
+        if (status <= 0) return status;
+    }
+    return kdtree_graph(points, N, D, radius, num_threads, links);
+}
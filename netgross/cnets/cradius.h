@@ -0,0 +1,7 @@
+// Radius (ball) neighbours graphs
+
+// Up to this dimension points are binned in a grid, above a KD-tree is used
+#define CELL_LIST_MAX_DIM 3
+
+int radius_graph(const float * points, unsigned int N, unsigned int D, float radius,
+                 int num_threads, LinkBuffer * links);
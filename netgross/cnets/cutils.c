@@ -1,6 +1,10 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <stdbool.h>
+#include <stdint.h>
+#include <string.h>
+#include <stdarg.h>
+#include <math.h>
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
@@ -17,36 +21,89 @@ typedef struct sparserow
     float d;
 } SparseRow;
 
-void progress_bar(float progress, int length, int print_distortion)
-{     
+int VERBOSE = 1;
+PyObject * LOG_HANDLER = NULL;
+
+void log_message(int level, const char * format, ...)
+{
+    /* Sends a message to the python handler if set, otherwise prints it.
+    Info and warnings are dropped when not verbose. Can be called from any thread.
+    */
+    if (!VERBOSE && level < LOG_ERROR) return;
+    char message[1024];
+    va_list args;
+    va_start(args, format);
+    vsnprintf(message, sizeof(message), format, args);
+    va_end(args);
+
+    if (LOG_HANDLER != NULL)
+    {
+        // Handlers get one clean line
+        char * start = message;
+        while (*start == '\n' || *start == '\t') start++;
+        size_t length = strlen(start);
+        while (length > 0 && (start[length - 1] == '\n' || start[length - 1] == ' ')) start[--length] = '\0';
+
+        PyGILState_STATE gil = PyGILState_Ensure();
+        PyObject * handler = LOG_HANDLER;           // May have been replaced while waiting for the GIL
+        if (handler != NULL)
+        {
+            Py_INCREF(handler);
+            PyObject * type, * value, * traceback;
+            PyErr_Fetch(&type, &value, &traceback);     // An error may be on its way to python
+            PyObject * result = PyObject_CallFunction(handler, "is", level, start);
+            if (result == NULL) PyErr_WriteUnraisable(handler);
+            Py_XDECREF(result);
+            PyErr_Restore(type, value, traceback);
+            Py_DECREF(handler);
+            PyGILState_Release(gil);
+            return;
+        }
+        PyGILState_Release(gil);
+    }
+    switch (level)
+    {
+        case LOG_INFO:
+            printf("cnets - "BLU "INFO" RESET_COLOR ": %s" RESET_COLOR, message);
+            fflush(stdout);
+            break;
+        case LOG_WARNING:
+            fprintf(stderr, "\ncnets - "YEL "WARNING" RESET_COLOR ": %s" RESET_COLOR, message);
+            fflush(stderr);
+            break;
+        default:
+            fprintf(stderr, "\ncnets - "BRED "ERROR" RESET_COLOR ": %s" RESET_COLOR, message);
+            fflush(stderr);
+    }
+}
+
+void progress_bar(float progress, int length, float distortion)
+{
+    /* Draws the progress bar on stdout (only when verbose and without a log handler).
+    The distortion is shown if it is not NaN.
+    */
+    if (!PROGRESS_BAR_VISIBLE) return;
     if ((int) (length*(progress - progress_bar_status)) >= 1 || progress == 1.0)
-    {   
-        int i = 0;
-        char * string = (char *) malloc( sizeof(char) * (length+1));
+    {
         printf(GRN"\33[2K\r");
-        for (i = 0; i < length; i++)
+        for (int i = 0; i < length; i++)
         {
             if (i == 0 || i == length - 1)
             {
-                //string[i] = '|';
                 printf("|");
             }
             else if (i < (int) (progress * length))
             {
-                //string[i] = '|';
                 printf("\xE2\x96\x92");
             }
             else
             {
-                //string[i] = ' ';
                 printf(" ");
             }
-            string[length] = '\0';
         }
         printf("%d %%", (int)(100*progress));
-        //printf(GRN"\33[2K\r%s %d %%", string, (int)(100*progress));
         printf(YEL);
-        if (print_distortion){printf(" (D = %.4lf)", get_distortion());}
+        if (!isnan(distortion)){printf(" (D = %.4lf)", distortion);}
         printf(RESET_COLOR);
         fflush(stdout); 
         progress_bar_status = progress;
@@ -64,6 +121,7 @@ SparseRow * PyList_to_SM(PyObject * list, unsigned long N_links){
         if (!PyList_Check(row))
         {
             errprint("Invalid sparse list (row %li)\n", k);
+            free(SM);
             return NULL;
     }
     SM[k].i = (unsigned int) PyLong_AsLong(PyList_GetItem(row,0));
@@ -85,17 +143,475 @@ float * PyList_to_float(PyObject * Pylist, unsigned int N_elements){
     return dlist;
 }
 
+// Buffer protocol input ------------------------------------------------------------------------------------------------
+
+static int column_from_view(Py_buffer * view, char * data, Py_ssize_t length, Py_ssize_t stride, Column * col)
+{
+    /* Reads the format of a buffer and fills a strided column over its data.
+    Only native byte order is supported, sizes are taken from the itemsize
+    since numpy and the struct module disagree on the size of 'l'.
+    */
+    const char * fmt = (view -> format == NULL) ? "B" : view -> format;
+    if (*fmt == '@' || *fmt == '=' || *fmt == '<') fmt++;
+    if (*fmt == '>' || *fmt == '!' || fmt[0] == '\0' || fmt[1] != '\0')
+    {
+        PyErr_Format(PyExc_TypeError, "unsupported buffer format '%s'", view -> format);
+        return -1;
+    }
+    switch (*fmt)
+    {
+        case 'b': case 'h': case 'i': case 'l': case 'q': case 'n':
+            col -> kind = 'i';
+            break;
+        case 'B': case 'H': case 'I': case 'L': case 'Q': case 'N': case '?':
+            col -> kind = 'u';
+            break;
+        case 'f': case 'd':
+            col -> kind = 'f';
+            break;
+        default:
+            PyErr_Format(PyExc_TypeError, "unsupported buffer format '%s'", view -> format);
+            return -1;
+    }
+    col -> data = data;
+    col -> length = length;
+    col -> stride = stride;
+    col -> itemsize = view -> itemsize;
+    return 0;
+}
+
+double column_get(const Column * col, Py_ssize_t k)
+{
+    const char * p = col -> data + k*(col -> stride);
+    switch (col -> kind)
+    {
+        case 'f':
+            if (col -> itemsize == sizeof(float)) {float v; memcpy(&v, p, sizeof(v)); return v;}
+            else {double v; memcpy(&v, p, sizeof(v)); return v;}
+        case 'i':
+            switch (col -> itemsize)
+            {
+                case 1: {int8_t v; memcpy(&v, p, 1); return v;}
+                case 2: {int16_t v; memcpy(&v, p, 2); return v;}
+                case 4: {int32_t v; memcpy(&v, p, 4); return v;}
+                default: {int64_t v; memcpy(&v, p, 8); return (double) v;}
+            }
+        default:
+            switch (col -> itemsize)
+            {
+                case 1: {uint8_t v; memcpy(&v, p, 1); return v;}
+                case 2: {uint16_t v; memcpy(&v, p, 2); return v;}
+                case 4: {uint32_t v; memcpy(&v, p, 4); return v;}
+                default: {uint64_t v; memcpy(&v, p, 8); return (double) v;}
+            }
+    }
+}
+
+static int get_column(PyObject * obj, Py_buffer * view, Column * col)
+{
+    /* Gets a 1D column from any object exposing the buffer protocol */
+    if (PyObject_GetBuffer(obj, view, PyBUF_RECORDS_RO) < 0) return -1;
+    if (view -> ndim != 1)
+    {
+        PyBuffer_Release(view);
+        PyErr_Format(PyExc_ValueError, "expected a 1D buffer, got %d dimensions", view -> ndim);
+        return -1;
+    }
+    if (column_from_view(view, (char *) view -> buf, view -> shape[0], view -> strides[0], col) < 0)
+    {
+        PyBuffer_Release(view);
+        return -1;
+    }
+    return 0;
+}
+
+int EdgeBuffer_from_object(PyObject * obj, EdgeBuffer * eb)
+{
+    /* Reads a list of links from:
+        - a (E, 3) buffer (e.g. a numpy array of rows [i, j, d])
+        - a structured buffer with fields 'i', 'j', 'd'
+        - a tuple (i, j, d) of 1D buffers
+        - a list of lists [i, j, d] (slow fallback, elements are unboxed one by one)
+    Buffers are read in place, so they must be released with EdgeBuffer_release.
+    */
+    eb -> N_views = 0;
+    eb -> SM = NULL;
+    eb -> N_links = 0;
+
+    if (PyList_Check(obj))
+    {
+        eb -> N_links = (unsigned long) PyList_Size(obj);
+        eb -> SM = PyList_to_SM(obj, eb -> N_links);
+        if (eb -> SM == NULL)
+        {
+            if (!PyErr_Occurred()) PyErr_SetString(PyExc_ValueError, "invalid sparse list");
+            return -1;
+        }
+        return 0;
+    }
+
+    PyObject * columns[3] = {NULL, NULL, NULL};
+    if (PyTuple_Check(obj))
+    {
+        if (PyTuple_Size(obj) != 3)
+        {
+            PyErr_SetString(PyExc_ValueError, "links must be given as a tuple (i, j, d) of arrays");
+            return -1;
+        }
+        for (int c = 0; c < 3; c++)
+        {
+            columns[c] = PyTuple_GetItem(obj, c);
+            Py_INCREF(columns[c]);
+        }
+    }
+    else
+    {
+        if (PyObject_GetBuffer(obj, &(eb -> views[0]), PyBUF_RECORDS_RO) < 0) return -1;
+        Py_buffer * view = &(eb -> views[0]);
+
+        if (view -> format != NULL && view -> format[0] == 'T')
+        {
+            // Structured array: each field is taken as a strided view
+            PyBuffer_Release(view);
+            const char * names[3] = {"i", "j", "d"};
+            for (int c = 0; c < 3; c++)
+            {
+                columns[c] = PyMapping_GetItemString(obj, names[c]);
+                if (columns[c] == NULL)
+                {
+                    for (int cc = 0; cc < c; cc++) Py_DECREF(columns[cc]);
+                    return -1;
+                }
+            }
+        }
+        else
+        {
+            if (view -> ndim != 2 || view -> shape[1] != 3)
+            {
+                PyBuffer_Release(view);
+                PyErr_SetString(PyExc_ValueError, "links buffer must have shape (E, 3)");
+                return -1;
+            }
+            eb -> N_views = 1;
+            eb -> N_links = (unsigned long) view -> shape[0];
+            Column * cols[3] = {&(eb -> i), &(eb -> j), &(eb -> d)};
+            for (int c = 0; c < 3; c++)
+            {
+                if (column_from_view(view, (char *) view -> buf + c*(view -> strides[1]), view -> shape[0], view -> strides[0], cols[c]) < 0)
+                {
+                    EdgeBuffer_release(eb);
+                    return -1;
+                }
+            }
+            return 0;
+        }
+    }
+
+    // Separate columns
+    Column * cols[3] = {&(eb -> i), &(eb -> j), &(eb -> d)};
+    int failed = 0;
+    for (int c = 0; c < 3 && !failed; c++)
+    {
+        if (get_column(columns[c], &(eb -> views[c]), cols[c]) < 0) failed = 1;
+        else eb -> N_views++;
+    }
+    for (int c = 0; c < 3; c++) Py_DECREF(columns[c]);
+    if (failed)
+    {
+        EdgeBuffer_release(eb);
+        return -1;
+    }
+    if (eb -> i.length != eb -> j.length || eb -> i.length != eb -> d.length)
+    {
+        EdgeBuffer_release(eb);
+        PyErr_SetString(PyExc_ValueError, "i, j and d arrays must have the same length");
+        return -1;
+    }
+    eb -> N_links = (unsigned long) eb -> i.length;
+    return 0;
+}
+
+void EdgeBuffer_release(EdgeBuffer * eb)
+{
+    for (int c = 0; c < eb -> N_views; c++) PyBuffer_Release(&(eb -> views[c]));
+    eb -> N_views = 0;
+    free(eb -> SM);
+    eb -> SM = NULL;
+}
+
+unsigned int edge_i(const EdgeBuffer * eb, unsigned long k)
+{
+    if (eb -> SM != NULL) return eb -> SM[k].i;
+    return (unsigned int) column_get(&(eb -> i), k);
+}
+
+unsigned int edge_j(const EdgeBuffer * eb, unsigned long k)
+{
+    if (eb -> SM != NULL) return eb -> SM[k].j;
+    return (unsigned int) column_get(&(eb -> j), k);
+}
+
+float edge_d(const EdgeBuffer * eb, unsigned long k)
+{
+    if (eb -> SM != NULL) return eb -> SM[k].d;
+    return (float) column_get(&(eb -> d), k);
+}
+
+float * PyObject_to_float(PyObject * obj, unsigned int * N_elements)
+{
+    /* Converts a list or a 1D buffer into a newly allocated float array */
+    if (PyList_Check(obj))
+    {
+        *N_elements = (unsigned int) PyList_Size(obj);
+        float * dlist = (float *) malloc(sizeof(float)*(*N_elements + 1));
+        for (unsigned int i = 0; i < *N_elements; i++)
+        {
+            dlist[i] = (float) PyFloat_AsDouble(PyList_GetItem(obj, i));
+        }
+        if (PyErr_Occurred()) {free(dlist); return NULL;}
+        return dlist;
+    }
+    Py_buffer view;
+    Column col;
+    if (get_column(obj, &view, &col) < 0) return NULL;
+    *N_elements = (unsigned int) col.length;
+    float * dlist = (float *) malloc(sizeof(float)*(*N_elements + 1));
+    for (unsigned int i = 0; i < *N_elements; i++)
+    {
+        dlist[i] = (float) column_get(&col, i);
+    }
+    PyBuffer_Release(&view);
+    return dlist;
+}
+
+int PointSet_from_object(PyObject * obj, PointSet * ps)
+{
+    /* Gets a set of points from a (N, D) buffer or a list of lists.
+    A C-contiguous float32 buffer is used in place, anything else is
+    converted once into a contiguous float block.
+    */
+    ps -> has_view = 0;
+    ps -> owns_data = 0;
+    ps -> data = NULL;
+
+    if (PyList_Check(obj))
+    {
+        ps -> N = (unsigned int) PyList_Size(obj);
+        if (ps -> N == 0)
+        {
+            PyErr_SetString(PyExc_ValueError, "empty set of points");
+            return -1;
+        }
+        PyObject * first = PyList_GetItem(obj, 0);
+        if (!PyList_Check(first) || PyList_Size(first) == 0)
+        {
+            PyErr_SetString(PyExc_ValueError, "points must have at least one coordinate");
+            return -1;
+        }
+        ps -> D = (unsigned int) PyList_Size(first);
+        ps -> data = (float *) malloc(sizeof(float)*(ps -> N)*(ps -> D));
+        if (ps -> data == NULL)
+        {
+            PyErr_NoMemory();
+            return -1;
+        }
+        ps -> owns_data = 1;
+        for (unsigned int n = 0; n < ps -> N; n++)
+        {
+            PyObject * row = PyList_GetItem(obj, n);
+            if (!PyList_Check(row) || (unsigned int) PyList_Size(row) != ps -> D)
+            {
+                PointSet_release(ps);
+                PyErr_Format(PyExc_ValueError, "invalid point (row %u)", n);
+                return -1;
+            }
+            for (unsigned int d = 0; d < ps -> D; d++)
+            {
+                ps -> data[n*(ps -> D) + d] = (float) PyFloat_AsDouble(PyList_GetItem(row, d));
+            }
+        }
+        if (PyErr_Occurred()) {PointSet_release(ps); return -1;}
+        return 0;
+    }
+
+    if (PyObject_GetBuffer(obj, &(ps -> view), PyBUF_RECORDS_RO) < 0) return -1;
+    ps -> has_view = 1;
+    Py_buffer * view = &(ps -> view);
+    if (view -> ndim != 2 || view -> shape[0] == 0 || view -> shape[1] == 0)
+    {
+        PointSet_release(ps);
+        PyErr_SetString(PyExc_ValueError, "points must be given as a non-empty (N, D) buffer with D > 0");
+        return -1;
+    }
+    ps -> N = (unsigned int) view -> shape[0];
+    ps -> D = (unsigned int) view -> shape[1];
+
+    Column col;
+    if (column_from_view(view, (char *) view -> buf, view -> shape[0], view -> strides[0], &col) < 0)
+    {
+        PointSet_release(ps);
+        return -1;
+    }
+    if (col.kind == 'f' && col.itemsize == sizeof(float) && PyBuffer_IsContiguous(view, 'C'))
+    {
+        ps -> data = (float *) view -> buf;
+        return 0;
+    }
+    ps -> data = (float *) malloc(sizeof(float)*(ps -> N)*(ps -> D));
+    if (ps -> data == NULL)
+    {
+        PointSet_release(ps);
+        PyErr_NoMemory();
+        return -1;
+    }
+    ps -> owns_data = 1;
+    for (unsigned int d = 0; d < ps -> D; d++)
+    {
+        col.data = (char *) view -> buf + d*(view -> strides[1]);
+        for (unsigned int n = 0; n < ps -> N; n++)
+        {
+            ps -> data[n*(ps -> D) + d] = (float) column_get(&col, n);
+        }
+    }
+    return 0;
+}
+
+void PointSet_release(PointSet * ps)
+{
+    if (ps -> owns_data) free(ps -> data);
+    if (ps -> has_view) PyBuffer_Release(&(ps -> view));
+    ps -> data = NULL;
+    ps -> owns_data = 0;
+    ps -> has_view = 0;
+}
+
+int LinkBuffer_push(LinkBuffer * lb, unsigned int i, unsigned int j, float d)
+{
+    /* Appends a link, growing the buffer by doubling. Returns -1 if memory is over */
+    if (lb -> N_links == lb -> capacity)
+    {
+        size_t capacity = (lb -> capacity == 0) ? 4096 : 2*(lb -> capacity);
+        unsigned int * new_i = (unsigned int *) realloc(lb -> i, sizeof(unsigned int)*capacity);
+        if (new_i == NULL) return -1;
+        lb -> i = new_i;
+        unsigned int * new_j = (unsigned int *) realloc(lb -> j, sizeof(unsigned int)*capacity);
+        if (new_j == NULL) return -1;
+        lb -> j = new_j;
+        float * new_d = (float *) realloc(lb -> d, sizeof(float)*capacity);
+        if (new_d == NULL) return -1;
+        lb -> d = new_d;
+        lb -> capacity = capacity;
+    }
+    lb -> i[lb -> N_links] = i;
+    lb -> j[lb -> N_links] = j;
+    lb -> d[lb -> N_links] = d;
+    lb -> N_links++;
+    return 0;
+}
+
+void LinkBuffer_free(LinkBuffer * lb)
+{
+    free(lb -> i);
+    free(lb -> j);
+    free(lb -> d);
+    lb -> i = NULL;
+    lb -> j = NULL;
+    lb -> d = NULL;
+    lb -> N_links = 0;
+    lb -> capacity = 0;
+}
+
+int alias_build(AliasTable * table, const float * weights, size_t N)
+{
+    /* Vose's construction: buckets below the mean weight are filled with the excess
+    of those above it. Weights must be non negative with a positive sum.
+    Returns -1 if memory is over.
+    */
+    double total = 0.;
+    for (size_t k = 0; k < N; k++) total += weights[k];
+    table -> N = N;
+    table -> probability = (float *) malloc(sizeof(float)*(N + 1));
+    table -> alias = (size_t *) malloc(sizeof(size_t)*(N + 1));
+    double * scaled = (double *) malloc(sizeof(double)*(N + 1));
+    size_t * small = (size_t *) malloc(sizeof(size_t)*(N + 1));
+    size_t * large = (size_t *) malloc(sizeof(size_t)*(N + 1));
+    if (table -> probability == NULL || table -> alias == NULL || scaled == NULL || small == NULL || large == NULL)
+    {
+        alias_free(table);
+        free(scaled);
+        free(small);
+        free(large);
+        return -1;
+    }
+    size_t N_small = 0, N_large = 0;
+    for (size_t k = 0; k < N; k++)
+    {
+        scaled[k] = weights[k]*N/total;
+        if (scaled[k] < 1.) small[N_small++] = k;
+        else large[N_large++] = k;
+    }
+    while (N_small > 0 && N_large > 0)
+    {
+        size_t less = small[--N_small], more = large[N_large - 1];
+        table -> probability[less] = scaled[less];
+        table -> alias[less] = more;
+        scaled[more] -= 1. - scaled[less];
+        if (scaled[more] < 1.)
+        {
+            N_large--;
+            small[N_small++] = more;
+        }
+    }
+    // What is left is full up to rounding errors
+    while (N_large > 0)
+    {
+        table -> probability[large[--N_large]] = 1.;
+        table -> alias[large[N_large]] = large[N_large];
+    }
+    while (N_small > 0)
+    {
+        table -> probability[small[--N_small]] = 1.;
+        table -> alias[small[N_small]] = small[N_small];
+    }
+    free(scaled);
+    free(small);
+    free(large);
+    return 0;
+}
+
+void alias_free(AliasTable * table)
+{
+    free(table -> probability);
+    free(table -> alias);
+    table -> probability = NULL;
+    table -> alias = NULL;
+    table -> N = 0;
+}
+
+static void format_float_array(char * buffer, size_t size, const float * array, unsigned int length)
+{
+    /* Writes the array as "[ a, b, ]" in buffer, cut if it doesn't fit */
+    size_t written = snprintf(buffer, size, "[ ");
+    for (unsigned int d = 0; d < length && written < size; d++)
+    {
+        written += snprintf(buffer + written, size - written, "%g, ", array[d]);
+    }
+    if (written < size) snprintf(buffer + written, size - written, "]");
+}
+
 float euclidean_distance(float * pos1, float * pos2, unsigned int dim){
 
-    float dist = 0.;
+    float dist = 0., delta;
     for (unsigned int i = 0; i < dim; i++)
     {
-        dist += pow(pos1[i] - pos2[i], 2);
+        delta = pos1[i] - pos2[i];
+        dist += delta*delta;
     }
     if (isNan(dist)){
-        warnprint("euclidean distance turned out to be nan\n");
-        print_float_array(pos1, dim);printf("\n");
-        print_float_array(pos2, dim);printf("\n");
+        char first[256], second[256];
+        format_float_array(first, sizeof(first), pos1, dim);
+        format_float_array(second, sizeof(second), pos2, dim);
+        warnprint("euclidean distance turned out to be nan between %s and %s\n", first, second);
     }
     return sqrt(dist);
 }
@@ -110,37 +626,43 @@ bool isNan(float number){
     }
 }
 
-bool isOrdered(float * array, int n){
-    bool sorted = true;
-    for (int i = 0; i< n-1; i++){
-        if (array[i] < array[i+1]){
-            sorted = false;
-            break;
-        }
-    }
-    return sorted;
+typedef struct childdist
+{
+    unsigned int child;
+    float distance;
+} ChildDist;
+
+static int compare_childs(const void * a, const void * b)
+{
+    unsigned int ca = ((const ChildDist *) a) -> child, cb = ((const ChildDist *) b) -> child;
+    return (ca > cb) - (ca < cb);
 }
 
-void sort_descendent(float * distances, int * indexes, int n)
+void sort_rows(size_t * offsets, unsigned int * childs, float * distances, unsigned int N_rows)
 {
-    /* Please don't judge me, I could have done it fancier */
-    float tmp_dist;
-    int tmp_ind;
-    while (!isOrdered(distances,n)){
-        for (int i = 0; i < n-1; i++)
+    /* Sorts each row of a CSR adjacency by child index, carrying distances along */
+    size_t max_row = 0;
+    for (unsigned int n = 0; n < N_rows; n++)
+    {
+        if (offsets[n + 1] - offsets[n] > max_row) max_row = offsets[n + 1] - offsets[n];
+    }
+    ChildDist * row = (ChildDist *) malloc(sizeof(ChildDist)*(max_row + 1));
+    for (unsigned int n = 0; n < N_rows; n++)
+    {
+        size_t length = offsets[n + 1] - offsets[n];
+        for (size_t k = 0; k < length; k++)
         {
-            if (distances[i] < distances[i+1])
-            {
-                tmp_dist = distances[i];
-                distances[i] = distances[i+1];
-                distances[i+1] = tmp_dist;
-                
-                tmp_ind = indexes[i];
-                indexes[i] = indexes[i+1];
-                indexes[i+1] = tmp_ind;
-            }
+            row[k].child = childs[offsets[n] + k];
+            row[k].distance = distances[offsets[n] + k];
+        }
+        qsort(row, length, sizeof(ChildDist), compare_childs);
+        for (size_t k = 0; k < length; k++)
+        {
+            childs[offsets[n] + k] = row[k].child;
+            distances[offsets[n] + k] = row[k].distance;
         }
-    } 
+    }
+    free(row);
 }
 
 void print_float_array(float * array, int length){
@@ -158,31 +680,3 @@ void print_int_array(int * array, int length){
     }
     printf("]");
 }
-
-
-void insert_f(float * array, float value, int position, int length)
-{
-    /* Inserts an element in a float array by recursively shifting everything back */
-    if (position >= length){
-        errprint("insert_f - positioning outside array (%d >= %d )\n", position, length);
-    }
-    if (position != 0)
-    {
-        insert_f(array, (float) array[position], position - 1, length);
-    }
-    array[position] = value;
-    return;
-}
-void insert_i(int * array, int value, int position, int length)
-{
-    /* Inserts an element in a int array by recursively shifting everything back */
-    if (position >= length){
-        errprint("insert_f - positioning outside array (%d >= %d )\n", position, length);
-    }
-    if (position != 0)
-    {
-        insert_i(array, (int) array[position], position - 1, length);
-    }
-    array[position] = value;
-    return;
-}
\ No newline at end of file
@@ -1,5 +1,16 @@
 #include <Python.h>
 #include <stdbool.h>
+#include <stdint.h>
+#include <time.h>
+
+// Without OpenMP the pragmas are ignored and everything runs on one thread
+#ifdef _OPENMP
+#include <omp.h>
+#else
+static inline int omp_get_thread_num(void){return 0;}
+static inline int omp_get_num_threads(void){return 1;}
+static inline int omp_get_max_threads(void){return 1;}
+#endif
 
 // Some colors for a fancy output (aestetics never goes out of fashion)
 #define BLK "\e[0;30m"
@@ -14,20 +25,158 @@
 #define BRED "\e[1;31m"
 #define RESET_COLOR "\e[0m"
 
-#define infoprint(...) printf("cnets - "BLU "INFO" RESET_COLOR ": ");printf(__VA_ARGS__);printf(RESET_COLOR);fflush(stdout);
-#define errprint(...) fprintf(stderr, "\ncnets - "BRED "ERROR" RESET_COLOR ": ");fprintf(stderr, __VA_ARGS__);printf(RESET_COLOR);fflush(stderr);
-#define warnprint(...) fprintf(stderr, "\ncnets - "YEL "WARNING" RESET_COLOR ": ");fprintf(stderr, __VA_ARGS__);printf(RESET_COLOR);fflush(stderr);
+// Messages go to the python handler set with cnets.set_log_handler, if any,
+// otherwise they are printed (info and warnings only if VERBOSE, see cnets.set_verbose)
+#define LOG_INFO 20             // Same levels of python logging
+#define LOG_WARNING 30
+#define LOG_ERROR 40
+
+extern int VERBOSE;
+extern PyObject * LOG_HANDLER;
+void log_message(int level, const char * format, ...);
+
+#define infoprint(...) log_message(LOG_INFO, __VA_ARGS__)
+#define errprint(...) log_message(LOG_ERROR, __VA_ARGS__)
+#define warnprint(...) log_message(LOG_WARNING, __VA_ARGS__)
+
+// Whether progress bars and other raw output go to stdout
+#define PROGRESS_BAR_VISIBLE (VERBOSE && LOG_HANDLER == NULL)
+
+// Wall clock in seconds
+static inline double wall_time(void)
+{
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return now.tv_sec + 1e-9*now.tv_nsec;
+}
+
+// Random numbers ---------------------------------------------------------------------------------------------------------
+// xorshift64* generator: a 64 bit state per stream, seeded through splitmix64
+// so that close seeds (e.g. seed + thread number) give unrelated streams
+
+typedef uint64_t rng_t;
+
+static inline uint64_t splitmix64(uint64_t x)
+{
+    x += 0x9E3779B97F4A7C15ULL;
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EBULL;
+    return x ^ (x >> 31);
+}
+
+static inline rng_t rng_seed(uint64_t seed, uint64_t stream)
+{
+    rng_t state = splitmix64(seed ^ splitmix64(stream));
+    return (state == 0) ? 0x2545F4914F6CDD1DULL : state;
+}
+
+static inline uint64_t rng_next(rng_t * state)
+{
+    uint64_t x = *state;
+    x ^= x >> 12;
+    x ^= x << 25;
+    x ^= x >> 27;
+    *state = x;
+    return x * 0x2545F4914F6CDD1DULL;
+}
+
+// Uniform integer in [0, n) (multiply-shift, no division)
+static inline uint32_t rng_below(rng_t * state, uint32_t n)
+{
+    return (uint32_t) (((rng_next(state) >> 32) * (uint64_t) n) >> 32);
+}
+
+// Uniform float in [0, 1)
+static inline float rng_uniform(rng_t * state)
+{
+    return (float) (rng_next(state) >> 40) * (1.0f/16777216.0f);
+}
 
 typedef struct sparserow SparseRow;
+typedef struct graph Graph;
 extern float progress_bar_status;
 
-void progress_bar(float progress, int length, int print_distortion);
+// A strided, typed 1D view over a Python buffer (numpy arrays, memoryviews, ...)
+// Elements are read in place, no intermediate copy is made
+typedef struct column
+{
+    char * data;
+    Py_ssize_t length;
+    Py_ssize_t stride;
+    Py_ssize_t itemsize;
+    char kind;                  // 'i' signed, 'u' unsigned, 'f' floating point
+} Column;
+
+// A list of links (i, j, d) read either from a buffer or from a list of lists
+typedef struct edgebuffer
+{
+    unsigned long N_links;
+    Column i, j, d;
+    SparseRow * SM;             // Only used by the list fallback
+    Py_buffer views[3];
+    int N_views;
+} EdgeBuffer;
+
+// A set of N points in R^D stored as a C-contiguous float block
+typedef struct pointset
+{
+    float * data;
+    unsigned int N;
+    unsigned int D;
+    Py_buffer view;
+    int has_view;
+    int owns_data;
+} PointSet;
+
+// A growing list of links (i, j, d), for builders that do not know how many links they will find
+typedef struct linkbuffer
+{
+    unsigned int * i;
+    unsigned int * j;
+    float * d;
+    size_t N_links;
+    size_t capacity;
+} LinkBuffer;
+
+// Walker's alias table: draws index k with probability weights[k]/sum(weights) in O(1)
+typedef struct aliastable
+{
+    float * probability;        // Chance of keeping the drawn bucket
+    size_t * alias;             // Index taken otherwise
+    size_t N;
+} AliasTable;
+
+// Uniform integer in [0, n) for n that may not fit 32 bits
+static inline size_t rng_below_size(rng_t * state, size_t n)
+{
+    return (size_t) (((unsigned __int128) rng_next(state) * n) >> 64);
+}
+
+static inline size_t alias_draw(const AliasTable * table, rng_t * state)
+{
+    size_t k = rng_below_size(state, table -> N);
+    return (rng_uniform(state) < table -> probability[k]) ? k : table -> alias[k];
+}
+
+void progress_bar(float progress, int length, float distortion);
 SparseRow * PyList_to_SM(PyObject * list, unsigned long N_links);
 float * PyList_to_float(PyObject * Pylist, unsigned int N_elements);
+double column_get(const Column * col, Py_ssize_t k);
+int EdgeBuffer_from_object(PyObject * obj, EdgeBuffer * eb);
+void EdgeBuffer_release(EdgeBuffer * eb);
+unsigned int edge_i(const EdgeBuffer * eb, unsigned long k);
+unsigned int edge_j(const EdgeBuffer * eb, unsigned long k);
+float edge_d(const EdgeBuffer * eb, unsigned long k);
+float * PyObject_to_float(PyObject * obj, unsigned int * N_elements);
+int PointSet_from_object(PyObject * obj, PointSet * ps);
+void PointSet_release(PointSet * ps);
+int LinkBuffer_push(LinkBuffer * lb, unsigned int i, unsigned int j, float d);
+void LinkBuffer_free(LinkBuffer * lb);
+int alias_build(AliasTable * table, const float * weights, size_t N);
+void alias_free(AliasTable * table);
 float euclidean_distance(float * pos1, float * pos2, unsigned int dim);
 bool isNan(float number);
 void print_float_array(float * array, int length);
 void print_int_array(int * array, int length);
-void sort_descendent(float * distances, int * indexes, int n);
-void insert_f(float * array, float value, int position, int length);
+void sort_rows(size_t * offsets, unsigned int * childs, float * distances, unsigned int N_rows);
 void insert_i(int * array, int value, int position, int length);
\ No newline at end of file
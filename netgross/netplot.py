@@ -1,5 +1,7 @@
 """Graphic module for plotting and animating networks.
 """
+import logging
+
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -7,6 +9,8 @@ from matplotlib.colors import hsv_to_rgb
 
 from netgross import network
 
+logger = logging.getLogger(__name__)
+
 plt.rc("font", family="serif")
 
 # Default setttings for plots
@@ -21,8 +25,13 @@ plot_points = True
 mappable = None
 
 
-def get_graphics(net):
-    """Generates the figure, axis and empty scatterplot/lines for the net."""
+def get_graphics(net, lines=None):
+    """Generates the figure, axis and empty scatterplot/lines for the net.
+
+    Lines are made if lines is true (plot_lines if it is None).
+    """
+    if lines is None:
+        lines = plot_lines
 
     # creates figure and axis
     fig = plt.figure(**fig_kwargs)
@@ -42,7 +51,7 @@ def get_graphics(net):
     net.scatplot = ax.scatter(*empty, **scat_kwargs)
     artists = (net.scatplot,)
 
-    if plot_lines:
+    if lines:
         for link in net.links:
             # line_data = np.vstack((link.node1.position, link.node2.position)).transpose()
             # line, = ax.plot(*line_data, color='k', alpha=0.3)
@@ -53,10 +62,13 @@ def get_graphics(net):
     return fig, ax
 
 
-def update_scatter(ax, net, colors, normalize_colors=True):
-    """Updates the scatter plot position and colors"""
+def update_scatter(ax, net, colors, normalize_colors=True, positions=None):
+    """Updates the scatter plot position and colors
+
+    The points are net.positions unless other (N, dim) positions are given.
+    """
 
-    position = net.to_scatter()
+    position = net.to_scatter() if positions is None else np.transpose(positions)
     scat = net.scatplot
 
     if ax.name == "3d":
@@ -91,11 +103,15 @@ def update_scatter(ax, net, colors, normalize_colors=True):
         scat.set_clim(vmin, vmax)
 
 
-def update_lines(ax, net, colors, alphas):
-    """updates the lines of the network"""
+def update_lines(ax, net, colors, alphas, positions=None):
+    """updates the lines of the network (at net.positions unless other positions are given)"""
     for link, color, alpha in zip(net.links, colors, alphas):
 
-        line_data = np.vstack((link.node1.position, link.node2.position)).transpose()
+        if positions is None:
+            ends = (link.node1.position, link.node2.position)
+        else:
+            ends = (positions[link.node1.n], positions[link.node2.n])
+        line_data = np.vstack(ends).transpose()
 
         if ax.name == "3d":
             x_coord, y_coord, z_coord = line_data
@@ -160,12 +176,40 @@ def animate_MDE(net, updates_per_frame, MDEkwargs, anim_kwargs):
     return supernet.net.animation
 
 
+def live_MDE(net, every=10, pause=1e-3, **MDEkwargs):
+    """Runs net.cMDE once redrawing the network every `every` steps
+
+    Unlike animate_MDE the embedding is not chopped into many short runs:
+    the figure is updated by the cnets callback. Closing the figure stops the run.
+    The network is drawn from the positions given to the callback, so that networks
+    opened read-only work too (their links are not loaded, so only points are drawn).
+    """
+    if not net.is_cnet_initialized:
+        net.initialize_embedding()
+    lines = plot_lines and not net.cgraph.file_backed
+    fig, ax = get_graphics(net, lines=lines)
+    point_colors = net.nodes.value
+    if lines:
+        line_colors = [line_kwargs["color"]] * len(net.links)
+        line_alpha = [line_kwargs["alpha"]] * len(net.links)
+
+    def _draw(step, positions, stats):
+        if plot_points:
+            update_scatter(ax, net, point_colors, positions=positions)
+        if lines:
+            update_lines(ax, net, line_colors, line_alpha, positions=positions)
+        ax.set_title(f"step {step} - distortion {stats['distortion_estimate']:.3g}")
+        plt.pause(pause)
+        return not plt.fignum_exists(fig.number)
+
+    net.cMDE(callback=_draw, callback_every=every, **MDEkwargs)
+    return fig
+
+
 def plot_net(net, labels=None, colorbar=False, plot_activations=True):
     """Plots a statical image for the network embedding"""
-    print("Plot started:")
-    print("Getting graphics..", end="", flush=True)
+    logger.debug("plot started")
     _, ax = get_graphics(net)
-    print("\tDone.")
 
     point_colors = net.nodes.value
 
@@ -187,14 +231,12 @@ def plot_net(net, labels=None, colorbar=False, plot_activations=True):
          line_alpha = 0.8*np.ones(len(net.links))
 
     if plot_points:
-        print("Updating scatter..", end="", flush=True)
+        logger.debug("updating scatter")
         update_scatter(ax, net, point_colors)
-        print("\tDone.")
 
     if plot_lines:
-        print("Updating lines..", end="", flush=True)
+        logger.debug("updating lines")
         update_lines(ax, net, line_colors, line_alpha)
-        print("\tDone.")
 
     if labels is not None:
         if ax.name == "3d":
@@ -209,5 +251,12 @@ def plot_net(net, labels=None, colorbar=False, plot_activations=True):
 
 
 def plot_links(net):
+    """Plots the pattern of the link matrix (a white dot for each link)"""
     _, ax = plt.subplots()
-    ax.imshow(net.linkM.astype(float), cmap="gray")
+    linkM = net.linkM
+    ax.set_facecolor("k")
+    ax.plot(linkM.cols, linkM.rows, ",", color="w")
+    # same orientation of a matrix image
+    ax.set_xlim(-0.5, linkM.shape[1] - 0.5)
+    ax.set_ylim(linkM.shape[0] - 0.5, -0.5)
+    ax.set_aspect("equal")
@@ -4,46 +4,95 @@ distorted way possible (MDE).
 author: djanloo
 date: 20 nov 21
 """
+import logging
+import math
+import os
+import weakref
+
 from netgross import network
 import numpy as np
 
-from termcolor import colored
-from tqdm import tqdm
-
 import cnets
 from . import utils
 from . import classiter as ci
 
+logger = logging.getLogger(__name__)
+
+
+def use_logging(enable=True):
+    """Sends the messages of cnets to the "cnets" logger instead of printing them.
+
+    cnets prints its progress bar only when it has no handler. use_logging(False)
+    prints the messages again.
+    """
+    cnets.set_log_handler(logging.getLogger("cnets").log if enable else None)
+
 
 class Node:
-    def __init__(self, n):
+    def __init__(self, n, net=None):
 
         self.n = int(n)
-        self.synapses = ci.cset()
+
+        # A node of a network is a view on the network arrays,
+        # a free node stores its own attributes
+        self._net = net
+        self._synapses = ci.cset() if net is None else None
         self._position = None
         self._value = 0  # the value of... something, I guess?
 
     @property
     def value(self):
+        if self._net is not None:
+            return self._net._values[self.n]
         if self._value is not None:
             return self._value
         raise RuntimeWarning("Node value not defined yet")
 
     @value.setter
     def value(self, value):
-        self._value = value
+        if self._net is not None:
+            self._net._values[self.n] = value
+        else:
+            self._value = value
 
     @property
     def position(self):
-        if self._position is not None:
+        if self._net is not None:
+            if self._net.positions is not None:
+                return self._net.positions[self.n]
+        elif self._position is not None:
             return self._position
         raise RuntimeWarning("Node position not defined yet")
 
     @position.setter
     def position(self, position):
-        self._position = position
+        if self._net is not None:
+            self._net.positions[self.n] = position
+        else:
+            self._position = position
+
+    @property
+    def synapses(self):
+        if self._net is not None:
+            return self._net._synapses_of(self.n)
+        return self._synapses
+
+    @synapses.setter
+    def synapses(self, synapses):
+        self._synapses = synapses
+
+    def _detach(self):
+        """Turns the node into a free one, keeping its attributes (its network drops it)"""
+        net = self._net
+        self._value = net._values[self.n]
+        if net.positions is not None:
+            self._position = np.array(net.positions[self.n])
+        self._synapses = ci.cset()
+        self._net = None
 
     def connect(self, child, distance, directed=False):
+        if self._net is not None:
+            return self._net.add_link(self, child, distance)
         if directed:
             link = dirLink(self, child)
             link.length = distance
@@ -55,6 +104,17 @@ class Node:
             child.synapses += link
         return link
 
+    def __eq__(self, other):
+        if self is other:
+            return True
+        # Two views of the same node of a network are the same node
+        return (
+            isinstance(other, Node)
+            and self._net is not None
+            and other._net is self._net
+            and other.n == self.n
+        )
+
     def __hash__(self):
         return self.n
 
@@ -62,28 +122,89 @@ class Node:
         return f"N({self.n})"
 
 
-class dirLink:
-    """Link class to handle directed links.
-    As opposed to undLink, it does not implement any equivalence relation,
-    so it is a mere mist with named entries.
+class Link:
+    """Attributes common to directed and undirected links.
+
+    A link of a network is a view on the network arrays (its index is the
+    position of the link in them), a free link stores its own attributes.
     """
 
-    def __init__(self, node1, node2):
+    def __init__(self, node1, node2, net=None, index=None):
 
         # The linked nodes
-        # Nomenclature was chosen to be compatible with undLink
-        # so no parent-child relation is explicitly contained in attributes' names
-        # However node1 must be intended as parent
-        # and node2 as child
         self.node1 = node1
         self.node2 = node2
 
+        self._net = net
+        self._index = index
+
         # The value of activation of the link and its length
-        self.activation = 0
-        self.length = None
+        self._activation = 0
+        self._length = None
 
         # Related graphical objects
-        self.line = None
+        self._line = None
+
+    @property
+    def length(self):
+        if self._net is not None:
+            return self._net._lengths[self._index]
+        return self._length
+
+    @length.setter
+    def length(self, length):
+        if self._net is not None:
+            self._net._lengths[self._index] = length
+            self._net._touch()
+        else:
+            self._length = length
+
+    def _detach(self):
+        """Turns the link into a free one, keeping its attributes (its network drops it)"""
+        net = self._net
+        self._length = net._lengths[self._index]
+        self._activation = net._activations[self._index]
+        self._line = net._lines[self._index]
+        self._net = None
+        self._index = None
+
+    @property
+    def activation(self):
+        if self._net is not None:
+            return self._net._activations[self._index]
+        return self._activation
+
+    @activation.setter
+    def activation(self, activation):
+        if self._net is not None:
+            self._net._activations[self._index] = activation
+        else:
+            self._activation = activation
+
+    @property
+    def line(self):
+        if self._net is not None:
+            return self._net._lines[self._index]
+        return self._line
+
+    @line.setter
+    def line(self, line):
+        if self._net is not None:
+            self._net._lines[self._index] = line
+        else:
+            self._line = line
+
+
+class dirLink(Link):
+    """Link class to handle directed links.
+    As opposed to undLink, it does not implement any equivalence relation,
+    so it is a mere mist with named entries.
+
+    Nomenclature was chosen to be compatible with undLink
+    so no parent-child relation is explicitly contained in attributes' names
+    However node1 must be intended as parent
+    and node2 as child
+    """
 
     def get_child(self, node):
         if node == self.node1:
@@ -106,7 +227,7 @@ class dirLink:
         return f"dL({self.node1.n}->{self.node2.n}:{self.length:1.2f})"
 
 
-class undLink:
+class undLink(Link):
     """Link class to handle unidirected links
 
     Implements an equivalence relationships between tuples:
@@ -116,19 +237,6 @@ class undLink:
     this is done by a symmetric hash function and a __eq__ override.
     """
 
-    def __init__(self, node1, node2):
-
-        # The linked nodes
-        self.node1 = node1
-        self.node2 = node2
-
-        # The value of activation of the link and its length
-        self.activation = 0
-        self.length = None
-
-        # Related graphical objects
-        self.line = None
-
     def get_child(self, node):
         if node == self.node1:
             return self.node2
@@ -155,82 +263,569 @@ class undLink:
         return f"uL({self.node1.n}<->{self.node2.n}:{self.length:1.2f})"
 
 
+class NodeView:
+    """The nodes of a network (or a selection of them, possibly repeated).
+
+    The columns n, value and position are served from the network arrays:
+
+        net.nodes.value     # the (N,) array of values
+
+    Node objects are created only when a node is indexed or iterated over,
+    any other attribute is gathered from them in a clist.
+    """
+
+    def __init__(self, net, index=None):
+        self._net = net
+        self._index = index  # None stands for all the nodes
+
+    @property
+    def index(self):
+        if self._index is None:
+            return np.arange(len(self))
+        return self._index
+
+    def __len__(self):
+        if self._index is None:
+            return self._net.N or 0
+        return len(self._index)
+
+    def __iter__(self):
+        return (self._net._node(n) for n in self.index)
+
+    def __getitem__(self, index):
+        n = int(index if self._index is None else self._index[index])
+        if not 0 <= n < (self._net.N or 0):
+            raise KeyError(f"Requested node {n} of a network of {len(self)} nodes")
+        return self._net._node(n)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def __iadd__(self, nodes):
+        """Adds the nodes of a {n: node} dictionary"""
+        for node in nodes.values():
+            self._net._grow(node.n + 1)
+        return self
+
+    def __getattr__(self, attr_name):
+        if attr_name.startswith("_"):
+            raise AttributeError(attr_name)
+        if attr_name == "n":
+            return self.index
+        if attr_name == "value":
+            values = self._net._values
+            return values if self._index is None else values[self._index]
+        if attr_name == "position":
+            if self._net.positions is None:
+                raise RuntimeWarning("Node position not defined yet")
+            positions = self._net.positions
+            return positions if self._index is None else positions[self._index]
+        return ci.clist([getattr(node, attr_name) for node in self])
+
+    def __str__(self):
+        return f"NodeView of {len(self)} nodes [" + " ".join(str(node) for node in self) + " ]"
+
+
+class LinkView:
+    """The links of a network (or a selection of them).
+
+    The columns i, j, length, activation and line are served from the network
+    arrays, node1 and node2 give the views of the linked nodes:
+
+        net.links.length            # the (E,) array of lengths
+        net.links.node1.position    # the (E, dim) array of the first ends positions
+
+    Link objects are created only when a link is indexed or iterated over.
+    """
+
+    def __init__(self, net, index=None):
+        self._net = net
+        self._index = index  # None stands for all the links
+
+    @property
+    def index(self):
+        if self._index is None:
+            return np.arange(len(self))
+        return self._index
+
+    def _column(self, array):
+        self._net._check_links()
+        return array if self._index is None else array[self._index]
+
+    def __len__(self):
+        if self._index is None:
+            self._net._check_links()
+            return len(self._net._i)
+        return len(self._index)
+
+    def __iter__(self):
+        return (self._net._link(e) for e in self.index)
+
+    def __getitem__(self, index):
+        e = int(index if self._index is None else self._index[index])
+        return self._net._link(e)
+
+    def __getattr__(self, attr_name):
+        if attr_name.startswith("_"):
+            raise AttributeError(attr_name)
+        if attr_name == "i":
+            return self._column(self._net._i)
+        if attr_name == "j":
+            return self._column(self._net._j)
+        if attr_name == "length":
+            return self._column(self._net._lengths)
+        if attr_name == "activation":
+            return self._column(self._net._activations)
+        if attr_name == "line":
+            return list(self._column(self._net._lines))
+        if attr_name == "node1":
+            return NodeView(self._net, self._column(self._net._i))
+        if attr_name == "node2":
+            return NodeView(self._net, self._column(self._net._j))
+        return ci.clist([getattr(link, attr_name) for link in self])
+
+    def __str__(self):
+        return f"LinkView of {len(self)} links [" + " ".join(str(link) for link in self) + " ]"
+
+
 class Network:
-    """Compositional class for describing networks."""
+    """Compositional class for describing networks.
 
-    def __init__(self):
+    The network is stored by columns: links are the arrays of their ends,
+    lengths and activations, nodes are the arrays of their values and
+    positions. Node and Link objects are views created on request.
+    """
 
-        # Nodes are contained in a dictionary because are labelled
-        # but the insertion is not contiguous
-        self.nodes = ci.cdict()  # TODO: standard constructor does not work
+    # Undirected and directed networks differ only in this
+    directed = False
+    link_class = undLink
 
-        # Links are contained in a set beacuse it really doesn't make sense
-        # to define an ordering of links
-        self.links = ci.cset()
+    def __init__(self):
 
         # Number of nodes
         self.N = None
+        self._values = np.zeros(0)
+
+        # Links (one entry for each link, the first given is kept)
+        self._i = np.zeros(0, dtype=np.uint32)
+        self._j = np.zeros(0, dtype=np.uint32)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._activations = np.zeros(0, dtype=np.float32)
+        self._lines = np.zeros(0, dtype=object)
+
+        self.nodes = NodeView(self)
+        self.links = LinkView(self)
+
+        # Node and Link objects live as long as someone uses them
+        self._node_objects = weakref.WeakValueDictionary()
+        self._link_objects = weakref.WeakValueDictionary()
+
+        # Embedding positions as a single (N, dim) array
+        # (each node position is a view of its row)
+        self.positions = None
+
+        # Node labels, when the network is built from labelled edges
+        self.labels = None
 
         # Descriptive matrices
         self._distanceM = None
-        self.linkM = None
+        self._linkM = None
         self._targetM = None
         self._targetSM = None
+        self._target_lookup = None
+        self._incidence = None
+        self._link_lookup = None
 
         # Related graphical objects
         self.repr_dim = 2
         self.scatplot = None
 
         # cnets parameters
+        self.cgraph = None
         self.is_cnet_initialized = False
+        self._target_slots = None
+
+        # Set when cgraph is mapped from a graph file (see open)
+        self._file_backed = False
+
+    def _node(self, n):
+        node = self._node_objects.get(n)
+        if node is None:
+            node = Node(n, net=self)
+            self._node_objects[n] = node
+        return node
+
+    def _check_links(self):
+        """Raises if the links are not in memory (networks made by open)"""
+        if self._file_backed:
+            raise RuntimeError("links of a file-backed network are not loaded (see open)")
+
+    def _link(self, e):
+        self._check_links()
+        link = self._link_objects.get(e)
+        if link is None:
+            link = self.link_class(
+                self._node(self._i[e]), self._node(self._j[e]), net=self, index=e
+            )
+            self._link_objects[e] = link
+        return link
+
+    def _touch(self):
+        """Drops what is computed from the links, after they change"""
+        self._linkM = None
+        self._targetM = None
+        self._incidence = None
+
+    def _grow(self, N):
+        """Makes room for the nodes up to N - 1"""
+        if self.N is None or N > self.N:
+            self._values = np.concatenate((self._values, np.zeros(N - len(self._values))))
+            self.N = N
+
+    def _link_keys(self, i, j):
+        """Keys that are equal for equivalent links"""
+        i, j = i.astype(np.uint64), j.astype(np.uint64)
+        if not self.directed:
+            i, j = np.minimum(i, j), np.maximum(i, j)
+        return (i << np.uint64(32)) | j
+
+    def _set_links(self, i, j, lengths, unique=False):
+        """Sets the links from the arrays of their ends and lengths, dropping the repeated ones.
+
+        If unique the links are known to be distinct and uint32/float32 arrays are kept
+        as they are (memory maps included), without copies.
+        """
+        i = np.asarray(i, dtype=np.uint32)
+        j = np.asarray(j, dtype=np.uint32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+        if unique:
+            self._i, self._j, self._lengths = i, j, lengths
+        else:
+            _, first = np.unique(self._link_keys(i, j), return_index=True)
+            first = np.sort(first)
+            self._i, self._j, self._lengths = i[first], j[first], lengths[first]
+        self._activations = np.zeros(len(self._i), dtype=np.float32)
+        self._lines = np.full(len(self._i), None, dtype=object)
+        self._link_objects = weakref.WeakValueDictionary()
+        self._link_lookup = None
+        self._grow(int(max(i.max(initial=0), j.max(initial=0))) + 1 if len(i) else 0)
+        self._touch()
+
+    def _lookup(self):
+        """The sorted keys of the links and the corresponding link indexes"""
+        self._check_links()
+        if self._link_lookup is None:
+            keys = self._link_keys(self._i, self._j)
+            order = np.argsort(keys, kind="stable")
+            self._link_lookup = (keys[order], order)
+        return self._link_lookup
+
+    def link_index(self, i, j):
+        """Index of the link i -> j in the link arrays (also j -> i in undirected networks),
+        -1 if there is no such link.
+
+        Costs O(log E) and works with arrays of ends too.
+        """
+        keys, order = self._lookup()
+        wanted = self._link_keys(np.asarray(i, dtype=np.uint32), np.asarray(j, dtype=np.uint32))
+        if len(keys) == 0:
+            return np.full(np.shape(wanted), -1)[()]
+        k = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        return np.where(keys[k] == wanted, order[k], -1)[()]
+
+    def has_link(self, i, j):
+        """Whether i is linked to j (works with arrays of ends too)"""
+        return self.link_index(i, j) >= 0
+
+    def _synapses_of(self, n):
+        offsets, _, edges = self.csr
+        return ci.cset([self._link(e) for e in edges[offsets[n] : offsets[n + 1]]])
+
+    @property
+    def csr(self):
+        """The links of each node as (offsets, childs, links):
+        the childs of node n are childs[offsets[n]:offsets[n+1]] and
+        links holds the indexes of the corresponding links.
+
+        In undirected networks each link is in the rows of both its ends.
+        """
+        self._check_links()
+        if self._incidence is None:
+            E = np.arange(len(self._i))
+            if self.directed:
+                ends, others, edges = self._i, self._j, E
+            else:
+                ends = np.concatenate((self._i, self._j))
+                others = np.concatenate((self._j, self._i))
+                edges = np.concatenate((E, E))
+            order = np.argsort(ends, kind="stable")
+            offsets = np.zeros((self.N or 0) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(ends, minlength=self.N or 0))
+            self._incidence = (offsets, others[order], edges[order])
+        return self._incidence
 
     def add_link(self, node1, node2, distance):
-        """This is what differs between directed and undirected nets, the rest seems almost identical.
+        """Adds a link and returns it (if the link is already there it is left as it is).
 
         As a convention for the arguments' order I choose:
 
         add_link(node1, node2, distance) == "set node2 as a child of node1 at given distance"
 
-        so the first node is connected to the second but the opposite is not true.
+        so the first node is connected to the second but the opposite is not true
+        (in directed networks).
+        """
+        existing = self.link_index(node1.n, node2.n)
+        if existing >= 0:
+            return self._link(existing)
+
+        # Keeps the lookup in sync without sorting again
+        i = np.array([node1.n], dtype=np.uint32)
+        j = np.array([node2.n], dtype=np.uint32)
+        keys, order = self._lookup()
+        key = self._link_keys(i, j)
+        k = np.searchsorted(keys, key)
+        self._link_lookup = (np.insert(keys, k, key), np.insert(order, k, len(self._i)))
+
+        self._i = np.concatenate((self._i, i))
+        self._j = np.concatenate((self._j, j))
+        self._lengths = np.append(self._lengths, np.float32(distance))
+        self._activations = np.append(self._activations, np.float32(0))
+        self._lines = np.append(self._lines, np.full(1, None, dtype=object))
+        self._grow(max(node1.n, node2.n) + 1)
+        self._touch()
+        return self._link(len(self._i) - 1)
+
+    def add_links(self, i, j, lengths):
+        """Adds the links (i, j) with the given lengths, returns how many were not there.
+
+        Nodes out of range are created. If the embedding is initialized the links
+        are inserted in cnets keeping the positions of the nodes, and the new nodes
+        are placed near their neighbours: call relax() to settle them.
+        """
+        i = np.atleast_1d(np.asarray(i, dtype=np.uint32))
+        j = np.atleast_1d(np.asarray(j, dtype=np.uint32))
+        lengths = np.broadcast_to(np.asarray(lengths, dtype=np.float32), i.shape)
+
+        # Only the first of repeated links is kept, like in from_sparse
+        _, first = np.unique(self._link_keys(i, j), return_index=True)
+        first = np.sort(first)
+        i, j, lengths = i[first], j[first], lengths[first]
+        new = self.link_index(i, j) < 0
+        i, j, lengths = i[new], j[new], lengths[new]
+        if len(i) == 0:
+            return 0
+
+        E = len(self._i)
+        self._i = np.concatenate((self._i, i))
+        self._j = np.concatenate((self._j, j))
+        self._lengths = np.concatenate((self._lengths, lengths))
+        self._activations = np.concatenate((self._activations, np.zeros(len(i), dtype=np.float32)))
+        self._lines = np.concatenate((self._lines, np.full(len(i), None, dtype=object)))
+        self._link_lookup = None
+        self._grow(int(max(i.max(), j.max())) + 1)
+        self._touch()
+
+        # The new links are targets only if targetSM is up to date
+        if self._targetSM is not None and len(self._targetSM) == E:
+            self._targetSM = np.concatenate((self._targetSM, np.column_stack((i, j, lengths))))
+
+        if self.is_cnet_initialized:
+            self.cgraph.add_links(i, j, lengths, N=self.N)
+            self._target_slots = None
+            self.positions = self.cgraph.get_positions()
+        elif self.positions is not None and len(self.positions) < self.N:
+            grown = np.zeros((self.N, self.positions.shape[1]), dtype=self.positions.dtype)
+            grown[: len(self.positions)] = self.positions
+            self.positions = grown
+        return len(i)
+
+    def _keep_links(self, keep):
+        """Drops the links where keep is False, the others keep their order.
+
+        Link objects of dropped links become free links, the others follow their index.
         """
-        raise NotImplementedError()
+        new_index = np.cumsum(keep) - 1
+        link_objects = weakref.WeakValueDictionary()
+        for e, link in list(self._link_objects.items()):
+            if keep[e]:
+                link._index = int(new_index[e])
+                link_objects[link._index] = link
+            else:
+                link._detach()
+        self._link_objects = link_objects
+
+        if self._targetSM is not None and len(self._targetSM) <= len(keep):
+            self._targetSM = self._targetSM[keep[: len(self._targetSM)]]
+        self._i, self._j = self._i[keep], self._j[keep]
+        self._lengths = self._lengths[keep]
+        self._activations = self._activations[keep]
+        self._lines = self._lines[keep]
+        self._link_lookup = None
+        self._target_slots = None
+        self._touch()
+
+    def remove_links(self, i, j):
+        """Removes the links (i, j) that are there, returns how many they were.
+
+        The embedding (if initialized) keeps the positions of the nodes.
+        """
+        edges = np.atleast_1d(self.link_index(i, j))
+        edges = np.unique(edges[edges >= 0])
+        if len(edges) == 0:
+            return 0
+        i, j = self._i[edges], self._j[edges]
+        keep = np.ones(len(self._i), dtype=bool)
+        keep[edges] = False
+        self._keep_links(keep)
+
+        if self.is_cnet_initialized:
+            # cnets links have no direction: i <-> j stays while j -> i is there
+            if self.directed:
+                unlinked = ~self.has_link(j, i)
+                i, j = i[unlinked], j[unlinked]
+            self.cgraph.remove_links(i, j)
+        return len(edges)
+
+    def remove_nodes(self, nodes):
+        """Removes the nodes and their links. The following nodes are renumbered keeping
+        their order, like the rows of np.delete.
+
+        Node and link objects of the removed ones become free objects, the others follow
+        their new index. The embedding (if initialized) keeps the positions of the nodes.
+        """
+        self._check_links()
+        nodes = np.unique(np.atleast_1d(np.asarray(nodes, dtype=np.int64)))
+        if len(nodes) and (nodes[0] < 0 or nodes[-1] >= self.N):
+            raise IndexError(f"can't remove nodes out of range (network has {self.N} nodes)")
+        removed = np.zeros(self.N, dtype=bool)
+        removed[nodes] = True
+        new_index = np.cumsum(~removed) - 1
+
+        self._keep_links(~(removed[self._i] | removed[self._j]))
+        self._i = new_index[self._i].astype(np.uint32)
+        self._j = new_index[self._j].astype(np.uint32)
+        if self._targetSM is not None:
+            self._targetSM = self._targetSM[~(removed[self._targetSM[:, 0].astype(np.int64)]
+                                              | removed[self._targetSM[:, 1].astype(np.int64)])]
+            self._targetSM[:, :2] = new_index[self._targetSM[:, :2].astype(np.int64)]
+
+        node_objects = weakref.WeakValueDictionary()
+        for n, node in list(self._node_objects.items()):
+            if removed[n]:
+                node._detach()
+            else:
+                node.n = int(new_index[n])
+                node_objects[node.n] = node
+        self._node_objects = node_objects
+
+        self._values = self._values[~removed]
+        if self.labels is not None:
+            self.labels = utils.Labels(self.labels[~removed])
+        self.N = int(np.sum(~removed))
+        if self.is_cnet_initialized:
+            self.cgraph.remove_nodes(nodes)
+            self.positions = self.cgraph.get_positions()
+        elif self.positions is not None:
+            self.positions = self.positions[~removed]
+        self._touch()
+
+    def relax(self, nodes, step=0.1, neg_step=0.001, Nsteps=100, hops=1):
+        """MDE steps that move only the given nodes and those within hops links from them,
+        e.g. to settle the nodes touched by add_links. Returns how many nodes were moved.
+        """
+        if not self.is_cnet_initialized:
+            raise RuntimeError("embedding is not initialized")
+        moved = self.cgraph.refine(np.atleast_1d(nodes), step, neg_step, Nsteps, hops=hops)
+        self._pull_positions()
+        return moved
+
+    def _pull_positions(self):
+        """Copies the positions of cgraph in place, so that nodes' views stay valid"""
+        if not self._file_backed:
+            self.positions[:] = self.cgraph.positions
 
     def initialize_embedding(self, dim=2):
-        cnets.init_network(self.targetSM, list(self.nodes.value), dim)
-        for node, position in zip(self, cnets.get_positions()):
-            node.position = np.array(position, dtype=np.float32)
+        # Each network owns its cnets graph. Unless targetSM was set, the targets are
+        # the links, whose columns cnets reads in place
+        if self._targetSM is None:
+            targets = (self._i, self._j, self._lengths)
+        else:
+            targets = self._targetSM
+        self.cgraph = cnets.Graph(targets, self._values.astype(np.float32), dim)
+        self._target_slots = None
+        self.positions = self.cgraph.get_positions()
         self.repr_dim = dim
         self.is_cnet_initialized = True
 
     @classmethod
     def from_sparse(cls, sparse_matrix):
-        """generates network from a sparse matrix"""
+        """generates network from a sparse matrix
+
+        The sparse matrix is either a list/array of [i, j, d] links
+        or the tuple of arrays (i, j, d) given by cnets.knn
+        (further arrays, like the weights of variable_metric_ball_neighbours, are ignored)
+        """
 
         # raw init
         net = cls()
 
-        net._targetSM = np.array(sparse_matrix)
-        net.N = int(np.max(net._targetSM.transpose()[:2])) + 1
+        if isinstance(sparse_matrix, tuple) and all(isinstance(c, np.ndarray) for c in sparse_matrix):
+            # columns are converted one by one, without an (E, 3) float array in between
+            i, j, distances = sparse_matrix[:3]
+        else:
+            i, j, distances = np.array(sparse_matrix).transpose()[:3]
+        net._set_links(i, j, distances)
+        net._log_size()
+        return net
 
-        net.linkM = np.zeros((net.N, net.N), dtype=np.bool)
-        net._targetM = np.zeros((net.N, net.N), dtype=np.float32)
+    def _log_size(self):
+        logger.info(
+            "Network has %d elements and %d links (density = %.1f %%)",
+            len(self.nodes), len(self.links), 200*len(self.links)/(len(self.nodes)**2 - len(self.nodes)),
+        )
 
-        # gets a sparse matrix like (i,j) dist
-        # and create nodes
-        print("Linking..                  ", end="\r")
-        for i, j, distance in net.targetSM:
+    @classmethod
+    def from_file(cls, path, delimiter=None, chunk_size=1 << 26, **kwargs):
+        """generates network from an edge list file
+
+        Netgross edge files (see to_file) are memory mapped and their columns are used
+        in place, cnets included: to_file writes no repeated links, so they are not
+        looked for. Other files are read as
+        CSV/TSV lines "source target [length]" (whitespace separated if no delimiter
+        is given), chunk_size bytes at a time, and their labels are kept in net.labels
+        like in from_edges. Further keywords go to utils.read_edge_list.
+        """
+        if utils.is_edge_file(path):
+            i, j, lengths, N = utils.read_edge_file(path)
+            net = cls()
+            # Node indexes are not negative, so the int32 columns are read as uint32
+            net._set_links(i.view(np.uint32), j.view(np.uint32), lengths, unique=True)
+            net._grow(N)
+            net._log_size()
+            return net
+        labels, links = utils.read_edge_list(path, delimiter=delimiter, chunk_size=chunk_size, **kwargs)
+        net = cls.from_sparse(links)
+        net.labels = labels
+        return net
 
-            i, j = np.uintc(i), np.uintc(j)
+    def to_file(self, path):
+        """Writes the links in a netgross edge file (labels and values are not saved)"""
+        self._check_links()
+        utils.write_edge_file(path, self._i, self._j, self._lengths, self.N)
 
-            net.add_link(
-                net.nodes.get(i, Node(i)),
-                net.nodes.get(j, Node(j)),
-                np.float32(distance),
-            )  # connect and add link to set
+    @classmethod
+    def from_edges(cls, sources, targets, lengths):
+        """generates network from an edge list whose nodes have arbitrary labels
 
-        print(
-            f"Network has {len(net.nodes)} elements and {len(net.links)} links (density = {200*len(net.links)/(len(net.nodes)**2 - len(net.nodes) ): .1f} %)"
-        )
+        The labels are translated to node indexes and kept in net.labels,
+        that maps them back (net.labels[n]) and forth (net.labels.index(label)).
+        """
+        labels, (i, j) = utils.Labels.intern(sources, targets)
+        net = cls.from_sparse((i, j, np.asarray(lengths, dtype=np.float32)))
+        net.labels = labels
         return net
 
     @classmethod
@@ -239,43 +834,87 @@ class Network:
         # here checks if the matrix is a good one
         # that is to say square, symmetric and M_ii = 0
         # float comparison: dangerous?
-        matrix = np.array(matrix)
+        # only the non-null entries are checked, so no other (N, N) array is made
+        matrix = np.asarray(matrix)
+
+        if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+            raise ValueError("Matrix is not square")
 
-        if (matrix != matrix.transpose()).any():
-            raise ValueError("Matrix is not symmetric")
+        for i, j, values in utils.nonzero_blocks(matrix):
+            if (values != matrix[j, i]).any():
+                raise ValueError("Matrix is not symmetric")
 
-        if (matrix.diagonal() != np.zeros(len(matrix))).any():
+        if (matrix.diagonal() != 0).any():
             raise ValueError("Matrix has non-null diagonal")
 
         sparseM = utils.matrix_to_sparse(matrix)
         net = cls.from_sparse(sparseM)
         return net
 
+    def _both_directions(self, values):
+        """The entries (i, j, value) of a link matrix, symmetric in undirected networks"""
+        self._check_links()
+        if self.directed:
+            return self._i, self._j, values
+        return (
+            np.concatenate((self._i, self._j)),
+            np.concatenate((self._j, self._i)),
+            np.concatenate((values, values)),
+        )
+
+    @property
+    def linkM(self):
+        """The (N, N) sparse boolean matrix of the links"""
+        if self._linkM is None:
+            self._linkM = utils.SparseMatrix(
+                *self._both_directions(np.ones(len(self._i), dtype=bool)), (self.N, self.N)
+            )
+        return self._linkM
+
+    def distance_blocks(self, block_size=1024):
+        """Yields the rows of the full (N, N) matrix of the embedding distances
+        as (first_row, block) with blocks of block_size rows, so that it can be
+        processed without storing it all."""
+        if self.positions is None:
+            raise RuntimeWarning("Node position not defined yet")
+        positions = self.positions.astype(np.float64)
+        for start in range(0, self.N, block_size):
+            block = positions[start : start + block_size, None, :] - positions[None, :, :]
+            yield start, np.sqrt(np.sum(block ** 2, axis=2))
+
     @property
     def distanceM(self):
+        """The full (N, N) matrix of the embedding distances.
+
+        Costs O(N^2) memory: the link distances are in distanceSM.
+        """
         self._distanceM = np.zeros((self.N, self.N))
-        for node in self.nodes:
-            for another_node in self.nodes:
-                self._distanceM[node.n, another_node.n] = np.sqrt(
-                    np.sum((node.position - another_node.position) ** 2)
-                )
+        for start, block in self.distance_blocks():
+            self._distanceM[start : start + len(block)] = block
         return self._distanceM
 
     @property
     def targetM(self):
+        """The (N, N) sparse matrix of the target lengths of the links"""
+        if self._targetM is None:
+            self._targetM = utils.SparseMatrix(
+                *self._both_directions(self._lengths), (self.N, self.N)
+            )
         return self._targetM
 
     @property
     def distanceSM(self):
         """While the linkedness is not symmetric, the distance inside the embedding
         is a symmetric function, so can be evaluated i, j > i+1"""
-        self._distanceSM = np.array([])
-        dummy = self.distanceM
-        for i in range(self.N):
-            for j in range(i + 1, self.N):
-                if self.linkM[i, j]:
-                    self._distanceSM = np.append(self._distanceSM, [i, j, dummy[i, j]])
-        self._distanceSM = self._distanceSM.reshape((-1, 3))
+        if self.positions is None:
+            raise RuntimeWarning("Node position not defined yet")
+        linkM = self.linkM
+        upper = linkM.rows < linkM.cols
+        i, j = linkM.rows[upper], linkM.cols[upper]
+        distances = np.linalg.norm(
+            self.positions[i].astype(np.float64) - self.positions[j], axis=1
+        )
+        self._distanceSM = np.column_stack((i, j, distances)).astype(np.float64)
         return self._distanceSM
 
     @distanceSM.setter
@@ -284,10 +923,16 @@ class Network:
 
     @property
     def targetSM(self):
-        list = []
-        for i, j, d in self._targetSM:
-            list.append([int(i), int(j), d])
-        return list
+        """The (E, 3) array of target links [i, j, d].
+
+        It is passed as it is to cnets, which reads it in place. Until it is set the
+        targets are the links, and it is made from them when first read.
+        """
+        self._check_links()
+        if self._targetSM is None:
+            # One row for each link, so that single targets can be updated later
+            self._targetSM = np.column_stack((self._i, self._j, self._lengths))
+        return self._targetSM
 
     @targetSM.setter
     def targetSM(self, value):
@@ -295,62 +940,304 @@ class Network:
 
     @property
     def distortion(self):
-        return np.sum(
-            ((self._targetM - self.distanceM) * self.linkM.astype(np.float64)) ** 2
-        ) / len(self.nodes)/2
+        """Sum of the squared errors of the links lengths in the embedding, over the two
+        directions of each link, divided by 2N
+
+        Networks made by open have no links in memory: cnets computes it over the
+        targets in the file, where each link has both directions.
+        """
+        if self._file_backed:
+            return self.cgraph.distortion() / 2
+        if self.positions is None:
+            raise RuntimeWarning("Node position not defined yet")
+        distances = np.linalg.norm(self.positions[self._i] - self.positions[self._j], axis=1)
+        directions = 1 if self.directed else 2
+        return directions * np.sum((self._lengths - distances) ** 2) / len(self.nodes)/2
 
     @property
     def values(self):
-        return [node.value for node in self]
+        return self._values
 
     @values.setter
     def values(self, givens):
         if len(givens) != self.N:
             raise ValueError("one value must be given for each node")
-        for node, val in zip(self, givens):
-            node.value = val
-
-    def cMDE(self, step=0.1, neg_step=0.001, Nsteps=1000):
+        self._values[:] = np.asarray(list(givens))
+
+    def cMDE(self, step=0.1, neg_step=0.001, Nsteps=1000, negatives=None,
+             repulsion="sampled", theta=0.5, tol=0.0, window=10, schedule="constant",
+             final_ratio=0.01, optimizer="sgd", momentum=0.9, callback=None, callback_every=10,
+             checkpoint=None, checkpoint_every=1000, resume=False, strategy="flat", level_steps=100,
+             samples=0, weights=None):
+        """Minimum distortion embedding using cnets, returns the number of steps done.
+
+        If `negatives` is given, each node is pushed away from that number of random
+        not-childs per step, otherwise from a fraction of the whole network.
+
+        With `repulsion="barneshut"` (2D and 3D only) nodes are pushed away from
+        the whole network using a Barnes-Hut tree with opening angle `theta`.
+
+        If `tol` is given, every `window` steps the distortion is checked and the run
+        stops when it improved less than `tol` (relative) since the last check.
+
+        The steps decay along `schedule` ("constant", "exponential" or "cosine")
+        down to `final_ratio` times the initial ones. With `optimizer="momentum"`
+        displacements are accumulated with decay `momentum`, with `optimizer="adam"`
+        each node makes steps `step` long normalized by its own gradient history.
+        With `optimizer="edges"` each step draws `samples` links at random (by default as many as
+        the links, so the total work is Nsteps*samples links whatever the degrees) with chance
+        proportional to `weights` (one for each link, default uniform) and moves both their nodes.
+
+        If `callback` is given, every `callback_every` steps of each phase it is called as
+        callback(step, positions, stats) with the current step (counted over all the phases),
+        a read-only view of the positions in cnets and the dict of cgraph.get_stats().
+        If it returns a true value the run stops (remaining phases included).
+
+        If `checkpoint` is a path, the graph is saved there every `checkpoint_every` steps
+        of each phase and when the run ends. With `resume=True` an existing checkpoint is loaded first
+        and the run goes on from its step (the momentum of the optimizers starts again).
+
+        With `strategy="multilevel"` the nodes are first placed by multilevel_init (with
+        `level_steps` steps on each coarse level and the first step and neg_step), so that
+        far fewer steps are needed on the whole network.
+
+        Lists of step, neg_step and Nsteps are run as consecutive phases.
+        """
+        phased = hasattr(step, '__iter__') or hasattr(neg_step, '__iter__') or hasattr(Nsteps, '__iter__')
+        if phased:
+            if not all(hasattr(p, '__iter__') for p in (step, neg_step, Nsteps)) or \
+                    not len(step) == len(neg_step) == len(Nsteps):
+                raise ValueError("invalid format for MDE parameters")
+            phases = list(zip(step, neg_step, Nsteps))
+        else:
+            phases = [(step, neg_step, Nsteps)]
+        if checkpoint is not None and checkpoint_every <= 0:
+            raise ValueError("checkpoint_every must be positive")
+        if strategy not in ("flat", "multilevel"):
+            raise ValueError(f"unknown strategy '{strategy}' (must be 'flat' or 'multilevel')")
+
+        first_step = 0
+        if checkpoint is not None and resume and os.path.exists(checkpoint):
+            first_step = self.load_checkpoint(checkpoint)
+        elif not self.is_cnet_initialized:
+            self.initialize_embedding()
+        if negatives is not None:
+            self.cgraph.negatives_per_node = negatives
+        if weights is not None:
+            self._check_links()
+            if len(weights) != len(self._i):
+                raise ValueError("one weight must be given for each link")
+            # Both slots of a link are drawn with its weight
+            slots = self._slots(slice(None))
+            valid = slots >= 0
+            link_weights = np.repeat(np.asarray(weights, dtype=np.float32), 2).reshape(-1, 2)
+            weights = np.zeros(self.cgraph.N_slots, dtype=np.float32)
+            weights[slots[valid]] = link_weights[valid]
+        level_options = dict(repulsion=repulsion, theta=theta, schedule=schedule,
+                             final_ratio=final_ratio, optimizer=optimizer, momentum=momentum)
+        if strategy == "multilevel" and first_step == 0:
+            self.multilevel_init(phases[0][0], phases[0][1], level_steps, **level_options)
+
+        offset = 0
+        stopped = False
+
+        def run_callback(phase_step, positions, stats):
+            nonlocal stopped
+            if checkpoint is not None and phase_step % checkpoint_every == 0:
+                self.cgraph.save(checkpoint, step=offset + phase_step)
+            if callback is not None and phase_step % callback_every == 0:
+                stopped = bool(callback(offset + phase_step, positions, stats))
+            return stopped
+
+        every = callback_every
+        if checkpoint is not None:
+            every = checkpoint_every if callback is None else math.gcd(callback_every, checkpoint_every)
+        options = dict(level_options, tol=tol, window=window, samples=samples, weights=weights,
+                       callback=None if callback is None and checkpoint is None else run_callback,
+                       callback_every=every)
+        steps_done = 0
+        try:
+            for s, ns, N in phases:
+                if first_step < offset + N:
+                    steps_done += self.cgraph.mde(s, ns, N, start=max(first_step - offset, 0), **options)
+                if stopped:
+                    break
+                offset += N
+        finally:
+            # Also if the callback raised
+            self._pull_positions()
+        if checkpoint is not None:
+            self.cgraph.save(checkpoint, step=first_step + steps_done)
+        if self._file_backed:
+            self.cgraph.sync()
+        return steps_done
+
+    def multilevel_init(self, step=0.1, neg_step=0.001, level_steps=100, coarsest=100, **options):
+        """Places the nodes starting from an embedding of a coarse copy of the network.
+
+        The cnets graph is coarsened (see cnets.Graph.coarsen) until it has less than `coarsest`
+        nodes or stops shrinking. The smallest level is embedded from random positions, then each
+        level is placed from the coarser one and runs `level_steps` MDE steps (options go to
+        cnets.Graph.mde), up to the network itself, that is placed but not moved.
+        Returns the number of coarse levels.
+        """
         if not self.is_cnet_initialized:
             self.initialize_embedding()
-        if hasattr(step, '__iter__') or hasattr(neg_step, '__iter__') or hasattr(Nsteps, '__iter__'):
-            if len(step) == len(neg_step) and len(neg_step) == len(Nsteps):
-                for s, ns, N in zip(step, neg_step, Nsteps):
-                    cnets.MDE(s, ns, N)
-            else:
-                ValueError("invalid format for MDE parameters")
+        levels = [self.cgraph]
+        parents = []
+        while levels[-1].N_nodes > max(coarsest, 1):
+            coarse, parent = levels[-1].coarsen()
+            # Stars and other hub-heavy graphs merge few pairs per level
+            if coarse.N_nodes > 0.9*levels[-1].N_nodes or coarse.N_links == 0:
+                break
+            levels.append(coarse)
+            parents.append(parent)
+        logger.info("multilevel embedding with %d levels: %s nodes", len(levels),
+                    " > ".join(str(level.N_nodes) for level in levels))
+        if len(levels) > 1:
+            levels[-1].mde(step, neg_step, level_steps, **options)
+        for level in range(len(levels) - 2, -1, -1):
+            levels[level].prolong(levels[level + 1], parents[level])
+            if level > 0:
+                levels[level].mde(step, neg_step, level_steps, **options)
+        self._pull_positions()
+        return len(levels) - 1
+
+    def save_checkpoint(self, path, step=None):
+        """Saves the cnets graph (targets, positions, random state) to path"""
+        if not self.is_cnet_initialized:
+            raise RuntimeError("network embedding is not initialized")
+        self.cgraph.save(path, step=step)
+
+    def load_checkpoint(self, path):
+        """Restores the cnets graph saved in path and returns its step count
+
+        The checkpoint must come from a network with the same nodes.
+        """
+        graph = cnets.Graph.load(path)
+        if graph.N_nodes != self.N:
+            raise ValueError(f"checkpoint has {graph.N_nodes} nodes, network has {self.N}")
+        self.cgraph = graph
+        self._target_slots = None
+        if self.is_cnet_initialized and not self._file_backed and self.positions.shape == graph.positions.shape:
+            self.positions[:] = graph.positions
         else:
-            cnets.MDE(step, neg_step, Nsteps)
-        positions = cnets.get_positions()
-        for node, position in zip(self, positions):
-            node.position = np.array(position, dtype=np.float32)
+            self.positions = graph.get_positions()
+            self.repr_dim = self.positions.shape[1]
+        self.is_cnet_initialized = True
+        self._file_backed = False
+        return graph.get_stats()["steps"]
+
+    def to_graph_file(self, path, order="rcm"):
+        """Saves the cnets graph in a file that can be opened without loading it (see open)
+
+        Nodes are renumbered with cgraph.node_order(order) ("rcm" or "bfs") so that
+        linked nodes are close in the file, or kept as they are if order is None.
+        Returns the order: node n of the file is node order[n] of this network.
+        """
+        if not self.is_cnet_initialized:
+            raise RuntimeError("network embedding is not initialized")
+        order = np.arange(self.N) if order is None else self.cgraph.node_order(order)
+        self.cgraph.save(path, order=order)
+        return order
+
+    @classmethod
+    def open(cls, path, writable=True, validate=True):
+        """Opens a graph file (see to_graph_file) or a checkpoint without loading it in memory
+
+        The targets and the positions stay in the file, mapped by cgraph: cMDE runs on them
+        and, if writable, leaves the new positions in the file. net.positions is a read-only
+        view of them. Links are not read back: the network can't be changed and its links
+        can't be read (RuntimeError), distortion is computed by cgraph.
+        validate checks the links in the file once (see cnets.Graph.open).
+        """
+        net = cls()
+        net.cgraph = cnets.Graph.open(path, writable=writable, validate=validate)
+        net.N = net.cgraph.N_nodes
+        net._values = net.cgraph.values
+        net.positions = net.cgraph.positions
+        net.repr_dim = net.positions.shape[1]
+        net.is_cnet_initialized = True
+        net._file_backed = True
+        return net
 
     def to_scatter(self):
-        return np.array(list(self.nodes.position)).transpose()
+        return self.positions.transpose()
 
     def update_target_matrix(self):
-        print("Pynet - updating targets")
-        for node in self.nodes:
-            for link in node.synapses:
-                other = link.get_child(node)
-                self._targetM[node.n, other.n] = link.length
-                self._targetM[other.n, node.n] = link.length
-        self.targetSM = utils.matrix_to_sparse(self.targetM)
+        """Sets the links lengths as the targets of the embedding"""
+        logger.debug("updating targets")
+        self._check_links()
+        self.targetSM = np.column_stack((self._i, self._j, self._lengths))
+
+    def _slots(self, edges):
+        """Positions of the given links among the targets of cnets (resolved once per link)"""
+        resolved = 0 if self._target_slots is None else len(self._target_slots)
+        if resolved < len(self._i):
+            new_slots = self.cgraph.link_slots(self._i[resolved:], self._j[resolved:])
+            if self._target_slots is None:
+                self._target_slots = new_slots
+            else:
+                self._target_slots = np.concatenate((self._target_slots, new_slots))
+        return self._target_slots[edges]
 
-    def distortion_activation(self):
-        actual_lengths = (
-            np.sum(
-                np.array(list(self.links.node1.position))
-                - np.array(list(self.links.node2.position)),
-                axis=1,
+    def update_lengths(self, i, j, lengths):
+        """Sets the lengths of the links (i, j) and makes them the targets of the embedding.
+
+        Only the given links are updated (in the link arrays, in targetSM, in targetM
+        and in cnets), so it costs O(k log E) for k links instead of rebuilding everything
+        like update_target_matrix.
+        """
+        edges = np.atleast_1d(self.link_index(i, j))
+        lengths = np.broadcast_to(np.asarray(lengths, dtype=np.float32), edges.shape)
+        if (edges < 0).any():
+            raise ValueError("can't update the length of links that don't exist")
+
+        self._lengths[edges] = lengths
+
+        # targetSM may have been set in any order: its rows are found by their ends
+        if self._targetSM is not None:
+            rows, which = self._target_rows(self._i[edges], self._j[edges])
+            self._targetSM[rows, 2] = lengths[which]
+
+        if self._targetM is not None:
+            rows, cols, values = self._i[edges], self._j[edges], lengths
+            if not self.directed:
+                rows, cols = np.concatenate((rows, cols)), np.concatenate((cols, rows))
+                values = np.concatenate((values, values))
+            self._targetM.data[self._targetM.find(rows, cols)] = values
+
+        if self.is_cnet_initialized:
+            self.cgraph.update_targets(self._slots(edges), lengths)
+
+    def _target_rows(self, i, j):
+        """The rows of targetSM holding the links (i, j) (in both directions if undirected)
+        and, for each row, the index of its link among the given ones.
+
+        The sorted keys of the rows are made once for each targetSM array.
+        """
+        if self._target_lookup is None or self._target_lookup[0] is not self._targetSM:
+            keys = self._link_keys(
+                self._targetSM[:, 0].astype(np.uint32), self._targetSM[:, 1].astype(np.uint32)
             )
-            ** 2
+            order = np.argsort(keys, kind="stable")
+            self._target_lookup = (self._targetSM, keys[order], order)
+        _, keys, order = self._target_lookup
+        wanted = self._link_keys(i, j)
+        first = np.searchsorted(keys, wanted, side="left")
+        counts = np.searchsorted(keys, wanted, side="right") - first
+        which = np.repeat(np.arange(len(wanted)), counts)
+        # Positions first[w], first[w] + 1, ... of the rows of each wanted link
+        within = np.arange(len(which)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return order[first[which] + within], which
+
+    def distortion_activation(self):
+        actual_lengths = np.linalg.norm(
+            self.links.node1.position - self.links.node2.position, axis=1
         )
-        actual_lengths = np.sqrt(actual_lengths)
-        targets = np.array(list(self.links.length))
+        targets = self._lengths
         distortions = (actual_lengths - targets) / targets
-        for distortion, link in zip(distortions, self.links):
-            link.activation = np.tanh(distortion)
+        self._activations[:] = np.tanh(distortions)
 
     @classmethod
     def Random(cls, number_of_nodes, connection_probability, max_dist=1.0):
@@ -372,7 +1259,7 @@ class Network:
         'connection_probability' parametrizes the number of connections
         from 0 -> N(N-1/2) in a smooth way.
         """
-        print("Initializing random network...", end="\r")
+        logger.debug("initializing random network")
         M = np.random.uniform(0, 1, size=number_of_nodes ** 2).reshape(
             (-1, number_of_nodes)
         )
@@ -381,8 +1268,7 @@ class Network:
         links = (M < connection_probability).astype(np.float32)
         M = M * links * max_dist
         net = cls.from_adiacence(M)
-        for node in net:
-            node.value = np.random.uniform(0, 1)
+        net.values = np.random.uniform(0, 1, size=net.N)
         return net
 
     def __iter__(self):
@@ -406,29 +1292,10 @@ class Network:
 
 
 class undNetwork(network.Network):
-    def __init__(self):
-        super().__init__()
-
-    def add_link(self, node1, node2, distance):
-
-        self.linkM[node1.n, node2.n] = True
-        self.linkM[node2.n, node1.n] = True
-
-        self._targetM[node1.n, node2.n] = distance
-        self._targetM[node2.n, node1.n] = distance
-
-        self.nodes += {node1.n: node1, node2.n: node2}
-        self.links += node1.connect(node2, distance, directed=False)
+    directed = False
+    link_class = undLink
 
 
 class dirNetwork(network.Network):
-    def __init__(self):
-        super().__init__()
-
-    def add_link(self, node1, node2, distance):
-
-        self.linkM[node1.n, node2.n] = True
-        self._targetM[node1.n, node2.n] = distance
-
-        self.nodes += {node1.n: node1, node2.n: node2}
-        self.links += node1.connect(node2, distance, directed=True)
+    directed = True
+    link_class = dirLink
@@ -1,43 +1,379 @@
 import numpy as np
 
 def compact_indexes(sparseM):
-    # again: definitely not the most elegant way to do it
-    # but it's late night and I am tired (ah ah, just an excuse)
-    sparseM = np.array(sparseM)
-    indexes = sparseM.transpose()[:2].flatten()
-    indexes = set(indexes)
-    indexes = np.sort(list(indexes))
-    translate = dict([couple for couple in zip(indexes, np.arange(len(indexes)))])
-    result = np.zeros(sparseM.shape)
-
-    for row_index in range(len(sparseM)):
-        result[row_index] = [
-            translate[sparseM[row_index, 0]],
-            translate[sparseM[row_index, 1]],
-            sparseM[row_index, 2],
-        ]
-
+    """Renames the nodes of a [i, j, ...] link list to 0, ..., N-1 keeping their order"""
+    result = np.array(sparseM, dtype=np.float64)
+    indexes, inverse = np.unique(result[:, :2], return_inverse=True)
+    result[:, :2] = inverse.reshape(-1, 2)
     return result
 
 
-def matrix_to_sparse(matrix):
-    N = len(matrix)
+def nonzero_blocks(matrix, block_size=1024):
+    """Yields the non-null entries (i, j, value) of a matrix, block_size rows at a time,
+    so that no temporary array bigger than a block of rows is made"""
+    matrix = np.asarray(matrix)
+    for start in range(0, matrix.shape[0], block_size):
+        block = matrix[start : start + block_size]
+        i, j = np.nonzero(block)
+        yield i + start, j, block[i, j]
+
+
+def matrix_to_sparse(matrix, block_size=1024):
+    # only the non-null values are read, no other (N, N) array is made
+    blocks = list(nonzero_blocks(matrix, block_size))
+    if not blocks:
+        # a matrix with no rows has no links
+        return np.zeros((0, 3))
+    sparse = np.column_stack([np.concatenate(column) for column in zip(*blocks)])
+    return compact_indexes(sparse)
+
+
+def _label_array(labels):
+    """A 1D array of labels, of objects when they are not all scalars (e.g. tuples)"""
+    try:
+        array = np.asarray(labels)
+    except ValueError:
+        array = None
+    # numpy would silently turn [3, "x"] into ["3", "x"]
+    if (
+        array is not None
+        and not isinstance(labels, np.ndarray)
+        and array.dtype.kind in "US"
+        and not all(isinstance(label, (str, bytes)) for label in labels)
+    ):
+        array = None
+    if array is None or array.ndim != 1:
+        labels = list(labels)
+        array = np.empty(len(labels), dtype=object)
+        array[:] = labels
+    return array
+
+
+class Labels:
+    """Maps arbitrary node labels (strings, ints, ...) to the indexes 0, ..., N-1.
+
+    Labels are sorted when they can be compared, otherwise they keep the
+    order in which they are first seen:
+
+        labels, (i, j) = Labels.intern(sources, targets)
+        labels.index(["a", "b"])    # the indexes of some labels
+        labels[i]                   # the labels of some indexes
+    """
+
+    def __init__(self, labels):
+        self.labels = np.asarray(labels)
+        self._position = None
+        if self.labels.dtype == object:
+            self._position = {label: n for n, label in enumerate(self.labels)}
+
+    @classmethod
+    def intern(cls, *columns):
+        """The labels found in the columns and the columns translated into indexes"""
+        columns = [_label_array(column) for column in columns]
+        lengths = np.cumsum([len(column) for column in columns])[:-1]
+        values = np.concatenate(columns)
+        try:
+            labels, inverse = np.unique(values, return_inverse=True)
+        except TypeError:
+            # labels of different types can't be sorted: they are hashed instead
+            position = {}
+            inverse = np.fromiter(
+                (position.setdefault(label, len(position)) for label in values.tolist()),
+                dtype=np.int64,
+                count=len(values),
+            )
+            labels = np.empty(len(position), dtype=object)
+            labels[:] = list(position)
+        inverse = inverse.astype(np.uint32)
+        return cls(labels), np.split(inverse, lengths)
+
+    def index(self, labels):
+        """The indexes of the given labels, raises KeyError for unknown ones"""
+        if self._position is not None:
+            try:
+                # a tuple can be a label itself
+                if self._is_label(labels) or np.isscalar(labels):
+                    return self._position[labels]
+                return np.fromiter((self._position[label] for label in labels), dtype=np.int64)
+            except KeyError as e:
+                raise KeyError(f"Unknown label {e}") from None
+        labels = np.asarray(labels)
+        if len(self.labels) == 0:
+            if labels.size:
+                raise KeyError(f"Unknown labels {np.atleast_1d(labels)}")
+            return np.zeros(labels.shape, dtype=np.int64)[()]
+        k = np.minimum(np.searchsorted(self.labels, labels), len(self.labels) - 1)
+        found = self.labels[k] == labels
+        if not np.all(found):
+            raise KeyError(f"Unknown labels {np.atleast_1d(labels)[~np.atleast_1d(found)]}")
+        return k
+
+    def _is_label(self, label):
+        try:
+            return label in self._position
+        except TypeError:
+            return False
+
+    def __getitem__(self, indexes):
+        return self.labels[indexes]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        try:
+            self.index(label)
+        except KeyError:
+            return False
+        return True
+
+
+class _LabelStream:
+    """Translates labels that come in chunks into node indexes.
+
+    Each label gets a code when it is first seen, codes are renumbered
+    in label order by finish(), so that the result is the one of Labels.intern.
+    Only the distinct labels are kept, sorted, so labels must be comparable.
+    """
+
+    def __init__(self):
+        self.known = None
+        self.codes = np.zeros(0, dtype=np.int64)
+
+    def add(self, values):
+        """The codes of the labels in values"""
+        unique, inverse = np.unique(values, return_inverse=True)
+        if self.known is None:
+            self.known, self.codes = unique, np.arange(len(unique))
+            return inverse.astype(np.uint32)
+        k = np.searchsorted(self.known, unique)
+        found = k < len(self.known)
+        found[found] = self.known[k[found]] == unique[found]
+        unique_codes = np.empty(len(unique), dtype=np.int64)
+        unique_codes[found] = self.codes[k[found]]
+        unique_codes[~found] = np.arange(len(self.known), len(self.known) + np.count_nonzero(~found))
+        # both arrays are sorted: the new labels are merged in place
+        self.known = np.insert(self.known, k[~found], unique[~found])
+        self.codes = np.insert(self.codes, k[~found], unique_codes[~found])
+        return unique_codes[inverse].astype(np.uint32)
+
+    def finish(self):
+        """The sorted labels and the index of each code"""
+        remap = np.empty(len(self.codes), dtype=np.uint32)
+        remap[self.codes] = np.arange(len(self.codes), dtype=np.uint32)
+        return self.known, remap
+
+
+def read_edge_list(path, delimiter=None, chunk_size=1 << 26, comments="#", skip_header=0,
+                   default_length=1.0, numeric_labels=None):
+    """Reads a CSV/TSV edge list (source, target[, length], ...) chunk_size bytes at a time.
+
+    Labels are interned while reading, so only the index columns and the
+    distinct labels are kept in memory. If numeric_labels is None, labels are
+    numbers when the ones of the first chunk are integers. Lines without a
+    length get default_length, further columns are ignored.
+
+    Returns the Labels and the (i, j, lengths) arrays.
+    """
+    separator = None if delimiter is None else delimiter.encode()
+    comments = comments.encode() if comments else None
+    stream = _LabelStream()
+    i, j, lengths = [], [], []
+    N_columns = None
+    carry = b""
+    with open(path, "rb") as file:
+        for _ in range(skip_header):
+            file.readline()
+        while True:
+            data = file.read(chunk_size)
+            block = carry + data
+            carry = b""
+            if data:
+                # the last line may be cut in half: it goes to the next chunk
+                cut = block.rfind(b"\n") + 1
+                block, carry = block[:cut], block[cut:]
+            if not block:
+                if not data:
+                    break
+                continue
+            if b"\r" in block:
+                block = block.replace(b"\r", b"")
+            # lines are looked at one by one only if there is something to drop
+            if (comments and comments in block) or b"\n\n" in block or block.startswith(b"\n"):
+                block = b"\n".join(
+                    line for line in block.split(b"\n")
+                    if line.strip() and not (comments and line.startswith(comments))
+                )
+            block = block.strip(b"\n")
+            if not block:
+                continue
+            if N_columns is None:
+                N_columns = len(block.split(b"\n", 1)[0].split(separator))
+                if N_columns < 2:
+                    raise ValueError(f"{path}: an edge list needs at least two columns")
+            # a single split over the whole chunk, lines become rows
+            if separator is not None:
+                block = block.replace(b"\n", separator)
+            tokens = np.array(block.split(separator))
+            if len(tokens) % N_columns:
+                raise ValueError(f"{path}: all lines must have {N_columns} columns")
+            tokens = tokens.reshape(-1, N_columns)
+
+            ends = tokens[:, :2]
+            if separator is not None:
+                ends = np.char.strip(ends)
+            if numeric_labels is None:
+                try:
+                    ends.astype(np.int64)
+                    numeric_labels = True
+                except ValueError:
+                    numeric_labels = False
+            if numeric_labels:
+                try:
+                    ends = ends.astype(np.int64)
+                except ValueError:
+                    raise ValueError(f"{path}: non numeric label found, use numeric_labels=False") from None
+            codes = stream.add(ends.ravel()).reshape(-1, 2)
+            i.append(codes[:, 0])
+            j.append(codes[:, 1])
+            if N_columns > 2:
+                lengths.append(tokens[:, 2].astype(np.float32))
+            else:
+                lengths.append(np.full(len(tokens), default_length, dtype=np.float32))
+            if not data:
+                break
+
+    if N_columns is None:
+        raise ValueError(f"{path}: no links found")
+    labels, remap = stream.finish()
+    if labels.dtype.kind == "S":
+        labels = np.char.decode(labels, "utf-8")
+    return Labels(labels), (remap[np.concatenate(i)], remap[np.concatenate(j)], np.concatenate(lengths))
+
+
+# The netgross edge file: a header and the raw little-endian columns of the links
+EDGE_FILE_MAGIC = b"NETGROSS"
+EDGE_FILE_VERSION = 1
+_edge_file_header = np.dtype(
+    [("magic", "S8"), ("version", "<u4"), ("flags", "<u4"), ("nodes", "<u8"), ("links", "<u8")]
+)
+
+
+def write_edge_file(path, i, j, lengths, N=None):
+    """Writes the links (i, j, lengths) as int32, int32, float32 columns in a netgross edge file"""
+    i = np.asarray(i, dtype="<i4")
+    j = np.asarray(j, dtype="<i4")
+    lengths = np.asarray(lengths, dtype="<f4")
+    if not len(i) == len(j) == len(lengths):
+        raise ValueError("columns must have the same length")
+    if N is None:
+        N = int(max(i.max(initial=-1), j.max(initial=-1))) + 1
+    header = np.array([(EDGE_FILE_MAGIC, EDGE_FILE_VERSION, 0, N, len(i))], dtype=_edge_file_header)
+    with open(path, "wb") as file:
+        for array in (header, i, j, lengths):
+            file.write(array.tobytes())
+
+
+def is_edge_file(path):
+    """Whether path is a netgross edge file"""
+    with open(path, "rb") as file:
+        return file.read(len(EDGE_FILE_MAGIC)) == EDGE_FILE_MAGIC
+
+
+def read_edge_file(path):
+    """The (i, j, lengths) columns of a netgross edge file and its number of nodes.
+
+    Columns are memory mapped copy on write, so they can be given to cnets without copying
+    and changed in memory, while the file is left as it is.
+    """
+    header = np.fromfile(path, dtype=_edge_file_header, count=1)
+    if len(header) == 0 or header["magic"][0] != EDGE_FILE_MAGIC:
+        raise ValueError(f"{path} is not a netgross edge file")
+    if header["version"][0] != EDGE_FILE_VERSION:
+        raise ValueError(f"{path}: unsupported edge file version {header['version'][0]}")
+    N, E = int(header["nodes"][0]), int(header["links"][0])
+    offset = _edge_file_header.itemsize
+    columns = []
+    for dtype in ("<i4", "<i4", "<f4"):
+        columns.append(np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=(E,)) if E else np.zeros(0, dtype))
+        offset += 4 * E
+    return columns[0], columns[1], columns[2], N
+
+
+class SparseMatrix:
+    """A (N, M) matrix stored by its non-null entries, sorted by row and column.
+
+    Rows are indexed like in CSR format (the entries of row i are
+    indptr[i]:indptr[i+1]), so reading an entry costs O(log deg)
+    and no dense array is made unless toarray() is called.
+
+    Entries are read like in numpy, with scalars or arrays:
+
+        M[i, j]         # the value or zero if not stored
+        (i, j) in M     # whether the entry is stored
+    """
+
+    def __init__(self, rows, cols, data, shape):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        data = np.asarray(data)
+        order = np.lexsort((cols, rows))
+        self.rows, self.cols, self.data = rows[order], cols[order], data[order]
+        self.shape = tuple(shape)
+        self.dtype = self.data.dtype
+        self.indptr = np.zeros(self.shape[0] + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(self.rows, minlength=self.shape[0]))
+        self._keys = None
+
+    def _sorted_keys(self):
+        """The sorted keys row * ncols + col of the entries, made once.
+
+        Values can be changed in place, new rows or cols arrays make new keys.
+        """
+        if self._keys is None or self._keys[0] is not self.rows or self._keys[1] is not self.cols:
+            self._keys = (self.rows, self.cols, self.rows * self.shape[1] + self.cols)
+        return self._keys[2]
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def find(self, i, j):
+        """Position of the entries (i, j) among the stored ones, -1 where not stored.
+
+        Costs O(log nnz) for each entry.
+        """
+        i, j = np.asarray(i, dtype=np.int64), np.asarray(j, dtype=np.int64)
+        if i.ndim == 0 and j.ndim == 0:
+            start, end = self.indptr[i], self.indptr[i + 1]
+            k = start + np.searchsorted(self.cols[start:end], j)
+            return k if k < end and self.cols[k] == j else -1
+        keys = self._sorted_keys()
+        wanted = i * self.shape[1] + j
+        k = np.minimum(np.searchsorted(keys, wanted), max(self.nnz - 1, 0))
+        return np.where((self.nnz > 0) & (keys[k] == wanted), k, -1)
 
-    matrix = np.array(matrix).flatten()
-    delete_indexes = matrix == 0.0
+    def __getitem__(self, index):
+        k = self.find(*index)
+        if np.ndim(k) == 0:
+            return self.data[k] if k >= 0 else self.dtype.type(0)
+        return np.where(k >= 0, self.data[np.maximum(k, 0)], self.dtype.type(0))
 
-    i = np.arange(N)
-    j = np.arange(N)
+    def __contains__(self, index):
+        return bool(self.find(*index) >= 0)
 
-    i = np.repeat(i, N)
-    j = np.tile(j, N)
+    def row(self, i):
+        """The columns and values stored in row i"""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.cols[start:end], self.data[start:end]
 
-    # null values are deleted
-    i = np.delete(i, delete_indexes)
-    j = np.delete(j, delete_indexes)
-    matrix = np.delete(matrix, delete_indexes)
+    def astype(self, dtype):
+        return SparseMatrix(self.rows, self.cols, self.data.astype(dtype), self.shape)
 
-    sparse = np.vstack((i, j, matrix)).transpose()
-    sparse = compact_indexes(sparse)
+    def sum(self):
+        return self.data.sum()
 
-    return sparse
+    def toarray(self):
+        dense = np.zeros(self.shape, dtype=self.dtype)
+        dense[self.rows, self.cols] = self.data
+        return dense
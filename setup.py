@@ -1,4 +1,6 @@
+import sys
 from setuptools import setup, Extension
+import numpy as np
 
 with open('requirements.txt', 'r') as reqfile:
     dependencies = reqfile.readlines()
@@ -11,6 +13,10 @@ extras = {
     'test': test_deps,
 }
 
+# OpenMP is used for multithreading where the compiler supports it out of the box
+openmp_flags = ["-fopenmp"] if sys.platform.startswith("linux") else []
+
+
 def main():
     setup(name="netgross",
           version="1.0.0",
@@ -18,7 +24,13 @@ def main():
           description="Module for network computing",
           author="djanloo",
           author_email='becuzzigianluca@gmail.com',
-          ext_modules=[Extension("cnets", ["netgross/cnets/cnets.c", "netgross/cnets/cutils.c"])],
+          ext_modules=[Extension("cnets", ["netgross/cnets/cnets.c", "netgross/cnets/cutils.c",
+                                            "netgross/cnets/cbarneshut.c", "netgross/cnets/ckdtree.c",
+                                            "netgross/cnets/cnndescent.c", "netgross/cnets/cradius.c",
+                                            "netgross/cnets/cfuzzy.c"],
+                                 include_dirs=[np.get_include()],
+                                 extra_compile_args=openmp_flags,
+                                 extra_link_args=openmp_flags)],
           install_requires=dependencies,
           tests_require=test_deps,  # these two lines install stuff for
           extras_require=extras)    # test and coverage
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 import numpy as np
 
@@ -27,13 +29,499 @@ class cnetsTest(unittest.TestCase):
         )
         self.correct_dist_M *= 0.8
         self.values = [0.0, 0.0, 0.0, 0.0]
+
+        # Some random initializations converge slowly, a fixed seed keeps the test stable
+        cnets.set_seed(4)
         cnets.init_network(self.squareSM, self.values, 2)
 
+    def tearDown(self):
+        cnets.set_seed(0)
+
     def test_MDE(self):
         cnets.MDE(0.1, 0.00, 1000)
         distM = np.array(cnets.get_distanceM())
         distortion = cnets.get_distortion()
         self.assertLessEqual(distortion, 1e-6) # Dangerous, may fail sometimes, must be changed
-    
+
+    def test_early_stopping(self):
+        self.assertEqual(cnets.MDE(0.1, 0.0, 100), 100)
+        graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+        steps = graph.mde(0.1, 0.0, 5000, tol=1e-3, window=20)
+        self.assertLess(steps, 5000)
+        self.assertEqual(steps % 20, 0)
+        self.assertLessEqual(graph.distortion(), 1e-3)
+
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.0, 10, tol=-1.0)
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.0, 10, window=0)
+
+    def test_schedules(self):
+        for options in (dict(schedule="exponential"), dict(schedule="cosine"),
+                        dict(optimizer="momentum", momentum=0.5), dict(optimizer="adam", schedule="exponential")):
+            graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+            start = graph.distortion()
+            self.assertEqual(graph.mde(0.05, 0.0, 1000, **options), 1000)
+            self.assertTrue(np.isfinite(graph.positions).all())
+            self.assertLess(graph.distortion(), start*1e-2, msg=str(options))
+
+        # Overlapping nodes are not pushed away to infinity
+        star = [[0, n, 1.0] for n in range(1, 5)]
+        graph = cnets.Graph(star, np.zeros(5), 2, seed=4)
+        # (leaves are not linked to each other, so they all land on the same point)
+        graph.prolong(cnets.Graph([[0, 1, 1.0]], np.zeros(2), 2, seed=4), [1, 0, 0, 0, 0])
+        self.assertTrue((graph.positions[1:] == graph.positions[1]).all())
+        graph.negatives_per_node = 3
+        for optimizer in ("momentum", "adam"):
+            graph.mde(0.1, 0.01, 10, optimizer=optimizer)
+            self.assertTrue(np.isfinite(graph.positions).all())
+
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.0, 10, schedule="linear")
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.0, 10, optimizer="rmsprop")
+
+    def test_edge_sampling(self):
+        graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+        self.assertEqual(graph.N_slots, 8)
+        self.assertEqual(graph.mde(0.25, 0.0, 1000, optimizer="edges"), 1000)
+        self.assertLessEqual(graph.distortion(), 1e-4)
+        # One link drawn for each link in each step
+        self.assertEqual(graph.get_stats()["edge_samples"], 4*1000)
+        graph.mde(0.25, 0.0, 10, optimizer="edges", samples=3)
+        self.assertEqual(graph.get_stats()["edge_samples"], 4*1000 + 3*10)
+
+        # Only the link 0 - 1 can be drawn
+        graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+        weights = np.zeros(8)
+        weights[graph.link_slots([0], [1])] = 1.0
+        before = graph.get_positions()
+        graph.mde(0.25, 0.0, 10, optimizer="edges", weights=weights)
+        moved = (graph.get_positions() != before).any(axis=1)
+        self.assertTrue(np.array_equal(moved, [True, True, False, False]))
+
+        with self.assertRaises(ValueError):
+            graph.mde(0.25, 0.0, 10, optimizer="edges", weights=np.zeros(8))
+        with self.assertRaises(ValueError):
+            graph.mde(0.25, 0.0, 10, optimizer="edges", weights=np.ones(4))
+        with self.assertRaises(ValueError):
+            graph.mde(0.25, 0.01, 10, optimizer="edges", repulsion="barneshut")
+
+    def test_stats(self):
+        graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+        graph.stats_every = 5
+        graph.mde(0.1, 0.01, 20)
+        stats = graph.get_stats()
+        self.assertEqual(stats["steps"], 20)
+        self.assertGreater(stats["time_total"], 0.0)
+        self.assertGreaterEqual(stats["time_total"], stats["time_update"] + stats["time_repulsion"])
+        # Node sweeps attract and repel each node in turn, timed as a whole
+        self.assertGreater(stats["time_update"], 0.0)
+        self.assertEqual(stats["time_attraction"], 0.0)
+        self.assertGreater(stats["edges_per_second"], stats["steps_per_second"])
+        # Four nodes are fewer than the sample: the estimate is exact
+        self.assertAlmostEqual(stats["distortion_estimate"], graph.distortion(), places=5)
+
+        graph.reset_stats()
+        self.assertEqual(graph.get_stats()["steps"], 0)
+        self.assertTrue(np.isnan(graph.get_stats()["distortion_estimate"]))
+        self.assertEqual(graph.stats_every, 5)
+        self.assertEqual(cnets.get_stats()["steps"], 0)
+
+    def test_callback(self):
+        graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+        calls = []
+
+        def callback(step, positions, stats):
+            calls.append(step)
+            self.assertFalse(positions.flags.writeable)
+            self.assertEqual(positions.shape, (4, 2))
+            # The graph can't be used until the run ends
+            self.assertRaises(RuntimeError, graph.distortion)
+            self.assertEqual(stats["steps"], step)
+            return step >= 30
+
+        self.assertEqual(graph.mde(0.1, 0.01, 100, callback=callback, callback_every=10), 30)
+        self.assertEqual(calls, [10, 20, 30])
+        self.assertEqual(cnets.MDE(0.1, 0.01, 20, callback=lambda *args: None, callback_every=5), 20)
+
+        def failing(step, positions, stats):
+            raise KeyError(step)
+
+        with self.assertRaises(KeyError):
+            graph.mde(0.1, 0.01, 100, callback=failing)
+        self.assertEqual(graph.get_stats()["steps"], 40)
+        with self.assertRaises(TypeError):
+            graph.mde(0.1, 0.01, 10, callback=3)
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.01, 10, callback=failing, callback_every=0)
+
+    def test_logging(self):
+        messages = []
+        previous = cnets.set_log_handler(lambda level, message: messages.append((level, message)))
+        try:
+            cnets.Graph(self.squareSM, self.values, 2)
+            cnets.set_verbose(False)
+            cnets.Graph(self.squareSM, self.values, 2)
+        finally:
+            cnets.set_log_handler(previous)
+            cnets.set_verbose(True)
+        self.assertIn((20, "generated network with 4 nodes and 4 links"), messages)
+        # Quiet mode drops the info messages of the second graph
+        self.assertEqual(len([m for m in messages if m[1].startswith("generated")]), 1)
+        with self.assertRaises(TypeError):
+            cnets.set_log_handler(3)
+
+    def test_buffer_input(self):
+        rows = np.array(self.squareSM)
+        structured = np.zeros(4, dtype=[("i", np.int32), ("j", np.int32), ("d", np.float32)])
+        structured["i"], structured["j"], structured["d"] = rows[:, 0], rows[:, 1], rows[:, 2]
+        columns = (rows[:, 0].astype(np.int64), rows[:, 1].astype(np.uint32), rows[:, 2])
+
+        for links in (rows, structured, columns):
+            cnets.init_network(links, np.array(self.values, dtype=np.float32), 2)
+            cnets.set_target(links)
+            cnets.MDE(0.1, 0.00, 1000)
+            self.assertLessEqual(cnets.get_distortion(), 1e-6)
+
+    def test_positions(self):
+        positions = cnets.get_positions()
+        self.assertEqual(positions.shape, (4, 2))
+        self.assertEqual(positions.dtype, np.float32)
+
+        view = cnets.get_positions(copy=False)
+        self.assertFalse(view.flags.writeable)
+        cnets.MDE(0.1, 0.00, 10)
+        self.assertFalse(np.array_equal(positions, view))
+        self.assertTrue(np.array_equal(cnets.get_positions(), view))
+
+    def test_graph_type(self):
+        graphs = [cnets.Graph(self.squareSM, self.values, dim) for dim in (2, 3)]
+        for graph in graphs:
+            graph.mde(0.1, 0.0, 1000)
+            self.assertLessEqual(graph.distortion(), 1e-6)
+        self.assertEqual(graphs[0].positions.shape, (4, 2))
+        self.assertEqual(graphs[1].positions.shape, (4, 3))
+
+        # Views keep the positions alive after the graph is deleted
+        view = graphs[0].positions
+        del graphs[0]
+        self.assertEqual(view.shape, (4, 2))
+
+        graphs[0].set_target(np.array([[0, 1, 1.6], [1, 2, 1.6], [2, 3, 1.6], [3, 0, 1.6]]))
+        self.assertGreater(graphs[0].distortion(), 1.0)
+
+    def test_threads(self):
+        ring = np.array([[i, (i + 1) % 50, 1.0] for i in range(50)])
+        runs = []
+        for num_threads in (1, 1, 4):
+            graph = cnets.Graph(ring, np.zeros(50), 2, seed=7)
+            graph.num_threads = num_threads
+            graph.mde(0.1, 0.01, 100)
+            runs.append(graph.get_positions())
+            self.assertLess(graph.distortion(), 1.0)
+
+        # Seeded single thread runs are reproducible
+        self.assertTrue(np.array_equal(runs[0], runs[1]))
+
+    def test_negative_sampling(self):
+        # Links are given in reverse order, rows must be sorted anyway
+        star = np.array([[0, j, 1.0] for j in range(99, 0, -1)])
+        graph = cnets.Graph(star, np.zeros(100), 2, seed=3)
+        graph.negatives_per_node = 5
+        graph.mde(0.1, 0.01, 200)
+        distances = np.linalg.norm(graph.positions[1:] - graph.positions[0], axis=1)
+        self.assertAlmostEqual(np.median(distances), 1.0, delta=0.5)
+        distortion = graph.distortion()
+        self.assertLess(distortion, 0.5)
+
+        # Doubles the target of a third of the links
+        graph.set_target(star[::3] * [1, 1, 2])
+        self.assertGreater(graph.distortion(), distortion + 0.2)
+
+    def test_barneshut(self):
+        star = np.array([[0, j, 1.0] for j in range(1, 100)])
+        for dim in (2, 3):
+            graph = cnets.Graph(star, np.zeros(100), dim, seed=3)
+            graph.mde(0.1, 0.01, 200, repulsion="barneshut", theta=0.5)
+            self.assertTrue(np.isfinite(graph.positions).all())
+            distances = np.linalg.norm(graph.positions[1:] - graph.positions[0], axis=1)
+            self.assertAlmostEqual(np.median(distances), 1.0, delta=0.5)
+
+        # Leaves are spread around the center instead of collapsing
+        leaves = graph.positions[1:] - graph.positions[0]
+        self.assertLess(np.linalg.norm(np.mean(leaves, axis=0)), 0.5)
+
+        with self.assertRaises(ValueError):
+            cnets.Graph(star, np.zeros(100), 4).mde(0.1, 0.01, 1, repulsion="barneshut")
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.01, 1, repulsion="exact")
+
+    def test_update_targets(self):
+        graph = cnets.Graph(self.squareSM, np.zeros(4), 2, seed=5)
+        slots = graph.link_slots([1, 3, 0], [2, 0, 2])
+        self.assertTrue((slots[2] == -1).all())  # 0 and 2 are not linked
+        graph.update_targets(slots, [0.3, 1.2, 7.0])
+
+        updated = [[0, 1, 0.8], [1, 2, 0.3], [2, 3, 0.8], [3, 0, 1.2]]
+        expected = cnets.Graph(updated, np.zeros(4), 2, seed=5)
+        self.assertAlmostEqual(graph.distortion(), expected.distortion(), places=5)
+
+        with self.assertRaises(ValueError):
+            graph.update_targets(slots, [1.0])
+        with self.assertRaises(IndexError):
+            graph.update_targets([100], [1.0])
+
+    def test_checkpoint(self):
+        graph = cnets.Graph(self.squareSM, [1.0, 2.0, 3.0, 4.0], 2, seed=4)
+        graph.negatives_per_node = 2
+        graph.mde(0.1, 0.01, 10)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "square.ckp")
+            graph.save(path)
+            restored = cnets.Graph.load(path)
+            self.assertEqual(restored.get_stats()["steps"], 10)
+            self.assertEqual(restored.negatives_per_node, 2)
+            self.assertTrue(np.array_equal(restored.positions, graph.positions))
+
+            # The random state is saved as well: both graphs go on in the same way
+            saved = restored.get_positions()
+            graph.mde(0.1, 0.01, 20, start=10)
+            restored.mde(0.1, 0.01, 20, start=10)
+            self.assertTrue(np.array_equal(restored.positions, graph.positions))
+            # The checkpoint is mapped copy on write: the file does not change
+            self.assertTrue(np.array_equal(cnets.Graph.load(path).positions, saved))
+            self.assertEqual(restored.add_links([0], [4], [1.0]), 1)
+            self.assertEqual(restored.positions.shape, (5, 2))
+
+            with open(path, "r+b") as file:
+                file.truncate(os.path.getsize(path) - 8)
+            with self.assertRaises(ValueError):
+                cnets.Graph.load(path)
+        with self.assertRaises(OSError):
+            cnets.Graph.load(os.path.join(folder, "missing.ckp"))
+        with self.assertRaises(ValueError):
+            graph.mde(0.1, 0.01, 10, start=11)
+
+    def test_file_backed(self):
+        ring = [[n, (n + 1) % 50, 1.0] for n in range(50)] + [[n, (n + 7) % 50, 2.0] for n in range(0, 50, 5)]
+        graph = cnets.Graph(ring, np.arange(50), 2, seed=7)
+        order = graph.node_order()
+        self.assertTrue(np.array_equal(np.sort(order), np.arange(50)))
+        self.assertTrue(np.array_equal(np.sort(graph.node_order("bfs")), np.arange(50)))
+        with self.assertRaises(ValueError):
+            graph.node_order("random")
+        with self.assertRaises(ValueError):
+            graph.save("unused.ckp", order=np.zeros(50, dtype=int))
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "ring.ckp")
+            graph.save(path, order=order)
+            mapped = cnets.Graph.open(path)
+            self.assertTrue(mapped.file_backed)
+            self.assertFalse(graph.file_backed)
+            self.assertTrue(np.array_equal(mapped.values, np.arange(50)[order]))
+            self.assertTrue(np.array_equal(mapped.positions, graph.positions[order]))
+            self.assertAlmostEqual(mapped.distortion(), graph.distortion(), places=5)
+
+            # The run goes straight to the file
+            mapped.mde(0.1, 0.01, 50)
+            mapped.sync()
+            restored = cnets.Graph.load(path)
+            self.assertEqual(restored.get_stats()["steps"], 50)
+            self.assertTrue(np.array_equal(restored.positions, mapped.positions))
+            with self.assertRaises(RuntimeError):
+                mapped.add_links([0], [2], [1.0])
+
+            # A read-only map leaves the file as it is
+            private = cnets.Graph.open(path, writable=False)
+            private.mde(0.1, 0.01, 50)
+            self.assertTrue(np.array_equal(cnets.Graph.load(path).positions, restored.positions))
+            del mapped, private
+
+            # Sections follow the 64 bytes header aligned to 8 bytes (values, positions, offsets),
+            # so the first child is at 64 + 200 + 400 + 408. Node 0 has more than one child.
+            with open(path, "r+b") as file:
+                file.seek(1072)
+                first, second = np.frombuffer(file.read(8), dtype=np.uint32)
+                # A row out of order
+                file.seek(1072)
+                file.write(np.uint32([second, first]).tobytes())
+            with self.assertRaises(ValueError):
+                cnets.Graph.load(path)
+            # A child out of range
+            with open(path, "r+b") as file:
+                file.seek(1072)
+                file.write(np.uint32(50).tobytes())
+            with self.assertRaises(ValueError):
+                cnets.Graph.open(path)
+            cnets.Graph.open(path, validate=False)
+
+    def test_coarsen(self):
+        ring = [[n, (n + 1) % 50, 1.0 + (n % 2)] for n in range(50)]
+        graph = cnets.Graph(ring, np.arange(50), 2, seed=7)
+        coarse, parent = graph.coarsen()
+        self.assertEqual(parent.shape, (50,))
+        # Nodes are merged in pairs (or left alone) and each coarse node has some
+        self.assertTrue((np.bincount(parent) <= 2).all())
+        self.assertTrue(np.array_equal(np.unique(parent), np.arange(coarse.N_nodes)))
+        self.assertLess(coarse.N_nodes, 40)
+        for n in range(coarse.N_nodes):
+            self.assertAlmostEqual(coarse.values[n], np.arange(50)[parent == n].mean(), places=4)
+
+        coarse.mde(0.1, 0.01, 100)
+        graph.prolong(coarse, parent)
+        for n in range(coarse.N_nodes):
+            self.assertTrue(np.allclose(graph.positions[parent == n].mean(axis=0), coarse.positions[n], atol=1e-5))
+        with self.assertRaises(ValueError):
+            graph.prolong(coarse, np.full(50, coarse.N_nodes))
+
+        # Nothing to merge in a graph with less than two nodes
+        graph.remove_nodes(np.arange(1, 50))
+        with self.assertRaises(ValueError):
+            graph.coarsen()
+        graph.remove_nodes([0])
+        with self.assertRaises(ValueError):
+            graph.coarsen()
+
+    def test_nan(self):
+        graph = cnets.Graph(self.squareSM, self.values, 2, seed=4)
+        graph.update_targets(graph.link_slots([0], [1]), [np.nan])
+        with self.assertRaises(FloatingPointError):
+            graph.mde(0.1, 0.01, 10)
+        with self.assertRaises(FloatingPointError):
+            graph.get_positions()
+
+    def test_dynamic_graph(self):
+        graph = cnets.Graph(self.squareSM, np.zeros(4), 2, seed=5)
+        graph.mde(0.1, 0.01, 100)
+        before = graph.get_positions()
+
+        # Node 4 hangs from 0, node 5 from 4 and 2
+        self.assertEqual(graph.add_links([0, 4, 5, 0], [4, 5, 2, 1], [0.5, 0.5, 0.5, 0.8]), 3)
+        positions = graph.get_positions()
+        self.assertEqual(positions.shape, (6, 2))
+        self.assertTrue((positions[:4] == before).all())
+        self.assertAlmostEqual(np.linalg.norm(positions[4] - positions[0]), 0.5, places=5)
+        self.assertTrue((graph.link_slots([0, 4, 2], [4, 5, 5]) >= 0).all())
+        # A bound on the nodes catches stray indexes before the graph grows
+        with self.assertRaises(IndexError):
+            graph.add_links([0], [1 << 30], [1.0], N=6)
+        self.assertEqual(graph.N_nodes, 6)
+
+        self.assertEqual(graph.refine([5], 0.1, 0.0, 10, hops=0), 1)
+        self.assertTrue((graph.get_positions()[:5] == positions[:5]).all())
+        self.assertEqual(graph.refine([5], 0.1, 0.0, 10, hops=1), 3)
+
+        self.assertEqual(graph.remove_links([4, 1], [5, 3]), 1)
+        self.assertTrue((graph.link_slots([4], [5]) == -1).all())
+
+        positions = graph.get_positions()
+        graph.remove_nodes([1])
+        self.assertTrue((graph.get_positions() == np.delete(positions, 1, axis=0)).all())
+        # 2 -> 1, 3 -> 2, ...: 0 - 4 becomes 0 - 3
+        self.assertTrue((graph.link_slots([0, 1, 0], [3, 2, 2])[:2] >= 0).all())
+        self.assertTrue((graph.link_slots([0], [2]) >= 0).all())
+        self.assertTrue((graph.link_slots([0], [1]) == -1).all())
+        with self.assertRaises(IndexError):
+            graph.remove_nodes([10])
+
+        # An empty graph has an empty order
+        graph.remove_nodes(np.arange(graph.N_nodes))
+        self.assertEqual(graph.N_nodes, 0)
+        for method in ("rcm", "bfs"):
+            self.assertEqual(len(graph.node_order(method)), 0)
+
+    def test_knn(self):
+        points = np.random.default_rng(1).normal(size=(300, 3)).astype(np.float32)
+        points[1] = points[0]  # duplicates are neighbours at zero distance
+        k = 5
+        i, j, d = cnets.knn(points, k)
+        self.assertEqual(len(i), 300 * k)
+        self.assertTrue((i.reshape(-1, k) == np.arange(300)[:, None]).all())
+        self.assertTrue((i != j).all())
+
+        brute = np.linalg.norm(points[:, None] - points[None], axis=2)
+        np.fill_diagonal(brute, np.inf)
+        self.assertTrue(np.allclose(d.reshape(-1, k), np.sort(brute, axis=1)[:, :k], atol=1e-5))
+        self.assertTrue(np.allclose(np.linalg.norm(points[i] - points[j], axis=1), d, atol=1e-5))
+
+        # The old interface gives the same links as lists
+        self.assertEqual(cnets.stupid_knn(points, k)[k], [int(i[k]), int(j[k]), float(d[k])])
+
+        with self.assertRaises(ValueError):
+            cnets.knn(points, 300)
+        with self.assertRaises(ValueError):
+            cnets.knn(points, 0)
+
+    def test_nndescent(self):
+        rng = np.random.default_rng(2)
+        centers = rng.normal(size=(10, 64)) * 3
+        points = (centers[rng.integers(0, 10, 2000)] + rng.normal(size=(2000, 64))).astype(np.float32)
+        k = 10
+        i, j, d = cnets.nndescent(points, k, seed=1, recall_sample=50)
+        self.assertTrue((i.reshape(-1, k) == np.arange(2000)[:, None]).all())
+        self.assertTrue((i != j).all())
+        self.assertTrue((np.diff(d.reshape(-1, k), axis=1) >= 0).all())
+        self.assertTrue(np.allclose(np.linalg.norm(points[i] - points[j], axis=1), d, atol=1e-4))
+        self.assertGreater(cnets.knn_recall(points, (i, j, d), sample=200, seed=3), 0.9)
+
+        # The exact builder is the reference
+        self.assertEqual(cnets.knn_recall(points, cnets.knn(points, k), sample=200, seed=3), 1.0)
+
+        with self.assertRaises(ValueError):
+            cnets.nndescent(points, 2000)
+        with self.assertRaises(ValueError):
+            cnets.nndescent(points, k, rho=0.)
+
+    def test_ball_neighbours(self):
+        rng = np.random.default_rng(3)
+        # Cell list up to 3 dimensions, KD-tree above
+        for dim in (2, 5):
+            points = rng.normal(size=(400, dim)).astype(np.float32)
+            i, j, d = cnets.ball_neighbours(points, 0.5)
+            brute = np.linalg.norm(points[:, None] - points[None], axis=2)
+            np.fill_diagonal(brute, np.inf)
+            expected = set(zip(*np.nonzero(brute <= 0.5)))
+            self.assertEqual(set(zip(i.tolist(), j.tolist())), expected)
+            self.assertTrue((np.diff(i.astype(np.int64)) >= 0).all())
+            self.assertTrue(np.allclose(brute[i, j], d, atol=1e-5))
+
+        with self.assertRaises(ValueError):
+            cnets.ball_neighbours(points, 0.)
+        # Points need at least one coordinate
+        for points in (np.zeros((5, 0), np.float32), [[], []]):
+            with self.assertRaises(ValueError):
+                cnets.ball_neighbours(points, 0.5)
+            with self.assertRaises(ValueError):
+                cnets.knn(points, 2)
+
+    def test_variable_metric_ball_neighbours(self):
+        rng = np.random.default_rng(4)
+        # A dense and a sparse cluster
+        points = np.concatenate([rng.normal(size=(200, 2)) * 0.05, rng.normal(size=(100, 2)) * 5 + 20])
+        k = 8
+        i, j, d, w = cnets.variable_metric_ball_neighbours(points.astype(np.float32), k)
+        self.assertTrue((i < j).all())
+        self.assertEqual(len(set(zip(i.tolist(), j.tolist()))), len(i))
+        self.assertLessEqual(len(i), 300 * k)
+        self.assertTrue(((w > 0) & (w <= 1)).all())
+        self.assertTrue(np.allclose(np.linalg.norm(points[i] - points[j], axis=1), d, atol=1e-4))
+
+        # Each point is fully linked to its closest neighbour, whatever the density
+        strong = np.zeros(300, dtype=bool)
+        strong[i[w == 1]] = True
+        strong[j[w == 1]] = True
+        self.assertTrue(strong.all())
+
+        with self.assertRaises(ValueError):
+            cnets.variable_metric_ball_neighbours(points, k, local_connectivity=k + 1)
+
+    def test_bad_buffer(self):
+        with self.assertRaises(ValueError):
+            cnets.init_network(np.zeros((4, 2)), self.values, 2)
+        with self.assertRaises(IndexError):
+            cnets.init_network([[0, 7, 0.8]], self.values, 2)
+
 if __name__ == "__main__":
     unittest.main()
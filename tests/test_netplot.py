@@ -1,3 +1,5 @@
+import os
+import tempfile
 from matplotlib.pyplot import colorbar
 import numpy as np
 import unittest
@@ -39,7 +41,7 @@ class dummySuperNet(network.undNetwork):
                     link.activation = np.float32(0.0)
 
         self.net.update_target_matrix()
-        cnets.set_target(self.net.targetSM)
+        self.net.cgraph.set_target(self.net.targetSM)
         self.updated_times += 1
 
     def update(self):
@@ -84,5 +86,21 @@ class netPlotDynamicTest(unittest.TestCase):
                                         {"frames":100, "interval":60, "blit":False}
                                         )
 
+    def test_live_MDE(self):
+        net = network.undNetwork.Random(20, 0.7)
+        netplot.live_MDE(net, every=5, step=0.1, neg_step=1e-3, Nsteps=20)
+
+    def test_live_MDE_read_only(self):
+        net = network.undNetwork.Random(20, 0.7)
+        net.initialize_embedding(dim=2)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "net.graph")
+            net.to_graph_file(path)
+            opened = network.undNetwork.open(path, writable=False)
+            netplot.live_MDE(opened, every=5, step=0.1, neg_step=1e-3, Nsteps=20)
+            self.assertEqual(opened.cgraph.get_stats()["steps"], 20)
+            del opened
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,11 @@
+import os
+import tempfile
 import numpy as np
 import unittest
+import cnets
 from netgross.classiter import cdict, cset, clist
-from netgross.network import Node, undLink, undNetwork, dirLink, dirNetwork
+from netgross.network import Node, undLink, undNetwork, dirLink, dirNetwork, use_logging
+from netgross import utils
 
 class testUndLinks(unittest.TestCase):
     def setUp(self):
@@ -93,5 +97,357 @@ class testDirLinks(unittest.TestCase):
         print(self)
 
 
+class testEmbedding(unittest.TestCase):
+    def setUp(self):
+        self.net = undNetwork.Random(10, 1.0)
+
+    def test_positions(self):
+        self.net.initialize_embedding(dim=3)
+        self.net.cMDE(step=0.1, neg_step=0.01, Nsteps=10)
+        self.assertEqual(self.net.positions.shape, (10, 3))
+        for node in self.net:
+            self.assertTrue(np.shares_memory(node.position, self.net.positions))
+            self.assertTrue((node.position == self.net.positions[node.n]).all())
+
+    def test_phases(self):
+        self.assertEqual(self.net.cMDE(step=[0.1, 0.05], neg_step=[0.01, 0.0], Nsteps=[10, 20]), 30)
+        self.assertRaises(ValueError, self.net.cMDE, [0.1, 0.05], [0.01], [10, 20])
+        self.assertLess(self.net.cMDE(step=0.1, neg_step=0.0, Nsteps=10000, tol=1e-2), 10000)
+
+    def test_callback(self):
+        steps = []
+        done = self.net.cMDE(step=[0.1, 0.05], neg_step=[0.01, 0.0], Nsteps=[10, 20],
+                             callback=lambda step, positions, stats: steps.append(step) or step >= 15,
+                             callback_every=5)
+        self.assertEqual(done, 15)
+        self.assertEqual(steps, [5, 10, 15])
+        self.assertTrue(np.array_equal(self.net.positions, self.net.cgraph.positions))
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "net.ckp")
+            # Calls are counted within each phase: the callback stops the run at step 20 + 15
+            done = self.net.cMDE(step=[0.1, 0.05], neg_step=[0.01, 0.0], Nsteps=[20, 40],
+                                 checkpoint=path, checkpoint_every=10,
+                                 callback=lambda step, positions, stats: step >= 30, callback_every=15)
+            self.assertEqual(done, 35)
+            positions = self.net.positions.copy()
+
+            resumed = undNetwork.Random(10, 1.0)
+            done = resumed.cMDE(step=[0.1, 0.05], neg_step=[0.01, 0.0], Nsteps=[20, 40],
+                                checkpoint=path, resume=True,
+                                callback=lambda step, positions, stats: self.assertGreater(step, 35))
+            self.assertEqual(done, 25)
+            self.assertEqual(resumed.cgraph.get_stats()["steps"], 60)
+            self.assertFalse(np.array_equal(resumed.positions, positions))
+            # Nothing is left to do
+            self.assertEqual(resumed.cMDE(step=[0.1, 0.05], neg_step=[0.01, 0.0], Nsteps=[20, 40],
+                                          checkpoint=path, resume=True), 0)
+
+    def test_multilevel(self):
+        net = undNetwork.from_sparse([[n, (n + 1) % 400, 1.0] for n in range(400)])
+        self.assertEqual(net.cMDE(step=0.1, neg_step=0.01, Nsteps=20, strategy="multilevel", level_steps=50), 20)
+        self.assertGreater(net.multilevel_init(level_steps=10, coarsest=50), 1)
+        self.assertRaises(ValueError, net.cMDE, strategy="random")
+
+    def test_edge_sampling(self):
+        weights = np.zeros(len(self.net.links))
+        weights[0] = 1.0
+        self.net.initialize_embedding(dim=2)
+        before = self.net.positions.copy()
+        self.assertEqual(self.net.cMDE(0.25, 0.0, 10, optimizer="edges", weights=weights), 10)
+        moved = np.flatnonzero((self.net.positions != before).any(axis=1))
+        self.assertEqual(set(moved), {self.net._i[0], self.net._j[0]})
+        self.assertRaises(ValueError, self.net.cMDE, optimizer="edges", weights=weights[1:])
+
+    def test_graph_file(self):
+        self.net.values = np.arange(10)
+        self.net.initialize_embedding(dim=2)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "net.graph")
+            order = self.net.to_graph_file(path)
+            self.assertTrue(np.array_equal(np.sort(order), np.arange(10)))
+
+            mapped = undNetwork.open(path)
+            self.assertEqual(mapped.N, 10)
+            self.assertTrue(np.array_equal(mapped.values, np.arange(10)[order]))
+            self.assertTrue(np.array_equal(mapped.positions, self.net.positions[order]))
+            self.assertAlmostEqual(mapped.distortion, self.net.distortion, places=5)
+            # Links are not loaded: they can't be read or changed
+            for access in (lambda: len(mapped.links), lambda: mapped.targetSM,
+                           lambda: mapped.has_link(0, 1), lambda: mapped.remove_nodes([0]),
+                           lambda: mapped.add_links([0], [1], [1.0])):
+                self.assertRaises(RuntimeError, access)
+            self.assertEqual(mapped.cMDE(Nsteps=30), 30)
+            positions = mapped.positions.copy()
+            del mapped
+
+            # The run is in the file
+            reopened = undNetwork.open(path, writable=False)
+            self.assertTrue(np.array_equal(reopened.positions, positions))
+            self.assertEqual(reopened.cgraph.get_stats()["steps"], 30)
+            del reopened
+
+    def test_logging(self):
+        # cnets prints its messages unless logging is asked for
+        self.assertIsNone(cnets.set_log_handler(None))
+        use_logging()
+        try:
+            with self.assertLogs("cnets", level="INFO") as logs:
+                self.net.initialize_embedding(dim=2)
+        finally:
+            use_logging(False)
+        self.assertTrue(any("generated network" in line for line in logs.output))
+
+    def test_from_knn(self):
+        points = np.random.uniform(0, 1, size=(50, 2))
+        net = undNetwork.from_sparse(cnets.knn(points, 3))
+        self.assertEqual(net.N, 50)
+        self.assertGreaterEqual(len(net.links), 50 * 3 / 2)
+
+
+class testColumns(unittest.TestCase):
+    def setUp(self):
+        self.link_sparse = [[0, 1, 1.0], [1, 2, 0.5], [2, 1, 0.7], [2, 3, 2.0]]
+
+    def test_columns(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        # (2, 1) is the same link of (1, 2), the first one is kept
+        self.assertEqual(len(net.links), 3)
+        self.assertTrue((net.links.length == np.float32([1.0, 0.5, 2.0])).all())
+        self.assertTrue((net.links.node1.n == [0, 1, 2]).all())
+
+        net.values = [0, 1, 2, 3]
+        self.assertTrue(np.shares_memory(net.nodes.value, net.values))
+
+        # Writes through the objects go to the arrays
+        net.nodes[3].value = 7
+        self.assertEqual(net.values[3], 7)
+        link = net.links[1]
+        link.length = 3.0
+        link.activation = 0.5
+        self.assertEqual(net.links.length[1], 3.0)
+        self.assertEqual(net.links.activation[1], 0.5)
+        self.assertEqual(net.targetM[2, 1], 3.0)
+
+    def test_lazy_objects(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        node = net.nodes[1]
+        self.assertIs(node, net.nodes[1])
+        self.assertEqual(len(node.synapses), 2)
+        self.assertEqual({link.get_child(node).n for link in node.synapses}, {0, 2})
+
+        directed = dirNetwork.from_sparse(self.link_sparse)
+        self.assertEqual(len(directed.links), 4)
+        self.assertEqual(len(directed.nodes[1].synapses), 1)
+        self.assertEqual(directed.linkM.sum(), 4)
+
+    def test_add_link(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        link = net.add_link(net.nodes[3], Node(4), 1.5)
+        self.assertEqual(net.N, 5)
+        self.assertEqual(len(net.links), 4)
+        self.assertIs(net.add_link(Node(4), net.nodes[3], 9.0), link)
+        self.assertEqual(link.length, np.float32(1.5))
+
+    def test_sparse_matrices(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        self.assertEqual(net.linkM.nnz, 6)
+        self.assertTrue(net.linkM[2, 1] and net.linkM[1, 2])
+        self.assertFalse(net.linkM[0, 3])
+        self.assertIn((3, 2), net.linkM)
+        self.assertTrue((net.targetM[[0, 1, 0], [1, 2, 3]] == np.float32([1.0, 0.5, 0.0])).all())
+        self.assertTrue((net.targetM.toarray() == net.targetM.toarray().T).all())
+
+        self.assertEqual(net.link_index(2, 1), 1)
+        self.assertTrue((net.has_link([0, 3, 0], [1, 2, 2]) == [True, True, False]).all())
+        net.add_link(net.nodes[0], net.nodes[2], 1.0)
+        self.assertEqual(net.link_index(2, 0), 3)
+        self.assertEqual(net.linkM.nnz, 8)
+
+        directed = dirNetwork.from_sparse(self.link_sparse)
+        self.assertTrue(directed.linkM[0, 1])
+        self.assertFalse(directed.linkM[1, 0])
+
+    def test_distances(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        net.initialize_embedding(dim=2)
+        positions = net.positions.astype(np.float64)
+        full = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=2)
+        self.assertTrue(np.allclose(net.distanceM, full))
+        blocks = [block for _, block in net.distance_blocks(block_size=3)]
+        self.assertEqual([len(block) for block in blocks], [3, 1])
+        self.assertTrue(np.allclose(np.vstack(blocks), full))
+
+        distanceSM = net.distanceSM
+        self.assertTrue((distanceSM[:, 0] < distanceSM[:, 1]).all())
+        self.assertEqual(len(distanceSM), 3)
+        i, j = distanceSM[:, 0].astype(int), distanceSM[:, 1].astype(int)
+        self.assertTrue(np.allclose(distanceSM[:, 2], full[i, j]))
+
+    def test_update_lengths(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        cnets.set_seed(7)
+        net.initialize_embedding(dim=2)
+        net.targetM  # built before the update, so it is updated in place
+        net.update_lengths([2, 0], [1, 1], [0.2, 1.5])
+
+        self.assertTrue((net.links.length == np.float32([1.5, 0.2, 2.0])).all())
+        self.assertTrue((net.targetSM[:, 2] == np.float32([1.5, 0.2, 2.0])).all())
+        self.assertEqual(net.targetM[1, 0], np.float32(1.5))
+        self.assertEqual(net.targetM[2, 1], np.float32(0.2))
+
+        expected = undNetwork.from_sparse(net.targetSM)
+        expected.initialize_embedding(dim=2)
+        self.assertAlmostEqual(net.cgraph.distortion(), expected.cgraph.distortion(), places=4)
+        cnets.set_seed(0)
+
+        self.assertRaises(ValueError, net.update_lengths, 0, 3, 1.0)
+
+        # targetSM set by hand, in another order and with the ends swapped
+        net = undNetwork.from_sparse(self.link_sparse)
+        net.targetSM = net.targetSM[::-1][:, [1, 0, 2]].copy()
+        net.update_lengths(net.links.i[0], net.links.j[0], 4.0)
+        self.assertEqual(net.targetSM[-1, 2], 4.0)
+        self.assertTrue((net.targetSM[:, 2] == net.links.length[::-1]).all())
+
+    def test_dynamic_network(self):
+        net = undNetwork.from_sparse(self.link_sparse)
+        net.initialize_embedding(dim=2)
+        net.cMDE(step=0.1, neg_step=0.001, Nsteps=50)
+        positions = net.positions.copy()
+        node3, link23 = net.nodes[3], net.links[2]
+
+        self.assertEqual(net.add_links([3, 4, 0], [4, 5, 1], [1.0, 1.0, 3.0]), 2)
+        self.assertEqual(net.N, 6)
+        self.assertTrue((net.positions[:4] == positions).all())
+        self.assertTrue(net.has_link(5, 4))
+        self.assertEqual(len(net.targetSM), 5)
+        self.assertEqual(net.relax([5], Nsteps=10, hops=1), 2)
+        self.assertTrue((net.positions[:4] == positions).all())
+
+        self.assertEqual(net.remove_links([5, 0], [4, 3]), 1)
+        self.assertFalse(net.has_link(4, 5))
+        self.assertEqual(len(net.links), 4)
+
+        net.remove_nodes([1])
+        self.assertEqual(net.N, 5)
+        self.assertEqual(net.positions.shape, (5, 2))
+        self.assertTrue((net.positions[:3] == np.delete(positions, 1, axis=0)).all())
+        # Only 2 - 3 and 3 - 4 are left, renumbered
+        self.assertEqual(len(net.links), 2)
+        self.assertTrue(net.has_link(1, 2) and net.has_link(2, 3))
+        self.assertEqual(node3.n, 2)
+        self.assertEqual(link23._index, 0)
+        self.assertTrue((net.targetSM[:, :2] == [[1, 2], [2, 3]]).all())
+
+    def test_from_adiacence(self):
+        matrix = np.zeros((4, 4))
+        matrix[0, 1] = matrix[1, 0] = 1.0
+        matrix[2, 3] = matrix[3, 2] = 2.0
+        net = undNetwork.from_adiacence(matrix)
+        self.assertEqual(len(net.links), 2)
+        matrix[3, 2] = 1.0
+        with self.assertRaises(ValueError):
+            undNetwork.from_adiacence(matrix)
+        with self.assertRaises(ValueError):
+            undNetwork.from_adiacence(np.eye(3))
+
+
+    def test_from_edges(self):
+        net = undNetwork.from_edges(["b", "a", "c"], ["a", "c", "d"], [1.0, 2.0, 0.5])
+        self.assertEqual(net.N, 4)
+        self.assertEqual(list(net.labels[net.links.i]), ["b", "a", "c"])
+        self.assertEqual(list(net.labels[net.links.j]), ["a", "c", "d"])
+        self.assertTrue((net.labels.index(["d", "b"]) == [3, 1]).all())
+        self.assertRaises(KeyError, net.labels.index, "z")
+
+        # labels that can't be sorted are kept in order of appearance
+        labels, (i, j) = utils.Labels.intern([3, "x"], ["x", (1, 2)])
+        self.assertEqual(list(i), [0, 1])
+        self.assertEqual(list(j), [1, 2])
+        self.assertEqual(labels.index((1, 2)), 2)
+        self.assertIn("x", labels)
+
+        # no labels: nothing is known
+        empty = utils.Labels([])
+        self.assertRaises(KeyError, empty.index, "z")
+        self.assertRaises(KeyError, empty.index, ["z"])
+        self.assertEqual(len(empty.index([])), 0)
+        self.assertNotIn("z", empty)
+
+    def test_from_file(self):
+        rng = np.random.default_rng(1)
+        names = np.array([f"n{k}" for k in range(50)])
+        sources, targets = rng.choice(names, 300), rng.choice(names, 300)
+        keep = sources != targets
+        sources, targets, lengths = sources[keep], targets[keep], rng.uniform(0.5, 2.0, np.count_nonzero(keep))
+        expected = undNetwork.from_edges(sources, targets, lengths.astype(np.float32))
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "edges.tsv")
+            with open(path, "w") as file:
+                file.write("# source\ttarget\tlength\n")
+                file.writelines(f"{s}\t{t}\t{d}\n" for s, t, d in zip(sources, targets, lengths))
+            # chunks much smaller than the file cut lines in half
+            net = undNetwork.from_file(path, delimiter="\t", chunk_size=100)
+            self.assertEqual(list(net.labels.labels), list(expected.labels.labels))
+            self.assertTrue(np.array_equal(net.links.i, expected.links.i))
+            self.assertTrue(np.array_equal(net.links.j, expected.links.j))
+            self.assertTrue(np.allclose(net.links.length, expected.links.length))
+
+            # numeric labels without lengths
+            path = os.path.join(folder, "edges.txt")
+            with open(path, "w") as file:
+                file.write("10 2\n2 7\n\n7 10\n")
+            net = undNetwork.from_file(path)
+            self.assertEqual(list(net.labels.labels), [2, 7, 10])
+            self.assertTrue((net.links.length == 1.0).all())
+
+            path = os.path.join(folder, "edges.ngr")
+            expected.to_file(path)
+            i, j, lengths, N = utils.read_edge_file(path)
+            self.assertIsInstance(i, np.memmap)
+            self.assertEqual(N, expected.N)
+            net = undNetwork.from_file(path)
+            self.assertTrue(np.array_equal(net.links.i, expected.links.i))
+            self.assertTrue(np.array_equal(net.links.length, expected.links.length))
+            # The links are the mapped columns, up to the initialization of cnets
+            self.assertIsInstance(net._i.base, np.memmap)
+            self.assertIsInstance(net._lengths.base, np.memmap)
+            net.initialize_embedding(dim=2)
+            self.assertIsNone(net._targetSM)
+            self.assertEqual(net.cgraph.N_links, len(expected.links))
+            net.update_lengths(net._i[0], net._j[0], 5.0)
+            self.assertEqual(utils.read_edge_file(path)[2][0], expected.links.length[0])
+            del net
+            # cnets reads the mapped columns in place
+            graph = cnets.Graph((i, j, lengths), np.zeros(N), 2)
+            self.assertEqual(graph.N_links, len(expected.links))
+            del i, j, lengths
+
+    def test_matrix_to_sparse(self):
+        matrix = np.zeros((5, 5))
+        matrix[0, 4] = matrix[4, 0] = 1.0
+        matrix[2, 4] = matrix[4, 2] = 3.0
+        sparse = utils.matrix_to_sparse(matrix, block_size=2)
+        # node 1 and 3 have no links and are dropped
+        expected = [[0, 2, 1.0], [1, 2, 3.0], [2, 0, 1.0], [2, 1, 3.0]]
+        self.assertTrue((sparse == expected).all())
+        for empty in (np.zeros((0, 0)), np.zeros((4, 4))):
+            self.assertEqual(utils.matrix_to_sparse(empty).shape, (0, 3))
+
+    def test_sparse_matrix(self):
+        matrix = utils.SparseMatrix([2, 0, 1, 0], [1, 3, 1, 0], [1.0, 2.0, 3.0, 4.0], (3, 4))
+        self.assertTrue((matrix.find([0, 1, 2, 2], [3, 1, 1, 0]) == [1, 2, 3, -1]).all())
+        self.assertEqual(matrix.find(0, 0), 0)
+        # The sorted keys are made once and kept while the values change
+        keys = matrix._sorted_keys()
+        matrix.data[matrix.find([0], [3])] = 5.0
+        self.assertIs(matrix._sorted_keys(), keys)
+        self.assertEqual(matrix[0, 3], 5.0)
+        self.assertTrue((matrix[[2, 1], [1, 0]] == [1.0, 0.0]).all())
+
+
 if __name__ == "__main__":
     unittest.main()